@@ -1,8 +1,13 @@
 import argparse
+import gc
+import hashlib
+import json
 import logging
 import os
 import random
+import resource
 import time
+import traceback
 
 # 配置日志格式和级别，实现实时终端打印
 logging.basicConfig(
@@ -29,7 +34,9 @@ from skyreels_v3.pipelines import (
     SingleShotExtensionPipeline,
     TalkingAvatarPipeline,
 )
+from skyreels_v3.utils import progress
 from skyreels_v3.utils.avatar_preprocess import preprocess_audio
+from skyreels_v3.utils.checkpoint import ClipCheckpoint
 
 
 def maybe_download(path_or_url: str, save_dir: str) -> str:
@@ -107,6 +114,7 @@ def prepare_and_broadcast_inputs(args, local_rank: int):
         if isinstance(ref_imgs, str):
             ref_imgs = [p.strip() for p in ref_imgs.split(",") if p.strip()]
         if isinstance(ref_imgs, list) and (len(ref_imgs) == 0 or isinstance(ref_imgs[0], str)):
+            args.ref_img_paths = list(ref_imgs)   # the manifest records paths, not images
             ref_imgs = [load_image(p) for p in ref_imgs]
         args.ref_imgs = ref_imgs
         assert isinstance(args.ref_imgs, list) and len(args.ref_imgs) > 0, "ref_imgs must be a list of images"
@@ -121,7 +129,8 @@ MODEL_ID_CONFIG = {
     "talking_avatar": "Skywork/SkyReels-V3-A2V-19B",
 }
 
-if __name__ == "__main__":
+
+def build_parser():
     parser = argparse.ArgumentParser(description="SkyReels V3: Multimodal Video Generation Model")
 
     # ==================== Task Selection ====================
@@ -227,11 +236,47 @@ if __name__ == "__main__":
         "Audio duration must be <= 200 seconds. Supports multiple languages.",
     )
 
-    args = parser.parse_args()
+    # ==================== Output ====================
+    parser.add_argument(
+        "--output_path",
+        type=str,
+        default=None,
+        help="Exact path of the final .mp4. Default: result/<task_type>/<seed>_<timestamp>.mp4.",
+    )
+    parser.add_argument(
+        "--manifest_path",
+        type=str,
+        default=None,
+        help="Write a JSON manifest here (final video, audio variant, timings, peak memory, resolved inputs).",
+    )
+    parser.add_argument(
+        "--checkpoint_dir",
+        type=str,
+        default=None,
+        help="[talking_avatar/single_shot_extension] Save each finished clip/roll under this directory "
+        "and resume from it when the same job runs again. Removed after the video is written.",
+    )
 
-    if args.model_id is None:
-        args.model_id = MODEL_ID_CONFIG[args.task_type]
-    # init multi gpu environment
+    # ==================== Batch ====================
+    parser.add_argument(
+        "--batch",
+        type=str,
+        default=None,
+        help="JSONL file with one job per line (task_type, prompt, seed, ref_imgs, input_*, duration, "
+        "resolution, output_path, manifest_path, ...). Jobs are grouped so each pipeline loads once; "
+        "the other command-line options (except --output_path/--manifest_path) are the defaults of every job.",
+    )
+    parser.add_argument(
+        "--batch_results",
+        type=str,
+        default=None,
+        help="[--batch] Where to write one result line per job. Default: <batch>.results.jsonl.",
+    )
+    return parser
+
+
+def init_distributed(args) -> int:
+    """Initialize the USP process group when requested. Returns the local rank."""
     local_rank = 0
     if args.use_usp:
         from xfuser.core.distributed import (
@@ -250,9 +295,13 @@ if __name__ == "__main__":
             ring_degree=1,
             ulysses_degree=dist.get_world_size(),
         )
-    device = f"cuda:{local_rank}"
     assert not(args.use_usp and args.low_vram), "usp mode and low_vram mode cannot be used together"
+    return local_rank
+
 
+def resolve_model_id(args):
+    if args.model_id is None:
+        args.model_id = MODEL_ID_CONFIG[args.task_type]
     # In multi-process inference, only rank0 downloads the model; other ranks receive the resolved path via broadcast.
     if dist.is_available() and dist.is_initialized() and dist.get_world_size() > 1:
         obj_list = [None]
@@ -265,31 +314,21 @@ if __name__ == "__main__":
         args.model_id = download_model(args.model_id)
 
     print(f"args.model_id: {args.model_id}")
+    return args
 
-    assert (args.use_usp and args.seed is not None) or (not args.use_usp), "usp mode need seed"
-    if args.seed is None:
-        random.seed(time.time())
-        args.seed = int(random.randrange(4294967294))
-
-    logging.info(f"input params: {args}")
-
-    args = prepare_and_broadcast_inputs(args, local_rank)
-
-    video_out = None
 
-    # init pipeline
+def load_pipeline(args, local_rank: int):
+    """Build the pipeline for args.task_type (the expensive part: checkpoint load + quantization)."""
+    progress.phase("load")
     if args.task_type == "single_shot_extension":
-        pipe = SingleShotExtensionPipeline(model_path=args.model_id, use_usp=args.use_usp, offload=args.offload, low_vram=args.low_vram)
-        video_out = pipe.extend_video(args.input_video, args.prompt, args.duration, args.seed, resolution=args.resolution)
-    elif args.task_type == "shot_switching_extension":
-        pipe = ShotSwitchingExtensionPipeline(model_path=args.model_id, use_usp=args.use_usp, offload=args.offload, low_vram=args.low_vram)
-        video_out = pipe.extend_video(args.input_video, args.prompt, args.duration, args.seed, resolution=args.resolution)
-    elif args.task_type == "reference_to_video":
-        pipe = ReferenceToVideoPipeline(model_path=args.model_id, use_usp=args.use_usp, offload=args.offload, low_vram=args.low_vram)
-        video_out = pipe.generate_video(args.ref_imgs, args.prompt, args.duration, args.seed, resolution=args.resolution)
-    elif args.task_type == "talking_avatar":
+        return SingleShotExtensionPipeline(model_path=args.model_id, use_usp=args.use_usp, offload=args.offload, low_vram=args.low_vram)
+    if args.task_type == "shot_switching_extension":
+        return ShotSwitchingExtensionPipeline(model_path=args.model_id, use_usp=args.use_usp, offload=args.offload, low_vram=args.low_vram)
+    if args.task_type == "reference_to_video":
+        return ReferenceToVideoPipeline(model_path=args.model_id, use_usp=args.use_usp, offload=args.offload, low_vram=args.low_vram)
+    if args.task_type == "talking_avatar":
         config = WAN_CONFIGS["talking-avatar-19B"]
-        pipe = TalkingAvatarPipeline(
+        return TalkingAvatarPipeline(
             config=config,
             model_path=args.model_id,
             device_id=local_rank,
@@ -298,6 +337,47 @@ if __name__ == "__main__":
             offload=args.offload,
             low_vram=args.low_vram,
         )
+    raise ValueError(f"Invalid task type: {args.task_type}")
+
+
+CHECKPOINT_TASKS = ("talking_avatar", "single_shot_extension")
+
+
+def checkpoint_dir_for(args):
+    """Per-job checkpoint directory under --checkpoint_dir, or None (disabled, single-clip
+    task or USP). Named after everything that changes the frames — task, model, prompt,
+    seed, resolution, duration, low_vram (FP8) and the input files — so only a rerun of
+    the same job picks the checkpoints up. --offload does not change the output."""
+    root = getattr(args, "checkpoint_dir", None)
+    if not root or args.task_type not in CHECKPOINT_TASKS or args.use_usp:
+        return None
+    inputs = {}
+    for name in ("input_video", "input_image", "input_audio"):
+        path = getattr(args, name, None)
+        if isinstance(path, str) and os.path.exists(path):
+            st = os.stat(path)
+            inputs[name] = [os.path.abspath(path), st.st_size, st.st_mtime_ns]
+    key = json.dumps([args.task_type, args.model_id, args.prompt, args.seed, args.resolution,
+                      args.duration, bool(args.low_vram), inputs], sort_keys=True)
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(root, f"{args.task_type}_{args.seed}_{digest}")
+
+
+def clear_checkpoint(args):
+    """Drop the job's clip checkpoints once its video is on disk."""
+    ClipCheckpoint(checkpoint_dir_for(args)).clear()
+
+
+def run_pipeline(pipe, args):
+    """Run one job on an already-loaded pipeline. Returns (video_out, audio_path or None)."""
+    if args.task_type == "single_shot_extension":
+        return pipe.extend_video(args.input_video, args.prompt, args.duration, args.seed, resolution=args.resolution,
+                                 checkpoint_dir=checkpoint_dir_for(args)), None
+    if args.task_type == "shot_switching_extension":
+        return pipe.extend_video(args.input_video, args.prompt, args.duration, args.seed, resolution=args.resolution), None
+    if args.task_type == "reference_to_video":
+        return pipe.generate_video(args.ref_imgs, args.prompt, args.duration, args.seed, resolution=args.resolution), None
+    if args.task_type == "talking_avatar":
         input_data = {
             "prompt": args.prompt,
             "cond_image": args.input_image,
@@ -326,60 +406,363 @@ if __name__ == "__main__":
             "seed": args.seed,
             "sampling_steps": 4,
             "max_frames_num": 5000,
+            "checkpoint_dir": checkpoint_dir_for(args),
         }
         print(f"generate video kwargs: {kwargs}")
-        video_out = pipe.generate(**kwargs)
-    else:
-        raise ValueError(f"Invalid task type: {args.task_type}")
+        return pipe.generate(**kwargs), kwargs["input_data"]["video_audio"]
+    raise ValueError(f"Invalid task type: {args.task_type}")
 
-    save_dir = os.path.join("result", args.task_type)
-    os.makedirs(save_dir, exist_ok=True)
 
-    if local_rank == 0:
+def write_video(args, video_out, audio_path=None):
+    """Write the frames to --output_path (default result/<task_type>/<seed>_<timestamp>.mp4).
+
+    With audio_path, the frames go to a temporary "<name>.silent<ext>" next to the final
+    file and ffmpeg muxes the audio track into the final path; if the mux fails, the silent
+    render is moved to the final path instead. Returns (path of the final file, muxed).
+    """
+    progress.phase("write")
+    final_path = getattr(args, "output_path", None)
+    if final_path:
+        save_dir = os.path.dirname(final_path) or "."
+        # with audio, the silent render is a temporary next to the final file
+        video_out_file = os.path.basename(final_path)
+        if audio_path is not None:
+            # never the final name itself: ffmpeg would read and overwrite the same file
+            root, ext = os.path.splitext(video_out_file)
+            video_out_file = f"{root}.silent{ext or '.mp4'}"
+    else:
+        save_dir = os.path.join("result", args.task_type)
         current_time = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime())
         video_out_file = f"{args.seed}_{current_time}.mp4"
-        output_path = os.path.join(save_dir, video_out_file)
-        fps = 25 if args.task_type == "talking_avatar" else 24
-        imageio.mimwrite(
-            output_path,
-            video_out,
-            fps=fps,
-            quality=8,
-            output_params=["-loglevel", "error"],
+    os.makedirs(save_dir, exist_ok=True)
+    output_path = os.path.join(save_dir, video_out_file)
+    fps = 25 if args.task_type == "talking_avatar" else 24
+    imageio.mimwrite(
+        output_path,
+        video_out,
+        fps=fps,
+        quality=8,
+        output_params=["-loglevel", "error"],
+    )
+    if audio_path is None:
+        return output_path, False
+
+    if final_path:
+        video_with_audio_path = final_path
+    else:
+        video_with_audio_path = os.path.join(save_dir, video_out_file.replace(".mp4", "_with_audio.mp4"))
+    video_in = os.path.abspath(output_path)
+    audio_in = os.path.abspath(audio_path)
+    video_out_with_audio = os.path.abspath(video_with_audio_path)
+    print(f"video_in: {video_in}, audio_in: {audio_in}, video_out_with_audio: {video_out_with_audio}")
+    # fmt: off
+    cmd = [
+        'ffmpeg',
+        '-y',
+        '-i', f'"{video_in}"',
+        '-i', f'"{audio_in}"',
+        '-map', '0:v',
+        '-map', '1:a',
+        '-c:v', 'copy',
+        '-shortest',
+    ]
+    # fmt: on
+    if not os.path.splitext(video_out_with_audio)[1]:
+        cmd += ["-f", "mp4"]  # no extension to infer the container from
+    cmd.append(f'"{video_out_with_audio}"')
+
+    try:
+        subprocess.run(
+            " ".join(cmd),
+            shell=True,
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
         )
-        if args.task_type == "talking_avatar":
-            video_with_audio_path = os.path.join(save_dir, video_out_file.replace(".mp4", "_with_audio.mp4"))
-            audio_path = kwargs["input_data"]["video_audio"]
-            video_in = os.path.abspath(output_path)
-            audio_in = os.path.abspath(audio_path)
-            video_out_with_audio = os.path.abspath(video_with_audio_path)
-            print(f"video_in: {video_in}, audio_in: {audio_in}, video_out_with_audio: {video_out_with_audio}")
-            # fmt: off
-            cmd = [
-                'ffmpeg',
-                '-y',
-                '-i', f'"{video_in}"',
-                '-i', f'"{audio_in}"',
-                '-map', '0:v',
-                '-map', '1:a',
-                '-c:v', 'copy',
-                '-shortest',
-                f'"{video_out_with_audio}"'
-            ]
-            # fmt: on
+        print(f"Video with audio generated successfully: {video_with_audio_path}")
+        os.remove(video_in) # remove the original video
+        return video_with_audio_path, True
+    except subprocess.CalledProcessError as e:
+        print(f"ffmpeg failed (exit={e.returncode}). Output:\n{e.stdout}")
+        if final_path:
+            os.replace(output_path, final_path)
+            return final_path, False
+        return output_path, False
+
+
+def build_manifest(args, video_path, audio_path=None, muxed=False, timings=None):
+    """Manifest dict for a finished job: final video, audio variant, timings, peak memory and
+    resolved inputs."""
+    peak = {}
+    gpu = None
+    if torch.cuda.is_available():
+        peak = {
+            "allocated_gb": round(torch.cuda.max_memory_allocated() / 1024**3, 2),
+            "reserved_gb": round(torch.cuda.max_memory_reserved() / 1024**3, 2),
+        }
+        gpu = torch.cuda.get_device_name(torch.cuda.current_device())
+    # ru_maxrss vem em KiB no Linux
+    peak["host_rss_gb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024**2, 2)
+    return {
+        "video": video_path,
+        "video_with_audio": video_path if muxed else None,
+        "audio": audio_path,
+        "task_type": args.task_type,
+        "seed": args.seed,
+        "timings": timings or {},
+        "peak_memory": peak,
+        "gpu": gpu,
+        "inputs": {
+            "model_id": args.model_id,
+            "prompt": args.prompt,
+            "resolution": args.resolution,
+            "duration": args.duration,
+            "offload": bool(args.offload),
+            "low_vram": bool(args.low_vram),
+            "input_video": args.input_video if args.task_type.endswith("_extension") else None,
+            "ref_imgs": getattr(args, "ref_img_paths", None) if args.task_type == "reference_to_video" else None,
+            "input_image": args.input_image if args.task_type == "talking_avatar" else None,
+            "input_audio": args.input_audio if args.task_type == "talking_avatar" else None,
+        },
+        "finished_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def write_manifest(args, video_path, audio_path=None, muxed=False, timings=None):
+    """Write the --manifest_path JSON (no-op without it). Written to a temp file and renamed,
+    so a reader never sees a partial manifest."""
+    manifest_path = getattr(args, "manifest_path", None)
+    if not manifest_path:
+        return None
+    manifest = build_manifest(args, video_path, audio_path, muxed, timings)
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    tmp = manifest_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, manifest_path)
+    return manifest_path
+
+
+def finalize_args(args, local_rank: int):
+    """Seed + input resolution shared by the CLI and the persistent worker."""
+    assert (args.use_usp and args.seed is not None) or (not args.use_usp), "usp mode need seed"
+    if args.seed is None:
+        random.seed(time.time())
+        args.seed = int(random.randrange(4294967294))
+
+    logging.info(f"input params: {args}")
+
+    return prepare_and_broadcast_inputs(args, local_rank)
+
+
+# Fields a batch record may not set: they describe the batch run, not a job.
+BATCH_RESERVED_FIELDS = ("batch", "batch_results", "use_usp")
+BATCH_FLAG_FIELDS = ("offload", "low_vram")
+# Per-job destinations: never taken from the command line, or every job would share them.
+BATCH_PER_JOB_FIELDS = ("output_path", "manifest_path")
+
+
+def read_batch(path):
+    """[(line number, record or None, error or None)] for each non-empty line of the JSONL."""
+    jobs = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("a job must be a JSON object")
+                jobs.append((n, record, None))
+            except ValueError as e:
+                jobs.append((n, None, f"invalid JSON: {e}"))
+    return jobs
+
+
+def batch_job_args(cli_args, record):
+    """Namespace for one batch record: the record's fields parsed by the same parser as the
+    command line, with the command line as defaults (output_path/manifest_path excepted: they
+    are per job). ref_imgs may be a list; offload/low_vram take JSON true/false, so a job can
+    also turn a command-line flag off."""
+    argv = []
+    for key, value in record.items():
+        if key == "id" or value is None or key in BATCH_FLAG_FIELDS:
+            continue
+        if key in BATCH_RESERVED_FIELDS:
+            raise ValueError(f"'{key}' cannot be set per job")
+        if isinstance(value, list):
+            value = ",".join(str(v) for v in value)
+        argv.append(f"--{key}={value}")   # "=": prompts may start with "-"
+    parser = build_parser()
+    parser.set_defaults(**{k: v for k, v in vars(cli_args).items() if k not in BATCH_PER_JOB_FIELDS})
+
+    def reject(message):
+        raise ValueError(message)
+
+    parser.error = reject   # a bad job is reported, not a SystemExit
+    args = parser.parse_args(argv)
+    for key in BATCH_FLAG_FIELDS:
+        if record.get(key) is None:
+            continue
+        if not isinstance(record[key], bool):
+            raise ValueError(f"'{key}' must be true or false, got {record[key]!r}")
+        setattr(args, key, record[key])
+    if args.task_type is None:
+        raise ValueError("task_type is required")
+    return args
+
 
+def pipeline_key(args):
+    """Jobs with the same key share one loaded pipeline (same key as the persistent worker)."""
+    return (args.model_id or MODEL_ID_CONFIG[args.task_type], args.task_type,
+            bool(args.offload), bool(args.low_vram))
+
+
+def run_batch_job(pipe, args, model_path, default_output, load_s):
+    """Run one batch job on a loaded pipeline. Returns its manifest dict."""
+    progress.reset()
+    t0 = time.time()
+    if torch.cuda.is_available():
+        torch.cuda.reset_peak_memory_stats()
+    args.model_id = model_path
+    args = finalize_args(args, 0)
+    if not args.output_path:
+        args.output_path = default_output.format(task_type=args.task_type, seed=args.seed)
+    t_generate = time.time()
+    video_out, audio_path = run_pipeline(pipe, args)
+    t_write = time.time()
+    final_path, muxed = write_video(args, video_out, audio_path)
+    t_end = time.time()
+    timings = {
+        "prepare_s": round(t_generate - t0, 2),
+        "load_s": round(load_s, 2),
+        "generate_s": round(t_write - t_generate, 2),
+        "write_s": round(t_end - t_write, 2),
+        "total_s": round(t_end - t0 + load_s, 2),
+        "pipeline_loaded": load_s > 0,
+    }
+    write_manifest(args, final_path, audio_path, muxed, timings)
+    manifest = build_manifest(args, final_path, audio_path, muxed, timings)
+    clear_checkpoint(args)
+    progress.phase("done", video=final_path)
+    return manifest
+
+
+def run_batch(cli_args):
+    """--batch: run every job of the JSONL, loading each pipeline once. Jobs are grouped by
+    pipeline (model family, task, offload, low_vram) and the groups of one family run back
+    to back; within a group the file order is kept. Every job writes its own video (and
+    manifest_path, if given) and one line to the results file; a failing job is recorded
+    and the batch goes on. Returns the number of failed jobs."""
+    results_path = cli_args.batch_results or os.path.splitext(cli_args.batch)[0] + ".results.jsonl"
+    stem = os.path.splitext(os.path.basename(cli_args.batch))[0]
+    os.makedirs(os.path.dirname(results_path) or ".", exist_ok=True)
+    groups = {}
+    failed = 0
+
+    with open(results_path, "w", encoding="utf-8") as results:
+        def record_result(n, record, **fields):
+            line = {"job": n, "id": (record or {}).get("id"), **fields}
+            results.write(json.dumps(line, ensure_ascii=False) + "\n")
+            results.flush()
+
+        def record_error(n, record, error, task_type=None):
+            nonlocal failed
+            failed += 1
+            print(f"batch: job {n} failed: {error}")
+            record_result(n, record, status="error", task_type=task_type, error=error)
+
+        jobs = read_batch(cli_args.batch)
+        for n, record, error in jobs:
+            if error:
+                record_error(n, record, error)
+                continue
             try:
-                subprocess.run(
-                    " ".join(cmd),
-                    shell=True,
-                    check=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                )
-                print(f"Video with audio generated successfully: {video_with_audio_path}")
-                os.remove(video_in) # remove the original video
-            except subprocess.CalledProcessError as e:
-                print(f"ffmpeg failed (exit={e.returncode}). Output:\n{e.stdout}")
+                args = batch_job_args(cli_args, record)
+            except ValueError as e:
+                record_error(n, record, str(e), record.get("task_type"))
+                continue
+            groups.setdefault(pipeline_key(args), []).append((n, record, args))
+
+        family_order = {}
+        for key in groups:
+            family_order.setdefault(key[0], len(family_order))
+        ordered = sorted(groups, key=lambda k: family_order[k[0]])
+        print(f"batch: {len(jobs)} job(s), {len(ordered)} pipeline(s) to load -> {results_path}")
+
+        for key in ordered:
+            group = groups[key]
+            t_load = time.time()
+            try:
+                first = group[0][2]
+                model_path = resolve_model_id(first).model_id
+                pipe = load_pipeline(first, 0)
+            except Exception as e:
+                traceback.print_exc()
+                for n, record, args in group:
+                    record_error(n, record, f"pipeline load failed: {type(e).__name__}: {e}", args.task_type)
+                gc.collect()
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+                continue
+            load_s = time.time() - t_load
+            for n, record, args in group:
+                default_output = os.path.join("result", "{task_type}", f"{stem}_{n:04d}_{{seed}}.mp4")
+                try:
+                    manifest = run_batch_job(pipe, args, model_path, default_output, load_s)
+                    record_result(n, record, status="done", **manifest)
+                except Exception as e:
+                    traceback.print_exc()
+                    record_error(n, record, f"{type(e).__name__}: {e}", args.task_type)
+                    gc.collect()
+                    if torch.cuda.is_available():
+                        torch.cuda.empty_cache()
+                load_s = 0.0
+            del pipe
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    print(f"batch: {len(jobs) - failed}/{len(jobs)} job(s) done, {failed} failed -> {results_path}")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.batch:
+        if args.use_usp:
+            parser.error("--batch does not support --use_usp (run one torchrun per job)")
+        if args.output_path or args.manifest_path:
+            parser.error("--output_path/--manifest_path are per job with --batch: set them in the JSONL")
+        raise SystemExit(1 if run_batch(args) else 0)
+
+    # init multi gpu environment
+    progress.reset()
+    t_start = time.time()
+    local_rank = init_distributed(args)
+    args = resolve_model_id(args)
+    args = finalize_args(args, local_rank)
+
+    # init pipeline
+    t_load = time.time()
+    pipe = load_pipeline(args, local_rank)
+    t_generate = time.time()
+    video_out, audio_path = run_pipeline(pipe, args)
+
+    if local_rank == 0:
+        t_write = time.time()
+        final_path, muxed = write_video(args, video_out, audio_path)
+        t_end = time.time()
+        write_manifest(args, final_path, audio_path, muxed, timings={
+            "prepare_s": round(t_load - t_start, 2),
+            "load_s": round(t_generate - t_load, 2),
+            "generate_s": round(t_write - t_generate, 2),
+            "write_s": round(t_end - t_write, 2),
+            "total_s": round(t_end - t_start, 2),
+        })
+        clear_checkpoint(args)
+        progress.phase("done", video=final_path)
 
     if dist.is_available() and dist.is_initialized():
         dist.destroy_process_group()
@@ -0,0 +1,305 @@
+"""
+Persistent SkyReels V3 worker: keeps pipelines resident on the GPU between jobs.
+
+`generate_video.py` pays the full checkpoint load (plus `quantize_` under --low_vram)
+for every scene. This process loads each pipeline once and then serves jobs over a
+Unix socket, so consecutive scenes of the same task only pay for denoising.
+
+Usage:
+    python generate_worker.py --socket /tmp/skyreels_worker.sock [--max_resident 1]
+
+Protocol (one job per connection, newline-delimited JSON):
+    client -> {"args": ["--task_type", "reference_to_video", "--prompt", "...", ...],
+               "env": {"PYTORCH_CUDA_ALLOC_CONF": "expandable_segments:True"}}   (env optional)
+    worker -> {"log": "..."}                       (zero or more, stdout/stderr/logging)
+    worker -> {"progress": {"phase": ..., ...}}    (skyreels_v3.utils.progress events)
+    worker -> {"result": {"video": "result/...mp4", ...}}  or  {"error": "..."}
+
+`args` is the same argv accepted by generate_video.py, so the web UI can send the
+command it would otherwise spawn. `env` carries the extra environment the spawned
+process would get; it is applied for the duration of the job (see job_env).
+--use_usp is not supported here (use torchrun + generate_video.py for multi-GPU
+sequence parallel runs).
+"""
+import argparse
+import gc
+import io
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager, redirect_stderr, redirect_stdout
+
+import torch
+
+from generate_video import (
+    build_parser,
+    clear_checkpoint,
+    finalize_args,
+    load_pipeline,
+    resolve_model_id,
+    run_pipeline,
+    write_manifest,
+    write_video,
+)
+from skyreels_v3.utils import progress
+
+DEFAULT_SOCKET = os.environ.get("SKYREELS_WORKER_SOCKET", "/tmp/skyreels_worker.sock")
+
+
+class _ConnWriter(io.TextIOBase):
+    """File-like object that forwards complete lines to the client as {"log": ...}.
+
+    tqdm redraws with carriage returns, so both '\\r' and '\\n' end a line.
+    A dead client never interrupts the job: send errors just disable forwarding.
+    """
+
+    def __init__(self, conn, echo=None):
+        self.conn = conn
+        self.echo = echo
+        self.buf = ""
+        self.alive = True
+
+    def write(self, s):
+        if self.echo is not None:
+            self.echo.write(s)
+        self.buf += s
+        while True:
+            cut = min((i for i in (self.buf.find("\n"), self.buf.find("\r")) if i != -1), default=-1)
+            if cut == -1:
+                break
+            line, self.buf = self.buf[:cut], self.buf[cut + 1 :]
+            if line.strip():
+                self.send({"log": line})
+        return len(s)
+
+    def flush(self):
+        if self.echo is not None:
+            self.echo.flush()
+
+    def send(self, msg):
+        if not self.alive:
+            return
+        try:
+            self.conn.sendall((json.dumps(msg, ensure_ascii=False) + "\n").encode("utf-8"))
+        except OSError:
+            self.alive = False
+
+
+class _ConnLogHandler(logging.Handler):
+    def __init__(self, writer):
+        super().__init__()
+        self.writer = writer
+
+    def emit(self, record):
+        try:
+            self.writer.send({"log": self.format(record)})
+        except Exception:
+            pass
+
+
+class PipelineCache:
+    """LRU of loaded pipelines keyed by (task_type, model_id, offload, low_vram).
+
+    14B and 19B checkpoints rarely fit side by side, so by default only one pipeline
+    stays resident; loading a different one evicts the least recently used.
+    """
+
+    def __init__(self, max_resident: int = 1):
+        self.max_resident = max(1, max_resident)
+        self.pipes = {}  # key -> pipeline, insertion order = LRU order
+
+    def get(self, args):
+        key = (args.task_type, args.model_id, bool(args.offload), bool(args.low_vram))
+        if key in self.pipes:
+            self.pipes[key] = self.pipes.pop(key)
+            logging.info(f"worker: reusing resident pipeline {key}")
+            return self.pipes[key], False
+        while len(self.pipes) >= self.max_resident:
+            old_key = next(iter(self.pipes))
+            logging.info(f"worker: evicting pipeline {old_key}")
+            del self.pipes[old_key]
+            gc.collect()
+            torch.cuda.empty_cache()
+        logging.info(f"worker: loading pipeline {key}")
+        self.pipes[key] = load_pipeline(args, 0)
+        return self.pipes[key], True
+
+    def keys(self):
+        return [list(k) for k in self.pipes]
+
+
+def _read_request(conn):
+    data = b""
+    while b"\n" not in data:
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    line = data.split(b"\n", 1)[0]
+    return json.loads(line.decode("utf-8")) if line.strip() else {}
+
+
+@contextmanager
+def job_env(env):
+    """Apply a job's extra environment variables, restoring the old values afterwards.
+
+    CUDA_VISIBLE_DEVICES cannot change once CUDA is initialized, so a job asking for
+    other devices than this worker's is refused. PYTORCH_CUDA_ALLOC_CONF is only read
+    when the allocator starts; in a running worker it is pushed to the allocator
+    directly. os.environ is process-global, which is fine because jobs run one at a
+    time under gpu_lock.
+    """
+    env = {str(k): str(v) for k, v in (env or {}).items()}
+    devices = env.pop("CUDA_VISIBLE_DEVICES", None)
+    if devices is not None and devices != os.environ.get("CUDA_VISIBLE_DEVICES"):
+        raise ValueError(
+            f"job asks for CUDA_VISIBLE_DEVICES={devices}, this worker runs with "
+            f"{os.environ.get('CUDA_VISIBLE_DEVICES')}"
+        )
+    old = {k: os.environ.get(k) for k in env}
+    os.environ.update(env)
+    alloc_conf = env.get("PYTORCH_CUDA_ALLOC_CONF")
+    if alloc_conf is not None and alloc_conf != old["PYTORCH_CUDA_ALLOC_CONF"]:
+        _set_allocator_settings(alloc_conf)
+    try:
+        yield
+    finally:
+        for k, v in old.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+        if alloc_conf is not None and alloc_conf != old["PYTORCH_CUDA_ALLOC_CONF"]:
+            _set_allocator_settings(old["PYTORCH_CUDA_ALLOC_CONF"] or "expandable_segments:False")
+
+
+def _set_allocator_settings(conf):
+    setter = getattr(torch.cuda.memory, "_set_allocator_settings", None)
+    if setter is None:
+        raise ValueError(f"this torch cannot change PYTORCH_CUDA_ALLOC_CONF at runtime ({conf})")
+    setter(conf)
+
+
+def handle_job(conn, cache: PipelineCache, gpu_lock: threading.Lock):
+    writer = _ConnWriter(conn, echo=sys.__stdout__)
+    try:
+        request = _read_request(conn)
+    except (OSError, ValueError) as e:
+        writer.send({"error": f"bad request: {e}"})
+        return
+    if not request:
+        # bare connect + close: availability probe
+        return
+    if request.get("ping"):
+        writer.send({"result": {
+            "pong": True,
+            "busy": gpu_lock.locked(),
+            "resident": cache.keys(),
+            # the web UI only sends a pool worker's jobs here when these match its GPUs
+            "devices": os.environ.get("CUDA_VISIBLE_DEVICES"),
+        }})
+        return
+
+    # One job on the GPU at a time; other clients wait here, not in the listen backlog.
+    # This also makes the process-global redirect_stdout/redirect_stderr and job_env
+    # below safe: only the job holding gpu_lock writes to the redirected streams.
+    with gpu_lock:
+        handler = _ConnLogHandler(writer)
+        handler.setFormatter(logging.Formatter("%(asctime)s - skyreels_v3 - %(levelname)s - %(message)s"))
+        root = logging.getLogger()
+        root.addHandler(handler)
+        progress.reset()
+        progress.set_sink(lambda event: writer.send({"progress": event}))
+        try:
+            args = build_parser().parse_args(request.get("args", []))
+            if args.use_usp:
+                raise ValueError("--use_usp is not supported by the persistent worker")
+
+            t0 = time.time()
+            torch.cuda.reset_peak_memory_stats()
+            with job_env(request.get("env")), redirect_stdout(writer), redirect_stderr(writer):
+                args = resolve_model_id(args)
+                args = finalize_args(args, 0)
+                t_prepared = time.time()
+                pipe, loaded = cache.get(args)
+                t_load = time.time()
+                video_out, audio_path = run_pipeline(pipe, args)
+                t_write = time.time()
+                video_path, muxed = write_video(args, video_out, audio_path)
+                t_end = time.time()
+                write_manifest(args, video_path, audio_path, muxed, timings={
+                    "prepare_s": round(t_prepared - t0, 2),
+                    "load_s": round(t_load - t_prepared, 2),
+                    "generate_s": round(t_write - t_load, 2),
+                    "write_s": round(t_end - t_write, 2),
+                    "total_s": round(t_end - t0, 2),
+                    "pipeline_loaded": loaded,
+                })
+                clear_checkpoint(args)
+            progress.phase("done", video=video_path)
+            writer.send({
+                "result": {
+                    "video": video_path,
+                    "task_type": args.task_type,
+                    "seed": args.seed,
+                    "pipeline_loaded": loaded,
+                    "load_s": round(t_load - t0, 2),
+                    "total_s": round(time.time() - t0, 2),
+                }
+            })
+        except SystemExit:
+            # argparse.error() exits; report it instead of killing the worker
+            writer.send({"error": "invalid generate_video.py arguments"})
+        except Exception as e:
+            traceback.print_exc()
+            writer.send({"error": f"{type(e).__name__}: {e}"})
+            gc.collect()
+            torch.cuda.empty_cache()
+        finally:
+            progress.set_sink(None)
+            root.removeHandler(handler)
+
+
+def _serve_conn(conn, cache, gpu_lock):
+    with conn:
+        handle_job(conn, cache, gpu_lock)
+
+
+def serve(socket_path: str, max_resident: int):
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    cache = PipelineCache(max_resident=max_resident)
+    gpu_lock = threading.Lock()
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    os.chmod(socket_path, 0o660)
+    server.listen(16)
+    logging.info(f"worker: listening on {socket_path} (max_resident={max_resident})")
+    try:
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=_serve_conn, args=(conn, cache, gpu_lock), daemon=True).start()
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SkyReels V3 persistent generation worker")
+    parser.add_argument("--socket", type=str, default=DEFAULT_SOCKET, help="Unix socket path to listen on.")
+    parser.add_argument(
+        "--max_resident",
+        type=int,
+        default=1,
+        help="Maximum number of pipelines kept loaded at the same time (LRU eviction).",
+    )
+    cli = parser.parse_args()
+    # generate_video.py writes to ./result and ./processed_audio — same cwd as the CLI
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    serve(cli.socket, cli.max_resident)
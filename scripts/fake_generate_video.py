@@ -0,0 +1,104 @@
+"""
+Gerador falso com a mesma interface de linha de comando do generate_video.py.
+
+Serve pra testar a Web UI (pool de workers, filas, webhooks) numa máquina sem GPU:
+imprime uma barra no formato do tqdm, emite os eventos de progresso
+(skyreels_v3.utils.progress) e grava um mp4 em result/<task_type>/<seed>_<timestamp>.mp4,
+igual ao gerador de verdade.
+
+Uso:
+    SKYREELS_GENERATOR_CMD="python scripts/fake_generate_video.py" \\
+    SKYREELS_GPU_WORKERS="0;1" python webui/app.py
+
+Variáveis opcionais:
+    FAKE_STEP_S   segundos por passo (padrão 0.5)
+    FAKE_FAIL     "1" faz o job terminar com erro
+    FAKE_FAIL_SEEDS  seeds separadas por vírgula que terminam com erro (ex.: "3,7")
+    FAKE_PEAK_GB  pico de VRAM (reserved_gb) informado no manifest
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from skyreels_v3.utils import progress  # noqa: E402
+
+STEPS = 8
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--task_type", type=str, default="reference_to_video")
+    parser.add_argument("--prompt", type=str, default="")
+    parser.add_argument("--resolution", type=str, default="540P")
+    parser.add_argument("--duration", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output_path", type=str, default=None)
+    parser.add_argument("--manifest_path", type=str, default=None)
+    # Demais flags do generate_video.py (--offload, --input_video, ...) são ignoradas
+    args, _ = parser.parse_known_args()
+
+    progress.reset()
+    t0 = time.time()
+    progress.phase("load")
+    devices = os.environ.get("CUDA_VISIBLE_DEVICES", "<não definido>")
+    print(f"fake generator: task={args.task_type} seed={args.seed} CUDA_VISIBLE_DEVICES={devices}", flush=True)
+
+    step_s = float(os.environ.get("FAKE_STEP_S", "0.5"))
+    progress.phase("text_encode")
+    for i in progress.track(range(1, STEPS + 1)):
+        time.sleep(step_s)
+        pct = int(i * 100 / STEPS)
+        print(f"{pct:3d}%|{'█' * i}{' ' * (STEPS - i)}| {i}/{STEPS} [00:0{i}<00:00, {step_s:.2f}s/it]", flush=True)
+
+    fail_seeds = {x.strip() for x in os.environ.get("FAKE_FAIL_SEEDS", "").split(",") if x.strip()}
+    if os.environ.get("FAKE_FAIL") == "1" or str(args.seed) in fail_seeds:
+        print("fake generator: FAKE_FAIL=1, saindo com erro", file=sys.stderr, flush=True)
+        sys.exit(1)
+
+    progress.phase("write")
+    if args.output_path:
+        out = Path(args.output_path)
+        out = out if out.is_absolute() else ROOT / out
+    else:
+        out = ROOT / "result" / args.task_type / f"{args.seed}_{time.strftime('%Y%m%d_%H%M%S')}.mp4"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    if shutil.which("ffmpeg"):
+        subprocess.run(
+            ["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi",
+             "-i", f"testsrc=duration={args.duration}:size=320x240:rate=24",
+             "-pix_fmt", "yuv420p", str(out)],
+            check=False,
+        )
+    if not out.exists():
+        out.write_bytes(b"")  # sem ffmpeg: arquivo vazio basta pro fluxo da UI
+    print(f"fake generator: saved {out.relative_to(ROOT)}", flush=True)
+    if args.manifest_path:
+        manifest = {
+            "video": str(out.relative_to(ROOT)),
+            "video_with_audio": None,
+            "audio": None,
+            "task_type": args.task_type,
+            "seed": args.seed,
+            "timings": {"total_s": round(time.time() - t0, 2)},
+            "peak_memory": ({"allocated_gb": float(os.environ["FAKE_PEAK_GB"]) * 0.9,
+                             "reserved_gb": float(os.environ["FAKE_PEAK_GB"])}
+                            if os.environ.get("FAKE_PEAK_GB") else {}),
+            "inputs": {"prompt": args.prompt, "resolution": args.resolution, "duration": args.duration},
+            "finished_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        Path(args.manifest_path).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.manifest_path).write_text(json.dumps(manifest, indent=2))
+    progress.phase("done", video=str(out.relative_to(ROOT)))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,11 +6,20 @@ Uso:
     python scripts/generate_audio_elevenlabs.py
 
 Configure as variáveis ELEVENLABS_API_KEY e VOICES antes de rodar.
+
+Falas já sintetizadas (mesma voz, modelo, configurações e texto) saem do cache
+compartilhado com a Web UI em .cache/assets/ (webui/asset_cache.py), sem nova
+chamada à API. Teto do cache: SKYREELS_ASSET_CACHE_MB (padrão 2048).
 """
 
 import os
+import sys
 from pathlib import Path
 
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT / "webui"))
+from asset_cache import AssetCache, cache_key  # noqa: E402
+
 # ─────────────────────────────────────────────
 #  CONFIGURAÇÃO — preencha antes de rodar
 # ─────────────────────────────────────────────
@@ -28,6 +37,7 @@ VOICES = {
 
 # Modelo de voz — eleven_multilingual_v2 é o melhor para português
 MODEL = "eleven_multilingual_v2"
+OUTPUT_FORMAT = "mp3_44100_128"
 
 # Configurações de voz (opcionais — ajuste por personagem se quiser)
 VOICE_SETTINGS = {
@@ -111,13 +121,16 @@ def main():
     from elevenlabs.types import VoiceSettings
 
     client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
+    cache = AssetCache(ROOT / ".cache" / "assets",
+                       int(os.environ.get("SKYREELS_ASSET_CACHE_MB", "2048")) * 1024 * 1024)
 
-    out_dir = Path(__file__).parent.parent / "uploads" / "audio"
+    out_dir = ROOT / "uploads" / "audio"
     out_dir.mkdir(parents=True, exist_ok=True)
 
     total = len(LINES)
     ok = 0
     skip = 0
+    cached = 0
 
     for i, (scene, char, num, text) in enumerate(LINES, 1):
         filename = out_dir / f"{scene}_{char}_{num}.mp3"
@@ -132,6 +145,14 @@ def main():
             print(f"[{i:02d}/{total}] ERRO  {char}: voice ID não configurado")
             continue
 
+        key = cache_key("elevenlabs", MODEL, voice_id,
+                        settings={**VOICE_SETTINGS, "format": OUTPUT_FORMAT}, text=text)
+        if cache.fetch(key, filename) is not None:
+            print(f"[{i:02d}/{total}] CACHE {filename.name}")
+            ok += 1
+            cached += 1
+            continue
+
         print(f"[{i:02d}/{total}] GEN   {filename.name}  → \"{text}\"")
 
         try:
@@ -140,17 +161,15 @@ def main():
                 text=text,
                 model_id=MODEL,
                 voice_settings=VoiceSettings(**VOICE_SETTINGS),
-                output_format="mp3_44100_128",
+                output_format=OUTPUT_FORMAT,
             )
-            with open(filename, "wb") as f:
-                for chunk in audio:
-                    f.write(chunk)
+            cache.store(key, b"".join(audio), filename)
             ok += 1
             print(f"           salvo: {filename}")
         except Exception as e:
             print(f"           FALHA: {e}")
 
-    print(f"\nPronto: {ok} gerados, {skip} pulados, {total - ok - skip} com erro.")
+    print(f"\nPronto: {ok} gerados ({cached} do cache), {skip} pulados, {total - ok - skip} com erro.")
     print(f"Arquivos em: {out_dir}")
 
 
@@ -24,6 +24,7 @@ from torchvision.transforms import functional as F
 from transformers import AutoTokenizer, UMT5EncoderModel
 
 from skyreels_v3.modules.reference_to_video.transformer import SkyReelsA2WanI2v3DModel
+from skyreels_v3.utils import progress
 
 if is_torch_xla_available():
     import torch_xla.core.xla_model as xm
@@ -491,6 +492,7 @@ class WanSkyReelsA2WanT2VPipeline(DiffusionPipeline, WanLoraLoaderMixin):
             batch_size = prompt_embeds.shape[0]
 
         # 3. Encode prompts
+        progress.phase("text_encode")
         prompt_embeds, negative_prompt_embeds = self.encode_prompt(
             prompt=prompt,
             negative_prompt=negative_prompt,
@@ -519,6 +521,7 @@ class WanSkyReelsA2WanT2VPipeline(DiffusionPipeline, WanLoraLoaderMixin):
 
         # 5. Prepare latents
         num_channels_latents = self.vae.config.z_dim
+        progress.phase("vae_encode")
         latents, condition = self.prepare_latents(
             ref_imgs,
             batch_size * num_videos_per_prompt,
@@ -615,6 +618,7 @@ class WanSkyReelsA2WanT2VPipeline(DiffusionPipeline, WanLoraLoaderMixin):
                     (i + 1) > num_warmup_steps and (i + 1) % self.scheduler.order == 0
                 ):
                     progress_bar.update()
+                    progress.emit("denoise", step=i + 1, total=len(timesteps))
 
                 if XLA_AVAILABLE:
                     xm.mark_step()
@@ -641,6 +645,7 @@ class WanSkyReelsA2WanT2VPipeline(DiffusionPipeline, WanLoraLoaderMixin):
                 1, self.vae.config.z_dim, 1, 1, 1
             ).to(latents.device, latents.dtype)
             latents = latents / latents_std + latents_mean
+            progress.phase("decode")
             video = self.vae.decode(latents, return_dict=False)[0]
             video = self.video_processor.postprocess_video(
                 video, output_type=output_type
@@ -11,6 +11,7 @@ from tqdm import tqdm
 from ..config import SHOT_NUM_CONDITION_FRAMES_MAP
 from ..modules import get_text_encoder, get_transformer, get_vae
 from ..scheduler.fm_solvers_unipc import FlowUniPCMultistepScheduler
+from ..utils import progress
 from ..utils.util import get_video_info
 
 
@@ -110,6 +111,7 @@ class ShotSwitchingExtensionPipeline:
             raw_video, num_condition_frames, resolution
         )
         prefix_video = prefix_video.to(self.device)
+        progress.phase("vae_encode")
         prefix_video = self.vae.encode(prefix_video)
         video_frames = self.__call__(
             prompt=prompt,
@@ -157,6 +159,7 @@ class ShotSwitchingExtensionPipeline:
             height // self.vae_stride[1],
             width // self.vae_stride[2],
         )
+        progress.phase("text_encode")
         context = self.text_encoder.encode(prompt).to(self.device)
         context_null = (
             self.text_encoder.encode(negative_prompt).to(self.device)
@@ -195,7 +198,7 @@ class ShotSwitchingExtensionPipeline:
             )
             timesteps = self.scheduler.timesteps
 
-            for _, t in enumerate(tqdm(timesteps)):
+            for _, t in enumerate(progress.track(tqdm(timesteps))):
                 latent_model_input = torch.stack(latents)
                 timestep = t.repeat(latent_model_input.shape[0])
                 timestep = timestep.unsqueeze(-1).repeat(1, total_frames)
@@ -235,6 +238,7 @@ class ShotSwitchingExtensionPipeline:
             if self.offload:
                 self.transformer.cpu()
                 torch.cuda.empty_cache()
+            progress.phase("decode")
             videos = self.vae.decode(latents[0])
             videos = (videos / 2 + 0.5).clamp(0, 1)
             videos = [video for video in videos]
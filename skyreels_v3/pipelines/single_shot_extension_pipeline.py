@@ -10,6 +10,8 @@ from tqdm import tqdm
 
 from ..modules import get_text_encoder, get_transformer, get_vae
 from ..scheduler.fm_solvers_unipc import FlowUniPCMultistepScheduler
+from ..utils import progress
+from ..utils.checkpoint import ClipCheckpoint
 from ..utils.util import get_video_info
 
 
@@ -109,6 +111,7 @@ class SingleShotExtensionPipeline:
         seed: int,
         fps: int = 24,
         resolution: str = "720P",
+        checkpoint_dir: Optional[str] = None,
     ):
         num_condition_frames = 25
         factor_num_frames = 6
@@ -121,8 +124,21 @@ class SingleShotExtensionPipeline:
 
         prefix_video = prefix_video.to(self.device)
         padding_frames = 0
+        # each roll reseeds its own generator, so rolls + prefix frames are all the state
+        checkpoint = ClipCheckpoint(checkpoint_dir)
+        resumed = checkpoint.load()
+        first_roll = 0
+        if resumed:
+            output_video_frames = resumed["frames"]
+            first_roll = len(output_video_frames)
+            padding_frames = resumed["state"]["padding_frames"]
+            prefix_video = self._prefix_from_frames(resumed["state"]["prefix_frames"])
         for i, gen_time in enumerate(generatetime_list):
+            if i < first_roll:
+                continue
             latent_num_frames = factor_num_frames * gen_time
+            progress.set_clip(i + 1, len(generatetime_list))
+            progress.phase("vae_encode")
             prefix_video = self.vae.encode(prefix_video)
             prefix_shape = prefix_video.shape[2]
             rest_frames = (latent_num_frames + prefix_shape) % 8
@@ -155,16 +171,23 @@ class SingleShotExtensionPipeline:
             #    output_video_frames.append(video_frames)
             # else:
             output_video_frames.append(video_frames[num_condition_frames:])
-            prefix_video = torch.tensor(video_frames[-num_condition_frames:]).unsqueeze(
-                0
+            prefix_video = self._prefix_from_frames(video_frames[-num_condition_frames:])
+            checkpoint.save(
+                i + 1,
+                output_video_frames[-1],
+                {"padding_frames": padding_frames, "prefix_frames": video_frames[-num_condition_frames:]},
             )
-            logging.info(f"prefix_video: {prefix_video.shape}")
-            prefix_video = prefix_video.permute(0, 4, 1, 2, 3).float()
-            prefix_video = prefix_video / (255.0 / 2.0) - 1.0
-            prefix_video = prefix_video.to(self.device)
         video_frames = np.concatenate(output_video_frames, axis=0)
         return video_frames
 
+    def _prefix_from_frames(self, frames):
+        """uint8 (T, H, W, C) frames -> normalized (1, C, T, H, W) condition video."""
+        prefix_video = torch.tensor(frames).unsqueeze(0)
+        logging.info(f"prefix_video: {prefix_video.shape}")
+        prefix_video = prefix_video.permute(0, 4, 1, 2, 3).float()
+        prefix_video = prefix_video / (255.0 / 2.0) - 1.0
+        return prefix_video.to(self.device)
+
     @torch.no_grad()
     def __call__(
         self,
@@ -200,6 +223,7 @@ class SingleShotExtensionPipeline:
                 height // self.vae_stride[1],
                 width // self.vae_stride[2],
             )
+        progress.phase("text_encode")
         context = self.text_encoder.encode(prompt).to(self.device)
         context_null = (
             self.text_encoder.encode(negative_prompt).to(self.device)
@@ -237,7 +261,7 @@ class SingleShotExtensionPipeline:
             )
             timesteps = self.scheduler.timesteps
 
-            for _, t in enumerate(tqdm(timesteps)):
+            for _, t in enumerate(progress.track(tqdm(timesteps))):
                 latent_model_input = torch.stack(latents)
                 timestep = torch.stack([t])
                 if "condition" in kwargs:
@@ -283,6 +307,7 @@ class SingleShotExtensionPipeline:
             if self.offload:
                 self.transformer.cpu()
                 torch.cuda.empty_cache()
+            progress.phase("decode")
             if "condition" in kwargs:
                 videos = self.vae.decode(
                     torch.cat([kwargs["condition"], latents[0].unsqueeze(0)], 2)[0]
@@ -23,6 +23,8 @@ from ..modules.clip import CLIPModel
 from ..modules.t5 import T5EncoderModel
 from ..modules.transformer_a2v import WanModel
 from ..modules.vae import WanVAE
+from ..utils import progress as progress_events
+from ..utils.checkpoint import ClipCheckpoint
 from ..utils.avatar_util import (
     ASPECT_RATIO_627,
     ASPECT_RATIO_960,
@@ -250,6 +252,7 @@ class TalkingAvatarPipeline:
         seed=-1,
         max_frames_num=5000,
         progress=True,
+        checkpoint_dir=None,
     ):
         input_prompt = input_data["prompt"]
         cond_file_path = input_data["cond_image"]
@@ -303,6 +306,7 @@ class TalkingAvatarPipeline:
 
         if self.offload:
             self.text_encoder.to(self.device)
+        progress_events.phase("text_encode")
         context, context_null, connection_embedding = self.text_encoder.encode(
             [input_prompt, n_prompt, connection_prompt],
         )
@@ -341,6 +345,14 @@ class TalkingAvatarPipeline:
                 video_length = video_length_real
         print(f"video_length_real: {video_length_real}")
         print(f"video_length: {video_length}")
+        # reference pass + one clip per sliding audio window
+        if is_clip:
+            num_clips = 1
+        elif max_frames_num <= frame_num:
+            num_clips = 2
+        else:
+            num_clips = 2 + (video_length - window_size) // (window_size - overlap)
+        progress_events.set_clip(1, num_clips)
 
         # set random seed and init noise
         seed = seed if seed >= 0 else random.randint(0, 99999999)
@@ -406,6 +418,7 @@ class TalkingAvatarPipeline:
             ).to(self.device)
             padding_frames_pixels_values = torch.concat([cond_image, video_frames], dim=2)
 
+            progress_events.phase("vae_encode")
             y = self.vae.encode(padding_frames_pixels_values).to(self.param_dtype)
             cur_motion_frames_latent_num = int(1 + (cur_motion_frames_num - 1) // 4)
             latent_motion_frames = y[:, :, :cur_motion_frames_latent_num][0]
@@ -495,7 +508,7 @@ class TalkingAvatarPipeline:
                 self.model.to(self.device)
 
             progress_wrap = partial(tqdm, total=len(timesteps) - 1) if progress else (lambda x: x)
-            for i in progress_wrap(range(len(timesteps) - 1)):
+            for i in progress_events.track(progress_wrap(range(len(timesteps) - 1)), total=len(timesteps) - 1):
                 timestep = timesteps[i]
                 latent_model_input = [latent.to(self.device)]
                 (
@@ -561,6 +574,7 @@ class TalkingAvatarPipeline:
                 self.model.to("cpu")
                 torch.cuda.empty_cache()
 
+            progress_events.phase("decode")
             videos = self.vae.decode(x0[0])
             torch.cuda.empty_cache()
 
@@ -602,8 +616,26 @@ class TalkingAvatarPipeline:
             print(f"generated_ref_videos_final:{generated_ref_videos_final.shape}")
 
             tmp_indx = 0
+            clip_idx = 1
+            # The reference pass above is always recomputed (it is deterministic for a
+            # fixed seed); the sliding windows after it resume from the last checkpoint,
+            # which also restores the RNG state the next window starts from.
+            checkpoint = ClipCheckpoint(checkpoint_dir)
+            resumed = checkpoint.load()
+            if resumed:
+                gen_video_list = resumed["frames"]
+                state = resumed["state"]
+                clip_idx = state["clip_idx"]
+                tmp_indx = state["tmp_indx"]
+                audio_start_idx = state["audio_start_idx"]
+                audio_end_idx = state["audio_end_idx"]
+                cur_motion_frames_num = state["cur_motion_frames_num"]
+                cond_image = state["cond_image"].to(self.device)
+                is_first_clip = False
             # start video generation iteratively
             while True:
+                clip_idx += 1
+                progress_events.set_clip(clip_idx, num_clips)
                 if audio_end_idx == video_length:
                     arrive_last_frame = True
 
@@ -689,6 +721,7 @@ class TalkingAvatarPipeline:
                     ).to(self.device)
                     padding_frames_pixels_values = torch.concat([cond_image, video_frames, pseudo_frames], dim=2)
 
+                    progress_events.phase("vae_encode")
                     y = self.vae.encode(padding_frames_pixels_values).to(self.param_dtype)
                     cur_motion_frames_latent_num = int(1 + (cur_motion_frames_num - 1) // 4)
                     latent_motion_frames = y[:, :, :cur_motion_frames_latent_num][0]  # C T H W
@@ -790,7 +823,7 @@ class TalkingAvatarPipeline:
                         latent[:, :T_m] = add_latent
 
                     progress_wrap = partial(tqdm, total=len(timesteps) - 1) if progress else (lambda x: x)
-                    for i in progress_wrap(range(len(timesteps) - 1)):
+                    for i in progress_events.track(progress_wrap(range(len(timesteps) - 1)), total=len(timesteps) - 1):
 
                         # print(timesteps)
                         timestep = timesteps[i]
@@ -876,6 +909,7 @@ class TalkingAvatarPipeline:
                         self.model.to("cpu")
                         torch.cuda.empty_cache()
 
+                    progress_events.phase("decode")
                     videos = self.vae.decode(x0[0])
                     torch.cuda.empty_cache()
 
@@ -910,6 +944,20 @@ class TalkingAvatarPipeline:
 
                 is_first_clip = False
 
+                if self.rank == 0:
+                    checkpoint.save(
+                        len(gen_video_list),
+                        gen_video_list[-1],
+                        {
+                            "clip_idx": clip_idx,
+                            "tmp_indx": tmp_indx,
+                            "audio_start_idx": audio_start_idx,
+                            "audio_end_idx": audio_end_idx,
+                            "cur_motion_frames_num": cur_motion_frames_num,
+                            "cond_image": cond_image.cpu(),
+                        },
+                    )
+
                 if max_frames_num <= frame_num:
                     break
 
@@ -0,0 +1,85 @@
+"""Per-clip checkpoints for the multi-clip pipelines (talking_avatar windows,
+single_shot_extension rolls).
+
+After each finished clip the pipeline calls save(): the clip's uint8 frames go to
+clip_NNNN.pt and the loop state needed to start the next clip (motion/prefix
+frames, audio indices, counters) goes to state.pt together with the RNG state of
+torch (CPU and CUDA), numpy and random. A rerun of the same job calls load() and
+continues after the last finished clip; with a fixed seed the output is
+bit-identical to an uninterrupted run.
+
+A ClipCheckpoint built with directory=None is disabled: load() returns None and
+save()/clear() do nothing, so the pipelines call it unconditionally.
+"""
+import os
+import random
+import shutil
+
+import numpy as np
+import torch
+
+STATE_FILE = "state.pt"
+
+
+def capture_rng():
+    return {
+        "torch": torch.get_rng_state(),
+        "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+        "numpy": np.random.get_state(),
+        "python": random.getstate(),
+    }
+
+
+def restore_rng(rng):
+    torch.set_rng_state(rng["torch"])
+    if rng.get("cuda") is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(rng["cuda"])
+    np.random.set_state(rng["numpy"])
+    random.setstate(rng["python"])
+
+
+def _atomic_save(obj, path):
+    tmp = path + ".tmp"
+    torch.save(obj, tmp)
+    os.replace(tmp, path)
+
+
+class ClipCheckpoint:
+    def __init__(self, directory=None):
+        self.directory = directory
+
+    def _clip_path(self, index):
+        return os.path.join(self.directory, f"clip_{index:04d}.pt")
+
+    def save(self, index, frames, state):
+        """Persist clip `index` (1-based, in the order the pipeline produces them):
+        its frames, then the state to resume after it."""
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        _atomic_save(frames, self._clip_path(index))
+        _atomic_save({"clips_done": index, "state": state, "rng": capture_rng()},
+                     os.path.join(self.directory, STATE_FILE))
+
+    def load(self):
+        """{"frames": [...], "state": {...}} for the finished clips (RNG already
+        restored), or None when there is nothing to resume."""
+        if not self.directory:
+            return None
+        state_path = os.path.join(self.directory, STATE_FILE)
+        if not os.path.exists(state_path):
+            return None
+        try:
+            saved = torch.load(state_path, map_location="cpu", weights_only=False)
+            frames = [torch.load(self._clip_path(i), map_location="cpu", weights_only=False)
+                      for i in range(1, saved["clips_done"] + 1)]
+        except Exception as e:
+            print(f"checkpoint: ignoring unreadable checkpoint in {self.directory}: {e}")
+            return None
+        restore_rng(saved["rng"])
+        print(f"checkpoint: resuming after clip {saved['clips_done']} from {self.directory}")
+        return {"frames": frames, "state": saved["state"]}
+
+    def clear(self):
+        if self.directory and os.path.isdir(self.directory):
+            shutil.rmtree(self.directory, ignore_errors=True)
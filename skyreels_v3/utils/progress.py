@@ -0,0 +1,120 @@
+"""Machine-readable progress events for generate_video.py and the pipelines.
+
+Events are JSON lines written to the file descriptor named by the
+SKYREELS_PROGRESS_FD environment variable (the web UI passes one end of a pipe),
+or to a sink installed with set_sink() (used by generate_worker.py). Without
+either, every call is a no-op, so the CLI output is unchanged.
+
+Event fields:
+    phase    load | text_encode | vae_encode | denoise | decode | write | done
+    step     denoising step inside the current clip (1-based), denoise only
+    total    number of denoising steps of the current clip
+    clip     current clip / roll / segment (1-based) and clips = how many
+    percent  overall job progress estimate, 0-100
+    elapsed  seconds since reset()
+    eta      seconds left, estimated from the denoising rate (None until known)
+"""
+import json
+import os
+import threading
+import time
+
+_lock = threading.Lock()
+_sink = None
+_fd_stream = None
+_state = {}
+
+
+def _fd_sink():
+    global _fd_stream
+    if _fd_stream is None:
+        fd = os.environ.get("SKYREELS_PROGRESS_FD")
+        # under torchrun only rank 0 reports; the other ranks run the same loop
+        if not fd or os.environ.get("RANK", "0") != "0":
+            return None
+        try:
+            _fd_stream = os.fdopen(int(fd), "w", buffering=1, encoding="utf-8")
+        except (OSError, ValueError):
+            _fd_stream = False
+    return _fd_stream or None
+
+
+def set_sink(sink):
+    """Install a callable receiving each event dict (None restores the fd sink)."""
+    global _sink
+    _sink = sink
+
+
+def reset():
+    """Start a new job: clears clip counters and the elapsed/ETA clock."""
+    with _lock:
+        _state.clear()
+        _state.update(t0=time.time(), clip=1, clips=1, denoise_t0=None, denoise_done=0.0)
+
+
+def set_clip(clip, clips=None):
+    """Mark the start of clip `clip` (1-based) out of `clips`."""
+    with _lock:
+        _state["clip"] = int(clip)
+        if clips is not None:
+            _state["clips"] = max(1, int(clips))
+
+
+def _fraction(step=None, total=None):
+    clips = _state.get("clips", 1)
+    done_clips = _state.get("clip", 1) - 1
+    inner = step / total if step and total else 0.0
+    return min(1.0, (done_clips + inner) / clips)
+
+
+def emit(phase, step=None, total=None, **extra):
+    if _sink is None and _fd_sink() is None:
+        return
+    with _lock:
+        if not _state:
+            _state.update(t0=time.time(), clip=1, clips=1, denoise_t0=None, denoise_done=0.0)
+        now = time.time()
+        event = {
+            "phase": phase,
+            "clip": _state["clip"],
+            "clips": _state["clips"],
+            "elapsed": round(now - _state["t0"], 2),
+            "eta": None,
+        }
+        if step is not None:
+            event["step"] = step
+            event["total"] = total
+        if phase == "denoise":
+            frac = _fraction(step, total)
+            if _state["denoise_t0"] is None:
+                _state["denoise_t0"] = now
+                _state["denoise_done"] = frac
+            elif frac > _state["denoise_done"]:
+                rate = (now - _state["denoise_t0"]) / (frac - _state["denoise_done"])
+                event["eta"] = round(rate * (1.0 - frac), 1)
+            event["percent"] = int(frac * 100)
+        elif phase == "done":
+            event["percent"] = 100
+        else:
+            event["percent"] = int(_fraction() * 100)
+        event.update(extra)
+    try:
+        if _sink is not None:
+            _sink(event)
+        else:
+            _fd_sink().write(json.dumps(event) + "\n")
+    except (OSError, ValueError):
+        pass
+
+
+def phase(name, **extra):
+    emit(name, **extra)
+
+
+def track(iterable, total=None):
+    """Wrap the denoising loop: yields items and emits one denoise event per step."""
+    if total is None:
+        total = len(iterable)
+    for i, item in enumerate(iterable):
+        yield item
+        emit("denoise", step=i + 1, total=total)
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+generate_video = pytest.importorskip("generate_video")
+
+
+def test_silent_temp_is_not_the_final_path_for_non_mp4_output(tmp_path, monkeypatch):
+    final = tmp_path / "out.mov"
+    audio = tmp_path / "voice.wav"
+    audio.write_bytes(b"RIFF")
+    written, commands = [], []
+
+    def fake_mimwrite(path, frames, **kwargs):
+        written.append(path)
+        with open(path, "wb") as f:
+            f.write(b"frames")
+
+    def fake_run(cmd, **kwargs):
+        commands.append(cmd)
+        final.write_bytes(b"muxed")
+        return subprocess.CompletedProcess(cmd, 0, b"")
+
+    monkeypatch.setattr(generate_video.imageio, "mimwrite", fake_mimwrite)
+    monkeypatch.setattr(generate_video.subprocess, "run", fake_run)
+    args = SimpleNamespace(output_path=str(final), task_type="text_to_video", seed=1)
+
+    path, muxed = generate_video.write_video(args, [], audio_path=str(audio))
+
+    assert written == [str(tmp_path / "out.silent.mov")]
+    assert f'-i "{written[0]}"' in commands[0]
+    assert commands[0].endswith(f'"{final}"')
+    assert (path, muxed) == (str(final), True)
+    assert final.read_bytes() == b"muxed"
+    assert not os.path.exists(written[0])
@@ -1,27 +1,55 @@
-import io
 import os
 import re
 import sys
 import uuid
+import hashlib
+import shlex
+import shutil
+import socket
 import subprocess
 import threading
-import queue
 import time
+import logging.handlers
 import json
+import copy
+import urllib.parse
 import glob
-import zipfile
+from collections import OrderedDict, deque
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify, Response, send_file
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, render_template, request, jsonify, Response, send_file, redirect
 from werkzeug.utils import secure_filename
 
+from asset_cache import AssetCache, cache_key, download_url, write_file
+from asset_providers import (ElevenLabsProvider, FalProvider, HTTPStandInProvider,
+                             call_with_retry)
+from eta_model import EtaModel
+from event_bus import EventBus
+from media_index import MediaIndex, version_token
+from media_probe import MediaProbe
+from memory_model import MODES as MEMORY_MODES, MemoryModel, raw_estimate_gb
+import metrics
+from queue_store import QueueStore
+from webhook_outbox import WebhookOutbox
+from zip_stream import iter_zip
+
 # Paths
 PROJECT_ROOT = Path(__file__).parent.parent
 RESULT_DIR = PROJECT_ROOT / "result"
 UPLOAD_DIR = PROJECT_ROOT / "uploads"
 VENV_PYTHON = PROJECT_ROOT / ".venv" / "bin" / "python"
+# Worker persistente (generate_worker.py): mantém os pipelines carregados entre cenas.
+# Se o socket não existir / não aceitar conexão, cai no subprocess do generate_video.py.
+WORKER_SOCKET = os.environ.get("SKYREELS_WORKER_SOCKET", "/tmp/skyreels_worker.sock")
+# Substitui "<venv python> generate_video.py" no comando dos jobs (mesmos argumentos).
+# Ex.: SKYREELS_GENERATOR_CMD="python scripts/fake_generate_video.py" pra testar sem GPU.
+GENERATOR_CMD = os.environ.get("SKYREELS_GENERATOR_CMD", "").strip()
 
 UPLOAD_DIR.mkdir(exist_ok=True)
-QUEUES_FILE = UPLOAD_DIR / "queues.json"
+QUEUES_FILE = UPLOAD_DIR / "queues.json"   # formato antigo: importado se o DB estiver vazio
+QUEUES_DB = UPLOAD_DIR / "queues.db"
+ETA_DB = UPLOAD_DIR / "eta_history.db"   # tempos medidos dos jobs concluídos (webui/eta_model.py)
+MEMORY_DB = UPLOAD_DIR / "memory_history.db"   # picos de VRAM medidos (webui/memory_model.py)
 
 PROJECTS_DIR = PROJECT_ROOT / "projetos"
 PROJECTS_DIR.mkdir(exist_ok=True)
@@ -315,9 +343,55 @@ app = Flask(__name__)
 
 # ---- Observability ----
 # Mantido sincronizado com webui/templates/index.html (title + header <h1>)
-VERSION = "3.49.19"
+VERSION = "3.74.19"
 APP_START_TS = time.time()
 
+# Métricas expostas em GET /metrics (formato Prometheus; prometheus_client é opcional)
+METRIC_JOBS = metrics.counter(
+    "skyreels_jobs", "Jobs de geração terminados", ["task_type", "status"])
+METRIC_JOB_SECONDS = metrics.histogram(
+    "skyreels_job_duration_seconds", "Duração total do job (do início ao fim no worker)",
+    ["task_type", "status"], buckets=(30, 60, 120, 300, 600, 900, 1200, 1800, 2700, 3600, 5400, 7200))
+METRIC_PHASE_SECONDS = metrics.histogram(
+    "skyreels_phase_duration_seconds",
+    "Duração de cada fase do job (load, text_encode, vae_encode, denoise, decode, write, mux)",
+    ["task_type", "phase"], buckets=(0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1200, 2400))
+METRIC_STEP_SECONDS = metrics.histogram(
+    "skyreels_denoise_step_seconds", "Duração média de um passo de denoise (por clip/janela)",
+    ["task_type"], buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 40, 80))
+METRIC_QUEUE_WAIT = metrics.histogram(
+    "skyreels_queue_wait_seconds", "Espera entre entrar na fila (pending) e começar num worker",
+    ["task_type"], buckets=(1, 10, 30, 60, 300, 600, 1800, 3600, 7200, 14400, 28800))
+METRIC_GPU_PEAK = metrics.gauge(
+    "skyreels_gpu_memory_peak_bytes", "Pico de memória da GPU no último job do worker",
+    ["worker", "kind"])
+METRIC_HOST_PEAK = metrics.gauge(
+    "skyreels_host_memory_peak_bytes", "Pico de RSS do processo gerador no último job do worker",
+    ["worker"])
+METRIC_WEBHOOKS = metrics.counter(
+    "skyreels_webhook_deliveries", "Entregas de webhook (delivered, rejected = 4xx, failed = desistiu)",
+    ["outcome"])
+METRIC_WEBHOOK_RETRIES = metrics.counter(
+    "skyreels_webhook_retries", "Novas tentativas de webhook após timeout/erro/5xx")
+METRIC_FINALIZE_SECONDS = metrics.histogram(
+    "skyreels_finalize_duration_seconds", "Duração das finalizações (concat do episódio)",
+    ["status"], buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 2400))
+_scene_finish_ts = deque()   # fim dos jobs concluídos na última hora (scenes per hour)
+_scene_finish_lock = threading.Lock()   # scrapes do /metrics concorrentes podam o mesmo deque
+
+
+def _scenes_last_hour():
+    cutoff = time.time() - 3600
+    with _scene_finish_lock:
+        while _scene_finish_ts and _scene_finish_ts[0] < cutoff:
+            _scene_finish_ts.popleft()
+        return len(_scene_finish_ts)
+
+
+metrics.gauge("skyreels_scenes_per_hour", "Cenas concluídas na última hora").set_function(_scenes_last_hour)
+metrics.gauge("skyreels_uptime_seconds", "Tempo desde o início da Web UI").set_function(
+    lambda: time.time() - APP_START_TS)
+
 
 def _gpu_free_gb():
     """Soma da memória livre de GPU (GB) via nvidia-smi. None se indisponível."""
@@ -336,19 +410,164 @@ def _gpu_free_gb():
 
 
 # ---- Global generation state ----
-generation_state = {
-    "running": False,
-    "log": [],
-    "progress": 0,
-    "total": 8,
-    "status": "idle",  # idle | running | done | error
-    "last_video": None,
-    "current_job_id": None,
-    "current_nq_id": None,
-    "current_nq_name": None,
-    "current_nq_scene": None,
-}
-log_queue = queue.Queue()
+# Log em memória por worker: ring limitado por linhas e bytes. O log completo de cada
+# job vai para logs/jobs/job_<id>.log (com rotação). Cada linha leva um número de uma
+# sequência única do app (_log_seq, todos os workers): log_cursor do /status é esse
+# número, então o cursor continua válido quando o worker "principal" muda entre polls.
+LOG_MAX_LINES = int(os.environ.get("SKYREELS_LOG_LINES", "2000"))
+LOG_MAX_BYTES = int(os.environ.get("SKYREELS_LOG_BYTES", str(1024 * 1024)))
+JOB_LOGS_DIR = PROJECT_ROOT / "logs" / "jobs"
+JOB_LOG_MAX_BYTES = int(os.environ.get("SKYREELS_JOB_LOG_BYTES", str(10 * 1024 * 1024)))
+JOB_LOG_BACKUPS = 3
+_log_lock = threading.Lock()
+_log_seq = 0   # última linha de log do app (todos os workers)
+
+
+def _new_generation_state():
+    return {
+        "running": False,
+        "log": deque(),    # (seq, linha)
+        "log_dropped": 0,  # seq da última linha que saiu do ring (descarte ou novo job)
+        "log_bytes": 0,
+        "progress": 0,
+        "total": 8,
+        "status": "idle",  # idle | running | done | error
+        "last_video": None,
+        "current_job_id": None,
+        "current_nq_id": None,
+        "current_nq_name": None,
+        "current_nq_scene": None,
+        "started_ts": None,
+        "finished_ts": None,
+        "phase": None,     # load | text_encode | vae_encode | denoise | decode | write | done
+        "phase_started_ts": None,
+        "phase_steps": 0,  # último step visto na fase (denoise: passos do clip atual)
+        "task_type": None,
+        "eta_s": None,
+        "clip": None,
+        "clips": None,
+    }
+
+
+def _log_append(state, line):
+    global _log_seq
+    with _log_lock:
+        _log_seq += 1
+        state["log"].append((_log_seq, line))
+        state["log_bytes"] += len(line) + 1
+        while len(state["log"]) > LOG_MAX_LINES or (
+                state["log_bytes"] > LOG_MAX_BYTES and len(state["log"]) > 1):
+            seq, old = state["log"].popleft()
+            state["log_bytes"] -= len(old) + 1
+            state["log_dropped"] = seq
+
+
+def _log_clear(state):
+    with _log_lock:
+        if state["log"]:
+            state["log_dropped"] = state["log"][-1][0]
+        state["log"].clear()
+        state["log_bytes"] = 0
+
+
+def _log_since(state, since=None):
+    """(linhas, cursor, truncado). since=None: o buffer inteiro; senão só as linhas
+    com seq > since — truncado se parte delas já saiu do ring. O cursor é o _log_seq
+    global."""
+    with _log_lock:
+        cursor = _log_seq
+        if since is None:
+            return [line for _, line in state["log"]], cursor, False
+        lines = []
+        for seq, line in reversed(state["log"]):   # só as linhas novas, do fim
+            if seq <= since:
+                break
+            lines.append(line)
+        lines.reverse()
+        return lines, cursor, since < state["log_dropped"]
+
+
+def _open_job_log(job_id, worker_id):
+    """Handler com rotação para o log completo do job (None se não der pra abrir)."""
+    try:
+        JOB_LOGS_DIR.mkdir(parents=True, exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            JOB_LOGS_DIR / f"job_{job_id}.log", maxBytes=JOB_LOG_MAX_BYTES,
+            backupCount=JOB_LOG_BACKUPS, encoding="utf-8",
+        )
+    except OSError as e:
+        print(f"[log] warn: não consegui abrir o log do job {job_id}: {e}")
+        return None
+    handler.handle(logging.makeLogRecord(
+        {"msg": f"=== {time.strftime('%Y-%m-%d %H:%M:%S')} — início (worker {worker_id}) ==="}))
+    return handler
+
+
+# ---- GPU worker pool ----
+# Cada worker roda um job por vez, preso às suas GPUs via CUDA_VISIBLE_DEVICES.
+# SKYREELS_GPU_WORKERS="0;1;2,3" (";" separa workers) ou "gpu_workers": ["0", "1", "2,3"]
+# no /config. Sem configuração: um único worker que herda o ambiente (comportamento antigo).
+def _parse_gpu_workers():
+    spec = os.environ.get("SKYREELS_GPU_WORKERS")
+    if spec is None:
+        spec = _load_global_config().get("gpu_workers")
+    if not spec:
+        return [None]
+    if isinstance(spec, str):
+        spec = spec.split(";")
+    devices = [str(d).strip().replace(" ", "") for d in spec]
+    return [d for d in devices if d] or [None]
+
+
+gpu_workers = [
+    {"id": i, "devices": devices, "state": _new_generation_state(), "last_family": None,
+     "mem_reserved_gb": 0.0}
+    for i, devices in enumerate(_parse_gpu_workers())
+]
+# Compat: código/rotas antigas olham generation_state — é o estado do worker 0
+generation_state = gpu_workers[0]["state"]
+# Eventos do /stream (start / log / done de cada worker) num ring buffer com ids:
+# cada cliente SSE só mantém o próprio cursor. SKYREELS_EVENT_BUFFER = tamanho do ring.
+event_bus = EventBus(int(os.environ.get("SKYREELS_EVENT_BUFFER", "5000")))
+_dispatch_lock = threading.Lock()
+
+
+def _any_worker_running():
+    return any(w["state"]["running"] for w in gpu_workers)
+
+
+def _worker_summary(worker):
+    st = worker["state"]
+    return {
+        "id": worker["id"],
+        "devices": worker["devices"],
+        "running": st["running"],
+        "status": st["status"],
+        "progress": st["progress"],
+        "phase": st["phase"],
+        "eta_s": st["eta_s"],
+        "clip": st["clip"],
+        "clips": st["clips"],
+        "current_job_id": st["current_job_id"],
+        "current_nq_id": st["current_nq_id"],
+        "current_nq_name": st["current_nq_name"],
+        "current_nq_scene": st["current_nq_scene"],
+        "last_video": st["last_video"],
+        "model_family": worker["last_family"],
+        "mem_reserved_gb": round(worker["mem_reserved_gb"], 1),
+        "mem_total_gb": _gpu_total_gb(worker),
+    }
+
+
+def _primary_state():
+    """Estado "legado" pra UI de um worker só: o job rodando há mais tempo;
+    sem nada rodando, o último que terminou."""
+    running = [w["state"] for w in gpu_workers if w["state"]["running"]]
+    if running:
+        return min(running, key=lambda st: st["started_ts"] or 0)
+    return max((w["state"] for w in gpu_workers),
+               key=lambda st: st["finished_ts"] or 0)
+
 
 # ---- Job Queue ----
 job_queue = []          # list of job dicts (all statuses)
@@ -365,6 +584,14 @@ _ep_gen_lock = threading.Lock()
 named_queues = []
 nq_lock = threading.Lock()
 _nq_id_counter = 0
+queue_store = QueueStore(QUEUES_DB)   # SQLite/WAL, linhas por fila e por cena
+_nq_eta_cache: dict = {}              # nq_id -> (versão do eta_model, geração da fila, estimado, restante)
+_nq_gen: dict = {}                    # nq_id -> geração, incrementada a cada _save_queue
+
+# ---- Media index ----
+# Vídeos de result/ em memória: varrido uma vez no startup, atualizado a cada escrita
+# do app. SKYREELS_MEDIA_WATCH=1 (com watchdog instalado) também pega gravações externas.
+media_index = MediaIndex(RESULT_DIR, PROJECT_ROOT)
 
 # ---- Background episode generation ----
 _ep_gen_state: dict = {}       # job_id -> {status, jobs, saved_doc, ep_title, error, raw}
@@ -378,34 +605,44 @@ def _next_nq_id():
     return _nq_id_counter
 
 
-def _save_queues():
-    """Persist named_queues to disk (called after every mutation)."""
+def _save_queue(nq_id):
+    """Persist one named queue (called after every mutation). Only rows that changed
+    since the last write hit the disk; a queue no longer in memory is deleted.
+    The rows are serialized under nq_lock and written to SQLite after releasing it;
+    the queue generation keeps a late, older snapshot from overwriting a newer one."""
     try:
         with nq_lock:
-            data = json.loads(json.dumps(named_queues))  # deep copy via JSON
-        # Reset transient states before saving
-        for nq in data:
-            if nq["status"] == "running":
-                nq["status"] = "idle"
-            for j in nq["jobs"]:
-                if j["status"] in ("running", "pending"):
-                    j["status"] = "idle"
-            # Drop ephemeral fields (prefixed with "_") — webhooks, timers, etc.
-            for k in [k for k in nq.keys() if k.startswith("_")]:
-                del nq[k]
-        QUEUES_FILE.write_text(json.dumps(data, indent=2, ensure_ascii=False))
+            gen = _nq_gen[nq_id] = _nq_gen.get(nq_id, 0) + 1
+            nq = next((q for q in named_queues if q["id"] == nq_id), None)
+            if nq is None:
+                _nq_eta_cache.pop(nq_id, None)
+            else:
+                snap = QueueStore.snapshot(nq)
+        if nq is None:
+            queue_store.delete_queue(nq_id)
+        else:
+            queue_store.write(snap, generation=gen)
     except Exception as e:
-        print(f"[queues] save error: {e}")
+        print(f"[queues] save error (fila {nq_id}): {e}")
+
+
+def _save_queues():
+    """Persist every named queue (startup / bulk changes)."""
+    with nq_lock:
+        ids = [nq["id"] for nq in named_queues]
+    for nq_id in ids:
+        _save_queue(nq_id)
 
 
 def _load_queues():
-    """Load named_queues from disk on startup."""
+    """Load named_queues from the SQLite store on startup (imports queues.json once)."""
     global _nq_id_counter, _job_id_counter
-    if not QUEUES_FILE.exists():
-        return
     try:
-        data = json.loads(QUEUES_FILE.read_text())
-        for nq in data:
+        if queue_store.is_empty() and QUEUES_FILE.exists():
+            data = json.loads(QUEUES_FILE.read_text())
+            queue_store.replace_all(data)
+            print(f"[queues] imported {len(data)} queue(s) from {QUEUES_FILE} into {QUEUES_DB}")
+        for nq in queue_store.iter_queues():
             # Reset any in-flight states from previous run
             if nq.get("status") in ("running", "pending"):
                 nq["status"] = "idle"
@@ -426,11 +663,31 @@ def _load_queues():
             all_job_ids = [j["id"] for nq in named_queues for j in nq.get("jobs", [])]
             if all_job_ids:
                 _job_id_counter = max(all_job_ids)
-        print(f"[queues] loaded {len(named_queues)} queue(s) from {QUEUES_FILE}")
+        print(f"[queues] loaded {len(named_queues)} queue(s) from {QUEUES_DB}")
     except Exception as e:
         print(f"[queues] load error: {e}")
 
 
+def _link_job_outputs():
+    with nq_lock:
+        outputs = [(j["id"], j["output_video"]) for nq in named_queues
+                   for j in nq.get("jobs", []) if j.get("output_video")]
+    for job_id, rel in outputs:
+        media_index.link_job(job_id, rel)
+
+
+def _index_media():
+    t0 = time.time()
+    count = media_index.rescan()
+    _link_job_outputs()
+    watching = os.environ.get("SKYREELS_MEDIA_WATCH") == "1" and media_index.start_watching()
+    pruned = media_probe.prune()
+    _load_derived_index()
+    print(f"[media] {count} vídeo(s) indexado(s) em {time.time() - t0:.2f}s"
+          + (" — observando result/" if watching else "")
+          + (f"; {pruned} probe(s) de arquivos removidos descartado(s)" if pruned else ""))
+
+
 def _next_job_id():
     global _job_id_counter
     _job_id_counter += 1
@@ -566,7 +823,48 @@ def _resolve_nq_refs(job, nq):
     return resolved
 
 
-def build_cmd_from_job(job):
+def _generator_prefix():
+    """Executável + script que recebem os argumentos do generate_video.py."""
+    if GENERATOR_CMD:
+        return shlex.split(GENERATOR_CMD)
+    return [str(VENV_PYTHON), str(PROJECT_ROOT / "generate_video.py")]
+
+
+def _job_output_paths(job, project=""):
+    """Caminhos (relativos ao PROJECT_ROOT) passados ao gerador em --output_path e
+    --manifest_path: o vídeo já nasce no lugar final (result/[<projeto>/]<task>/) e o
+    app lê o manifest em vez de procurar o mp4 mais recente."""
+    task = job.get("task_type", "reference_to_video")
+    task_dir = RESULT_DIR / project / task if project else RESULT_DIR / task
+    stem = f"{job.get('seed', 42)}_{time.strftime('%Y-%m-%d_%H-%M-%S')}_j{job['id']}"
+    rel = task_dir.relative_to(PROJECT_ROOT)
+    return str(rel / f"{stem}.mp4"), str(rel / f"{stem}.manifest.json")
+
+
+# Checkpoints por clipe (--checkpoint_dir do generate_video.py): rodar de novo uma cena de
+# talking_avatar / single_shot_extension que caiu continua do último clipe pronto. O gerador
+# apaga os da cena quando o vídeo sai; os de cenas abandonadas expiram em
+# SKYREELS_CHECKPOINT_DAYS dias (padrão 7).
+CHECKPOINT_DIR = PROJECT_ROOT / ".cache" / "checkpoints"
+
+
+def _prune_checkpoints():
+    max_age = float(os.environ.get("SKYREELS_CHECKPOINT_DAYS", "7")) * 86400
+    if not CHECKPOINT_DIR.is_dir():
+        return
+    for d in CHECKPOINT_DIR.iterdir():
+        try:
+            if d.is_dir() and time.time() - d.stat().st_mtime > max_age:
+                shutil.rmtree(d, ignore_errors=True)
+                print(f"[checkpoint] removido (expirado): {d.name}")
+        except OSError:
+            pass
+
+
+_prune_checkpoints()
+
+
+def build_cmd_from_job(job, output_path=None, manifest_path=None):
     """Build generate_video.py command + env + metadata from a job dict."""
     task_type = job.get("task_type", "reference_to_video")
     prompt    = job.get("prompt", "")
@@ -580,8 +878,7 @@ def build_cmd_from_job(job):
     if task_type == "talking_avatar" and resolution == "540P":
         resolution = "480P"
 
-    cmd = [
-        str(VENV_PYTHON), str(PROJECT_ROOT / "generate_video.py"),
+    cmd = _generator_prefix() + [
         "--task_type", task_type,
         "--prompt", prompt,
         "--resolution", resolution,
@@ -593,6 +890,12 @@ def build_cmd_from_job(job):
         cmd.append("--low_vram")
     elif offload:
         cmd.append("--offload")
+    if output_path:
+        cmd += ["--output_path", output_path]
+    if manifest_path:
+        cmd += ["--manifest_path", manifest_path]
+    # generate_video.py decide quais tasks usam (CHECKPOINT_TASKS); as outras ignoram
+    cmd += ["--checkpoint_dir", str(CHECKPOINT_DIR)]
 
     # Task-specific params
     if task_type == "reference_to_video":
@@ -646,69 +949,461 @@ def build_cmd_from_job(job):
     return cmd, env_extra, metadata
 
 
-def start_next_queued_job():
-    """Called when a generation finishes. Picks the next pending job."""
-    if generation_state["running"]:
+# ---- Scheduling policy ----
+# Cada família corresponde a um checkpoint diferente; trocar de família entre cenas
+# significa recarregar (ou trocar no worker persistente) 14B/19B de pesos.
+MODEL_FAMILY = {
+    "reference_to_video": "Reference2Video",
+    "single_shot_extension": "Video-Extension",
+    "shot_switching_extension": "Video-Extension",
+    "talking_avatar": "A2V-19B",
+}
+SCHEDULER_POLICIES = ("fifo", "affinity")
+
+
+def _model_family(job):
+    return MODEL_FAMILY.get(job.get("task_type", ""), job.get("task_type", ""))
+
+
+def _nq_job_deps(job, jobs):
+    """Índices (0-based) dos jobs da fila cujo output este job consome via
+    {{prev}}, {{job:N}} ou result/<task>/<seed>_<timestamp>.mp4."""
+    idx = job.get("nq_job_index", 0)
+    deps = set()
+    for field in ("input_video", "input_image", "input_audio"):
+        value = job.get(field)
+        if not value or not isinstance(value, str):
+            continue
+        if _RE_PREV.match(value):
+            if idx > 0:
+                deps.add(idx - 1)
+            continue
+        m = _RE_JOB_IDX.match(value)
+        if m:
+            deps.add(int(m.group(1)))
+            continue
+        m = _RE_SEED_TS.search(value)
+        if m:
+            # jobs pode ser só um subconjunto da fila (_simulate_model_swaps passa as
+            # pendentes): o índice é o nq_job_index, não a posição na lista
+            for i, j in enumerate(jobs):
+                j_idx = j.get("nq_job_index", i)
+                if str(j.get("seed", "")) == m.group(1) and j_idx != idx:
+                    deps.add(j_idx)
+    return deps
+
+
+def _nq_job_ready(job, nq):
+    """True se nenhuma referência do job aponta para uma cena ainda pendente/rodando.
+    Mesma semântica de _resolve_nq_refs: {{prev}} anda pra trás pulando cenas sem output."""
+    if not nq:
+        return True
+    jobs = nq.get("jobs", [])
+    idx = job.get("nq_job_index", 0)
+    busy = ("pending", "running")
+    for field in ("input_video", "input_image", "input_audio"):
+        value = job.get(field)
+        if not value or not isinstance(value, str):
+            continue
+        if _RE_PREV.match(value):
+            for back_idx in range(min(idx, len(jobs)) - 1, -1, -1):
+                if jobs[back_idx]["status"] in busy:
+                    return False
+                if jobs[back_idx].get("output_video"):
+                    break
+            continue
+        m = _RE_JOB_IDX.match(value)
+        if m:
+            ref_idx = int(m.group(1))
+            if 0 <= ref_idx < len(jobs) and ref_idx != idx and jobs[ref_idx]["status"] in busy:
+                return False
+            continue
+        m = _RE_SEED_TS.search(value)
+        if m:
+            if any(str(j.get("seed", "")) == m.group(1) and j["status"] in busy
+                   for j in jobs if j is not job):
+                return False
+    return True
+
+
+def _simulate_model_swaps(jobs, policy, start_families=(None,)):
+    """Conta trocas de família de modelo executando `jobs` pela política, uma por
+    worker como em _start_job_on_worker. start_families: a família carregada em cada
+    worker. Roda em rodadas — cada worker pega uma cena pronta e todas terminam juntas —
+    e usa só as dependências estáticas (_nq_job_deps): é uma estimativa."""
+    remaining = list(jobs)
+    in_run = {j.get("nq_job_index") for j in jobs}
+    done = set()
+    families = list(start_families) or [None]
+    swaps = 0
+    while remaining:
+        ready = [
+            j for j in remaining
+            if all(d in done or d not in in_run for d in _nq_job_deps(j, jobs))
+        ] or remaining[:1]
+        finished = []
+        for w, family in enumerate(families):
+            if not ready:
+                break
+            pick = ready[0]
+            if policy == "affinity" and family is not None:
+                pick = next((j for j in ready if _model_family(j) == family), ready[0])
+            if family is not None and _model_family(pick) != family:
+                swaps += 1
+            families[w] = _model_family(pick)
+            ready.remove(pick)
+            remaining.remove(pick)
+            finished.append(pick.get("nq_job_index"))
+        done.update(finished)
+    return swaps
+
+
+def _scheduler_policy_for(nq, config=None):
+    if nq and nq.get("_policy"):
+        return nq["_policy"]
+    if config is None:
+        config = _load_global_config()
+    policy = config.get("scheduler_policy", "fifo")
+    return policy if policy in SCHEDULER_POLICIES else "fifo"
+
+
+def _pick_next_job(worker, config):
+    """Escolhe o próximo job pendente de job_queue pro worker (chamar com job_queue_lock;
+    config é o _load_global_config() lido antes do lock).
+    Cena de fila só sai quando as cenas que ela referencia ({{prev}}, {{job:N}}, seed)
+    terminaram (DAG); cenas independentes ocupam workers em paralelo.
+    fifo: primeira cena pronta. affinity: entre as prontas da mesma fila, prefere
+    a família de modelo já carregada no worker; só troca quando o grupo esvazia."""
+    pending = [j for j in job_queue if j["status"] == "pending"]
+    if not pending:
+        return None, None
+    queues = {}
+    with nq_lock:
+        for j in pending:
+            if j.get("nq_id") is not None and j["nq_id"] not in queues:
+                queues[j["nq_id"]] = next((q for q in named_queues if q["id"] == j["nq_id"]), None)
+        ready = [j for j in pending if _nq_job_ready(j, queues.get(j.get("nq_id")))]
+    if not ready:
+        if _any_worker_running():
+            return None, None  # espera as dependências em execução
+        # Ciclo de referências: nada vai liberar sozinho, segue a ordem da fila
+        ready = pending[:1]
+    head = ready[0]
+    nq = queues.get(head.get("nq_id"))
+    candidates = ready
+    if nq is not None and _scheduler_policy_for(nq, config) == "affinity":
+        same_queue = [j for j in ready if j.get("nq_id") == nq["id"]]
+        pick = next((j for j in same_queue if _model_family(j) == worker["last_family"]), head)
+        candidates = [pick] + [j for j in ready if j is not pick]
+
+    # Admissão por memória: a primeira candidata que cabe nas GPUs do worker ao lado
+    # do que já roda nelas; se nenhuma cabe, o worker espera alguém terminar.
+    default_mode = config.get("memory_mode")
+    for job in candidates:
+        admission = _admit_job(job, worker, default_mode)
+        if admission:
+            job["_admission"] = admission
+            return job, queues.get(job.get("nq_id"))
+    return None, None
+
+
+def _nq_dependents(nq, failed_idx):
+    """Índices de todas as cenas que dependem (direta ou transitivamente) de failed_idx."""
+    jobs = nq.get("jobs", [])
+    children = {}
+    for j in jobs:
+        for d in _nq_job_deps(j, jobs):
+            children.setdefault(d, set()).add(j.get("nq_job_index"))
+    found, stack = set(), [failed_idx]
+    while stack:
+        for child in children.get(stack.pop(), ()):
+            if child not in found and child != failed_idx:
+                found.add(child)
+                stack.append(child)
+    return found
+
+
+def _nq_dag(nq):
+    """Grafo de dependências da fila: por cena, deps e nível (cenas do mesmo nível
+    podem rodar em paralelo). Cenas presas num ciclo ficam com level None."""
+    jobs = nq.get("jobs", [])
+    deps = {j.get("nq_job_index", i): _nq_job_deps(j, jobs) for i, j in enumerate(jobs)}
+    level = {}
+    changed = True
+    while changed:
+        changed = False
+        for idx, ds in deps.items():
+            if idx in level:
+                continue
+            known = [d for d in ds if d in deps]
+            if all(d in level for d in known):
+                level[idx] = 1 + max((level[d] for d in known), default=-1)
+                changed = True
+    nodes = []
+    for i, j in enumerate(jobs):
+        idx = j.get("nq_job_index", i)
+        nodes.append({
+            "index": idx,
+            "id": j["id"],
+            "label": j.get("label", ""),
+            "task_type": j.get("task_type", ""),
+            "family": _model_family(j),
+            "status": j["status"],
+            "deps": sorted(deps[idx]),
+            "level": level.get(idx),
+            "ready": j["status"] in ("idle", "pending") and _nq_job_ready(j, nq),
+        })
+    levels = {}
+    for n in nodes:
+        if n["level"] is not None:
+            levels.setdefault(n["level"], []).append(n["index"])
+    return {
+        "nodes": nodes,
+        "levels": [levels[k] for k in sorted(levels)],
+        "cycle": sorted(n["index"] for n in nodes if n["level"] is None),
+        "max_parallel": max((len(v) for v in levels.values()), default=0),
+    }
+
+
+# ---- Admissão por memória da GPU ----
+# Antes do dispatch, o pico de VRAM do job é estimado (webui/memory_model.py, calibrado
+# pelos picos medidos) e comparado com a memória das GPUs do worker menos o que os
+# outros workers nas mesmas placas reservaram ("0;0" = dois workers na GPU 0).
+# "memory_mode": "auto" (no job ou no /config) escolhe o modo mais rápido que cabe.
+memory_model = MemoryModel(MEMORY_DB)
+MEM_HEADROOM_GB = float(os.environ.get("SKYREELS_MEM_HEADROOM_GB", "2"))
+
+
+def _worker_devices(worker):
+    return worker["devices"].split(",") if worker["devices"] else ["0"]
+
+
+def _gpu_total_gb(worker):
+    """Memória (GB) da menor GPU do worker; None se desconhecida (sem nvidia-smi e sem
+    SKYREELS_GPU_MEM_GB) — nesse caso não há admissão, como antes."""
+    override = os.environ.get("SKYREELS_GPU_MEM_GB")
+    if override:
+        return float(override)
+    _gpu_name(worker)   # preenche o cache do nvidia-smi
+    sizes = [_gpu_mem_gb.get(d) for d in _worker_devices(worker)]
+    return min(sizes) if all(sizes) else None
+
+
+def _flags_memory_mode(job):
+    if job.get("low_vram"):
+        return "low_vram"
+    if job.get("offload", True):
+        return "offload"
+    return "gpu"
+
+
+def _requested_memory_mode(job, default=None):
+    """"auto" ou um de MEMORY_MODES: memory_mode do job, senão o do /config, senão as
+    flags offload/low_vram do job."""
+    mode = job.get("memory_mode") or default
+    return mode if mode == "auto" or mode in MEMORY_MODES else _flags_memory_mode(job)
+
+
+def _mem_task_res(job):
+    task = job.get("task_type", "reference_to_video")
+    res = job.get("resolution", "540P")
+    if task == "talking_avatar" and res == "540P":
+        res = "480P"
+    return task, res
+
+
+def _mem_reserved_gb(worker):
+    """VRAM reservada pelos jobs dos outros workers que dividem GPU com este."""
+    devices = set(_worker_devices(worker))
+    return sum(w["mem_reserved_gb"] for w in gpu_workers
+               if w is not worker and w["state"]["running"] and devices & set(_worker_devices(w)))
+
+
+def _admit_job(job, worker, default_mode=None):
+    """(modo, estimativa_gb, modo pedido) com que o job cabe no worker agora, ou None.
+    Com as GPUs do worker vazias o job sempre entra (no modo mais econômico permitido),
+    senão um job maior que a placa travaria a fila."""
+    task, res = _mem_task_res(job)
+    duration = job.get("duration", 5) or 5
+    gpu = _gpu_name(worker)
+    requested = _requested_memory_mode(job, default_mode)
+    modes = MEMORY_MODES if requested == "auto" else (requested,)
+    total = _gpu_total_gb(worker)
+    if total is None:
+        mode = "offload" if requested == "auto" else requested
+        return mode, memory_model.estimate(task, res, duration, mode, gpu), requested
+    reserved = _mem_reserved_gb(worker)
+    free = total - reserved - MEM_HEADROOM_GB
+    for mode in modes:
+        estimate = memory_model.estimate(task, res, duration, mode, gpu)
+        if estimate <= free:
+            return mode, estimate, requested
+    if reserved == 0:
+        return modes[-1], memory_model.estimate(task, res, duration, modes[-1], gpu), requested
+    return None
+
+
+def _record_job_memory(job, worker, manifest):
+    """Guarda no job o pico medido (manifest) e calibra o estimador com ele."""
+    peak = (manifest or {}).get("peak_memory") or {}
+    if not peak.get("reserved_gb"):
         return
-    with job_queue_lock:
-        for job in job_queue:
-            if job["status"] == "pending":
-                job["status"] = "running"
-                job["started_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
-                # Resolve named-queue references ({{prev}}, {{job:N}}, <timestamp>)
-                nq = None
-                if job.get("nq_id") is not None:
-                    with nq_lock:
-                        nq = next((q for q in named_queues if q["id"] == job["nq_id"]), None)
-                effective_job = _resolve_nq_refs(job, nq)
-                cmd, env_extra, metadata = build_cmd_from_job(effective_job)
-                thread = threading.Thread(
-                    target=run_generation,
-                    args=(cmd, env_extra, metadata, job),
-                    daemon=True,
-                )
-                thread.start()
-                return
+    memory = job.setdefault("memory", {})
+    memory["peak_gb"] = peak["reserved_gb"]
+    memory["peak_allocated_gb"] = peak.get("allocated_gb")
+    task, res = _mem_task_res(job)
+    mode = memory.get("mode") or _flags_memory_mode(job)
+    gpu = manifest.get("gpu") or _gpu_name(worker)
+    raw = raw_estimate_gb(task, res, job.get("duration", 5) or 5, mode)
+    try:
+        memory_model.record(MemoryModel.key(task, res, mode, gpu), raw, peak["reserved_gb"])
+    except Exception as e:
+        print(f"[mem] não consegui gravar o pico do job {job.get('id')}: {e}")
+
+
+@app.route("/memory")
+def memory_stats_route():
+    """Memória por worker (total, reservada) e calibração do estimador. Com
+    ?task_type=&resolution=&duration=, estimativa por modo para essa cena."""
+    out = {
+        "headroom_gb": MEM_HEADROOM_GB,
+        "workers": [{"id": w["id"], "devices": w["devices"], "total_gb": _gpu_total_gb(w),
+                     "reserved_gb": round(w["mem_reserved_gb"], 1) if w["state"]["running"] else 0.0}
+                    for w in gpu_workers],
+        "calibration": memory_model.stats(),
+    }
+    if request.args.get("task_type"):
+        task, res = _mem_task_res(request.args)
+        duration = request.args.get("duration", 5, type=int)
+        gpu = _gpu_name()
+        out["estimate_gb"] = {m: round(memory_model.estimate(task, res, duration, m, gpu), 1)
+                              for m in MEMORY_MODES}
+    return jsonify(out)
+
+
+def _start_job_on_worker(worker, job, nq):
+    """Marca o job como running e sobe a thread no worker (chamar com job_queue_lock).
+    False se a cena deixou de estar pendente (cancelada pelo _nq_job_done_hook)."""
+    # Status de cena muda sob nq_lock. Ordem dos locks: job_queue_lock → nq_lock,
+    # a mesma de _pick_next_job.
+    with nq_lock:
+        if job["status"] != "pending":
+            job.pop("_admission", None)
+            return False
+        job["status"] = "running"
+    mode, estimate_gb, requested = job.pop("_admission", None) or _admit_job(job, worker)
+    total = _gpu_total_gb(worker)
+    if total is not None and estimate_gb > total - MEM_HEADROOM_GB:
+        print(f"[mem] job {job['id']}: estimativa {estimate_gb:.1f} GB não cabe em "
+              f"{total:.0f} GB nem vazia — rodando em {mode} mesmo assim")
+    job["memory"] = {"requested": requested, "mode": mode, "estimate_gb": round(estimate_gb, 1)}
+    worker["mem_reserved_gb"] = estimate_gb
+    job["started_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    queued_ts = job.pop("_queued_ts", None)
+    if queued_ts:
+        METRIC_QUEUE_WAIT.labels(job.get("task_type", "")).observe(time.time() - queued_ts)
+    family = _model_family(job)
+    if nq is not None and nq.get("_sched") is not None:
+        if worker["last_family"] is not None and family != worker["last_family"]:
+            nq["_sched"]["actual_swaps"] += 1
+    worker["last_family"] = family
+    # Reserva o worker antes da thread subir, senão o próximo dispatch o vê livre
+    worker["state"]["running"] = True
+    worker["state"]["start_event_id"] = None   # o evento "start" sai em run_generation
+    # Resolve named-queue references ({{prev}}, {{job:N}}, <timestamp>)
+    effective_job = _resolve_nq_refs(job, nq)
+    effective_job = dict(effective_job, offload=mode != "gpu", low_vram=mode == "low_vram")
+    job["_output_path"], job["_manifest_path"] = _job_output_paths(
+        job, (nq or {}).get("project", "") or "")
+    cmd, env_extra, metadata = build_cmd_from_job(
+        effective_job, job["_output_path"], job["_manifest_path"])
+    if worker["devices"] is not None:
+        env_extra = dict(env_extra or {})
+        env_extra["CUDA_VISIBLE_DEVICES"] = worker["devices"]
+    thread = threading.Thread(
+        target=run_generation,
+        args=(cmd, env_extra, metadata, job, worker),
+        daemon=True,
+    )
+    thread.start()
+    return True
+
 
+def start_next_queued_job():
+    """Dispatcher: preenche cada worker ocioso com o próximo job pendente.
+    Chamado ao enfileirar e quando um job termina."""
+    # Disco (/config) e nvidia-smi (cache de _gpu_name, usado na admissão) fora do
+    # job_queue_lock
+    config = _load_global_config()
+    _gpu_name()
+    with _dispatch_lock:
+        for worker in gpu_workers:
+            if worker["state"]["running"]:
+                continue
+            with job_queue_lock:
+                job, nq = _pick_next_job(worker, config)
+                if job is None:
+                    continue   # nada pronto, ou nada cabe nas GPUs deste worker
+                _start_job_on_worker(worker, job, nq)
+
+
+# ---- Webhooks (outbox) ----
+# Entregas gravadas em uploads/queues.db antes de sair (webui/webhook_outbox.py): um restart
+# não perde callbacks. Uma thread de entrega, keep-alive por destino, no máximo
+# SKYREELS_WEBHOOK_PER_ENDPOINT envios simultâneos por destino e backoff exponencial até
+# SKYREELS_WEBHOOK_MAX_ATTEMPTS tentativas. Entregas terminadas saem após 7 dias.
+def _webhook_outcome(outcome):
+    if outcome == "retry":
+        METRIC_WEBHOOK_RETRIES.inc()
+    else:
+        METRIC_WEBHOOKS.labels(outcome).inc()
 
-def _fire_webhook(url, payload):
-    """POSTa payload pro callback_url em thread separada. 3 retries com backoff
-    exponencial (1s, 2s, 4s) em timeout/conn-error/5xx. 4xx não é retry-able."""
-    import urllib.request as urllib_req
-    import urllib.error as urllib_err
 
-    def _send():
-        body = json.dumps(payload).encode("utf-8")
-        delay = 1.0
-        for attempt in range(1, 4):
-            try:
-                req = urllib_req.Request(
-                    url, data=body,
-                    headers={"Content-Type": "application/json"},
-                    method="POST",
-                )
-                with urllib_req.urlopen(req, timeout=10) as resp:
-                    code = resp.status
-                    if 200 <= code < 300:
-                        print(f"[webhook] ok → {url} (attempt {attempt}, {code})")
-                        return
-                    if 400 <= code < 500:
-                        print(f"[webhook] {code} (no retry) → {url}")
-                        return
-                    print(f"[webhook] {code} (retry) → {url}")
-            except urllib_err.HTTPError as e:
-                if 400 <= e.code < 500:
-                    print(f"[webhook] {e.code} (no retry) → {url}")
-                    return
-                print(f"[webhook] HTTPError {e.code} attempt {attempt}")
-            except Exception as e:
-                print(f"[webhook] exception attempt {attempt}: {e}")
-            if attempt < 3:
-                time.sleep(delay)
-                delay *= 2
-        print(f"[webhook] GAVE UP after 3 attempts → {url}")
-
-    threading.Thread(target=_send, daemon=True).start()
+webhook_outbox = WebhookOutbox(
+    QUEUES_DB,
+    max_attempts=int(os.environ.get("SKYREELS_WEBHOOK_MAX_ATTEMPTS", "10")),
+    max_delay=float(os.environ.get("SKYREELS_WEBHOOK_MAX_DELAY", "600")),
+    per_endpoint=int(os.environ.get("SKYREELS_WEBHOOK_PER_ENDPOINT", "2")),
+    on_outcome=_webhook_outcome,
+)
+webhook_outbox.prune(7 * 86400)
+webhook_outbox.start()
+
+
+def _fire_webhook(url, payload, event=None, queue_id=None):
+    """Coloca o POST do payload no outbox; a thread de entrega cuida de retries
+    (timeout/conexão/5xx/408/429). 4xx não é retry-able. Retorna o id da entrega."""
+    return webhook_outbox.enqueue(url, payload, event=event, queue_id=queue_id)
+
+
+@app.route("/webhooks")
+def list_webhooks_route():
+    """Entregas de webhook, mais recentes primeiro (?status=pending|sending|delivered|rejected|failed,
+    ?queue_id=N, ?limit=100)."""
+    return jsonify({
+        "counts": webhook_outbox.counts(),
+        "deliveries": webhook_outbox.list(
+            status=request.args.get("status") or None,
+            queue_id=request.args.get("queue_id", type=int),
+            limit=min(request.args.get("limit", 100, type=int), 1000),
+        ),
+    })
+
+
+@app.route("/webhooks/<int:delivery_id>")
+def get_webhook_route(delivery_id):
+    delivery = webhook_outbox.get(delivery_id)
+    if delivery is None:
+        return jsonify({"error": "Entrega não encontrada"}), 404
+    return jsonify(delivery)
+
+
+@app.route("/webhooks/<int:delivery_id>/retry", methods=["POST"])
+def retry_webhook_route(delivery_id):
+    """Reenvia uma entrega failed/rejected (tentativas zeradas)."""
+    if not webhook_outbox.retry(delivery_id):
+        return jsonify({"error": "Entrega não encontrada ou ainda em andamento"}), 409
+    return jsonify({"ok": True, "id": delivery_id})
 
 
 def _build_nq_webhook_payload(nq):
@@ -737,55 +1432,83 @@ def _build_nq_webhook_payload(nq):
         "duration_s": duration_s,
         "output_videos": output_videos,
         "failed_jobs": failed_jobs,
+        # cenas não executadas porque dependiam de uma cena que falhou
+        "cancelled_jobs": sorted(nq.get("_cancelled", [])),
+        "scheduling": nq.get("last_run_sched"),
     }
 
 
 def _nq_job_done_hook(job):
-    """Called after each job finishes. Stops the queue on error; marks done when all finish."""
+    """Called after each job finishes. On error cancels only the scenes that depend on
+    the failed one; the queue turns done/error when nothing is pending or running."""
     nq_id = job.get("nq_id")
     if nq_id is None:
         return
     terminal_status = None
     webhook_url = None
     payload = None
+    cancelled = []
     with nq_lock:
         nq = next((q for q in named_queues if q["id"] == nq_id), None)
         if nq is None:
             return
-        # If this job failed, cancel all remaining pending jobs for this queue
+        # If this job failed, cancel only the pending scenes that consume its output
         if job.get("status") == "error":
-            with job_queue_lock:
-                for j in nq["jobs"]:
-                    if j["status"] == "pending":
-                        j["status"] = "idle"
-                        # Remove from global job_queue so they won't start
-                        if j in job_queue:
-                            job_queue.remove(j)
-            nq["status"] = "error"
-            terminal_status = "error"
-        else:
-            still_active = any(j["status"] in ("pending", "running") for j in nq["jobs"])
+            nq["_run_failed"] = True
+            dependents = _nq_dependents(nq, job.get("nq_job_index"))
+            for j in nq["jobs"]:
+                if j["status"] == "pending" and j.get("nq_job_index") in dependents:
+                    # idle já impede o start (_start_job_on_worker confere sob nq_lock);
+                    # a remoção de job_queue vem depois, fora do nq_lock
+                    j["status"] = "idle"
+                    nq.setdefault("_cancelled", []).append(j.get("nq_job_index"))
+                    cancelled.append(j)
+            if dependents:
+                print(f"[dag] fila {nq_id}: cena {job.get('nq_job_index')} falhou → "
+                      f"{len(nq.get('_cancelled', []))} dependente(s) cancelada(s)")
+        still_active = any(j["status"] in ("pending", "running") for j in nq["jobs"])
+        if not still_active:
             all_finished = all(j["status"] in ("done", "error") for j in nq["jobs"])
-            if not still_active:
-                if all_finished:
-                    any_error = any(j["status"] == "error" for j in nq["jobs"])
-                    nq["status"] = "error" if any_error else "done"
-                    terminal_status = nq["status"]
-                else:
-                    nq["status"] = "idle"  # some jobs still idle
+            if nq.pop("_run_failed", False):
+                nq["status"] = "error"
+                terminal_status = "error"
+            elif all_finished:
+                any_error = any(j["status"] == "error" for j in nq["jobs"])
+                nq["status"] = "error" if any_error else "done"
+                terminal_status = nq["status"]
+            else:
+                nq["status"] = "idle"  # some jobs still idle
         if terminal_status:
+            sched = nq.pop("_sched", None)
+            if sched is not None:
+                sched["swaps_saved"] = sched["fifo_swaps"] - sched["actual_swaps"]
+                nq["last_run_sched"] = sched
+                print(f"[sched] fila {nq_id} ({sched['policy']}): {sched['actual_swaps']} troca(s) "
+                      f"de modelo, FIFO seriam {sched['fifo_swaps']} → economia {sched['swaps_saved']}")
+            nq.pop("_policy", None)
             webhook_url = nq.pop("_callback_url", None)
             if webhook_url:
                 payload = _build_nq_webhook_payload(nq)
             nq.pop("_started_ts", None)
-    _save_queues()
+            nq.pop("_cancelled", None)
+    if cancelled:
+        # Ordem dos locks: job_queue_lock nunca é tomado com nq_lock na mão
+        with job_queue_lock:
+            for j in cancelled:
+                if j in job_queue:
+                    job_queue.remove(j)
+    _save_queue(nq_id)
     if webhook_url and payload:
-        _fire_webhook(webhook_url, payload)
+        _fire_webhook(webhook_url, payload, event="queue", queue_id=nq_id)
 
 
-def run_named_queue(nq_id, callback_url=None):
-    """Schedule all idle jobs of a named queue for sequential execution.
-    Se callback_url for passado, dispara webhook quando a fila terminar."""
+def run_named_queue(nq_id, callback_url=None, policy=None):
+    """Schedule all idle jobs of a named queue. Scenes are released as their
+    {{prev}}/{{job:N}} inputs finish, so independent ones can use several workers.
+    Se callback_url for passado, dispara webhook quando a fila terminar.
+    policy: "fifo" (padrão) ou "affinity" (agrupa cenas por família de modelo,
+    respeitando {{prev}}/{{job:N}}); None usa scheduler_policy do /config."""
+    config = _load_global_config()   # I/O fora do nq_lock
     with nq_lock:
         nq = next((q for q in named_queues if q["id"] == nq_id), None)
         if nq is None or nq["status"] == "running":
@@ -797,16 +1520,31 @@ def run_named_queue(nq_id, callback_url=None):
         nq["_started_ts"] = time.time()
         if callback_url:
             nq["_callback_url"] = callback_url
+        if policy in SCHEDULER_POLICIES:
+            nq["_policy"] = policy
+        effective_policy = _scheduler_policy_for(nq, config=config)
+        # Mesma base do actual_swaps: a família carregada em cada worker do pool
+        families = [w["last_family"] for w in gpu_workers]
+        fifo_swaps = _simulate_model_swaps(pending_jobs, "fifo", families)
+        nq["_sched"] = {
+            "policy": effective_policy,
+            "fifo_swaps": fifo_swaps,
+            "estimated_swaps": _simulate_model_swaps(pending_jobs, effective_policy, families),
+            "actual_swaps": 0,
+        }
         for j in pending_jobs:
             j["status"] = "pending"
+            j["_queued_ts"] = time.time()
+        dag = _nq_dag(nq)
+    print(f"[dag] fila {nq_id}: {len(pending_jobs)} cena(s), {len(dag['levels'])} nível(is), "
+          f"até {dag['max_parallel']} em paralelo")
 
     with job_queue_lock:
         for j in pending_jobs:
             if not any(ex["id"] == j["id"] for ex in job_queue):
                 job_queue.append(j)
 
-    if not generation_state["running"]:
-        start_next_queued_job()
+    start_next_queued_job()
     return True
 
 
@@ -820,6 +1558,7 @@ def run_single_nq_job_fn(nq_id, job_id):
         if job is None or job["status"] in ("running", "pending"):
             return False
         job["status"] = "pending"
+        job["_queued_ts"] = time.time()
         if nq["status"] == "idle":
             nq["status"] = "running"
 
@@ -827,79 +1566,284 @@ def run_single_nq_job_fn(nq_id, job_id):
         if not any(j["id"] == job_id for j in job_queue):
             job_queue.append(job)
 
-    if not generation_state["running"]:
-        start_next_queued_job()
+    start_next_queued_job()
     return True
 
 
-def run_generation(cmd, env_extra=None, metadata=None, job=None):
-    generation_state["running"] = True
-    generation_state["log"] = []
-    generation_state["progress"] = 0
-    generation_state["status"] = "running"
-    generation_state["last_video"] = None
-    generation_state["current_job_id"] = job["id"] if job else None
+def _worker_socket_for(worker):
+    """Socket do worker persistente deste worker do pool. "{worker}" no caminho vira o id
+    (um generate_worker.py por GPU); sem o placeholder, só o worker 0 usa o socket."""
+    if not WORKER_SOCKET or GENERATOR_CMD:
+        return None
+    if "{worker}" in WORKER_SOCKET:
+        return WORKER_SOCKET.replace("{worker}", str(worker["id"]))
+    return WORKER_SOCKET if worker["id"] == 0 else None
 
-    # Named queue progress info
+
+def _ping_warm_worker(sock_path):
+    """Resposta do ping do generate_worker.py ({"pong", "busy", "resident", "devices"})
+    ou None se ninguém responde no socket."""
+    if not sock_path or not os.path.exists(sock_path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(1)
+            s.connect(sock_path)
+            s.sendall(b'{"ping": true}\n')
+            with s.makefile("r", encoding="utf-8") as f:
+                reply = json.loads(f.readline() or "{}")
+    except (OSError, ValueError):
+        return None
+    pong = reply.get("result") if isinstance(reply, dict) else None
+    return pong if isinstance(pong, dict) and pong.get("pong") else None
+
+
+def _warm_worker_matches(worker, pong):
+    """O generate_worker.py recusa job com outro CUDA_VISIBLE_DEVICES (não muda depois
+    que o CUDA inicia): só serve ao worker do pool se subiu com as mesmas GPUs."""
+    return worker["devices"] is None or pong.get("devices") == worker["devices"]
+
+
+def _warm_worker_available(worker=None):
+    """True se o generate_worker.py do worker (padrão: worker 0) responde e roda nas
+    GPUs desse worker."""
+    worker = worker or gpu_workers[0]
+    pong = _ping_warm_worker(_worker_socket_for(worker))
+    return pong is not None and _warm_worker_matches(worker, pong)
+
+
+def _close_phase(state, now=None):
+    """Registra nas métricas a duração da fase corrente do worker (e o tempo por passo
+    do denoise). Chamado a cada troca de fase e no fim do job."""
+    phase, started = state.get("phase"), state.get("phase_started_ts")
+    if phase and phase != "done" and started:
+        elapsed = (now or time.time()) - started
+        task = state.get("task_type") or ""
+        METRIC_PHASE_SECONDS.labels(task, phase).observe(elapsed)
+        if phase == "denoise" and state.get("phase_steps"):
+            METRIC_STEP_SECONDS.labels(task).observe(elapsed / state["phase_steps"])
+    state["phase_started_ts"] = None
+    state["phase_steps"] = 0
+
+
+def _apply_progress_event(state, event):
+    """Atualiza o estado do worker com um evento de skyreels_v3.utils.progress."""
+    if not isinstance(event, dict):
+        return
+    if isinstance(event.get("percent"), (int, float)):
+        state["progress"] = int(event["percent"])
+    phase = event.get("phase", state.get("phase"))
+    # Troca de fase (ou novo clip recomeçando o denoise): fecha a fase anterior
+    step = event.get("step") if isinstance(event.get("step"), int) else None
+    restarted = phase == state.get("phase") and step is not None and step < state.get("phase_steps", 0)
+    if phase != state.get("phase") or restarted:
+        now = time.time()
+        _close_phase(state, now)
+        state["phase_started_ts"] = now
+    if step is not None:
+        state["phase_steps"] = step
+    state["phase"] = phase
+    state["eta_s"] = event.get("eta")
+    state["clip"] = event.get("clip")
+    state["clips"] = event.get("clips")
+    if event.get("total"):
+        state["total"] = event["total"]
+
+
+def _read_progress_pipe(fd, on_progress):
+    """Lê os eventos JSON-lines do SKYREELS_PROGRESS_FD até o processo fechar o pipe."""
+    with os.fdopen(fd, "r", encoding="utf-8", errors="replace") as f:
+        for raw in f:
+            try:
+                on_progress(json.loads(raw))
+            except ValueError:
+                continue
+
+
+def _run_via_worker(sock_path, cmd, on_line, on_progress=None, env_extra=None):
+    """Envia o job (mesmo argv do generate_video.py) ao worker persistente.
+    Retorna (returncode, result_manifest|None). on_line recebe cada linha de log
+    e on_progress cada evento de progresso. env_extra (ex.: PYTORCH_CUDA_ALLOC_CONF
+    do low_vram) vai junto e o worker aplica só durante o job."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.connect(sock_path)
+        request = {"args": cmd[len(_generator_prefix()):]}
+        if env_extra:
+            request["env"] = env_extra
+        s.sendall((json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8"))
+        with s.makefile("r", encoding="utf-8") as f:
+            for raw in f:
+                try:
+                    msg = json.loads(raw)
+                except ValueError:
+                    continue
+                if "log" in msg:
+                    on_line(msg["log"])
+                elif "progress" in msg:
+                    if on_progress:
+                        on_progress(msg["progress"])
+                elif "result" in msg:
+                    return 0, msg["result"]
+                elif "error" in msg:
+                    on_line(f"ERROR: {msg['error']}")
+                    return 1, None
+    # conexão caiu no meio do job (worker morreu / OOM)
+    on_line("ERROR: worker persistente encerrou a conexão sem resultado")
+    return 1, None
+
+
+def _read_job_manifest(job):
+    path = job.get("_manifest_path") if job else None
+    if not path:
+        return None
+    try:
+        return json.loads((PROJECT_ROOT / path).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _find_job_output(job):
+    """mp4 gerado pelo job no modo subprocess. generate_video.py grava
+    result/<task>/<seed>_<timestamp>.mp4; com vários workers terminando juntos,
+    "o mp4 mais recente de result/" pode ser o de outro job. Só o diretório da
+    task é relido — o resto do result/ já está no índice."""
+    if job:
+        task = job.get("task_type", "")
+        media_index.sync_dir(RESULT_DIR / task)
+        entry = media_index.latest_for_seed(task, job.get("seed", 42))
+        if entry:
+            return PROJECT_ROOT / entry["path"]
+    entry = media_index.latest()
+    return PROJECT_ROOT / entry["path"] if entry else None
+
+
+def run_generation(cmd, env_extra=None, metadata=None, job=None, worker=None):
+    if worker is None:
+        worker = gpu_workers[0]
+    worker_id = worker["id"]
+    state = worker["state"]
+    state["running"] = True
+    _log_clear(state)
+    state["progress"] = 0
+    state["phase"] = None
+    state["eta_s"] = None
+    state["clip"] = state["clips"] = None
+    state["status"] = "running"
+    state["last_video"] = None
+    state["current_job_id"] = job["id"] if job else None
+    state["started_ts"] = time.time()
+    state["phase_started_ts"] = None
+    state["phase_steps"] = 0
+    state["task_type"] = (job or metadata or {}).get("task_type", "")
+    if job:
+        job["worker"] = worker_id
+    job_id = job["id"] if job else None
     nq_id = job.get("nq_id") if job else None
+    state["start_event_id"] = event_bus.publish(type="start", worker=worker_id, job_id=job_id, nq_id=nq_id)
+
+    # Named queue progress info
     if nq_id is not None:
         with nq_lock:
             nq = next((q for q in named_queues if q["id"] == nq_id), None)
             if nq:
                 idx = next((i + 1 for i, j in enumerate(nq["jobs"]) if j["id"] == job["id"]), 1)
                 total = len(nq["jobs"])
-                generation_state["current_nq_id"]   = nq_id
-                generation_state["current_nq_name"] = nq["name"]
-                generation_state["current_nq_scene"] = f"Cena {idx}/{total} — {job.get('label', '')}"
+                state["current_nq_id"]   = nq_id
+                state["current_nq_name"] = nq["name"]
+                state["current_nq_scene"] = f"Cena {idx}/{total} — {job.get('label', '')}"
     else:
-        generation_state["current_nq_id"]   = None
-        generation_state["current_nq_name"] = None
-        generation_state["current_nq_scene"] = None
+        state["current_nq_id"]   = None
+        state["current_nq_name"] = None
+        state["current_nq_scene"] = None
 
     env = os.environ.copy()
     env["PYTHONUNBUFFERED"] = "1"
     if env_extra:
         env.update(env_extra)
 
-    try:
-        proc = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1,
-            cwd=str(PROJECT_ROOT),
-            env=env,
-        )
+    job_log = _open_job_log(job_id, worker_id) if job_id is not None else None
 
-        for line in proc.stdout:
-            line = line.rstrip()
-            if not line:
-                continue
-
-            generation_state["log"].append(line)
-            log_queue.put(line)
+    def on_line(line):
+        line = line.rstrip()
+        if not line:
+            return
 
-            # Parse progress from tqdm output e.g. " 25%|██▌  | 2/8"
-            if "/8 [" in line or "/4 [" in line:
-                try:
-                    part = line.strip().split("|")[0].strip().rstrip("%")
-                    pct = int(part)
-                    generation_state["progress"] = pct
-                except Exception:
-                    pass
+        _log_append(state, line)
+        if job_log is not None:
+            job_log.handle(logging.makeLogRecord({"msg": line}))
+        event_bus.publish(type="log", worker=worker_id, job_id=job_id, nq_id=nq_id, line=line)
 
-        proc.wait()
+    def on_progress(event):
+        _apply_progress_event(state, event)
 
-        if proc.returncode == 0:
-            generation_state["status"] = "done"
+    try:
+        worker_result = None
+        sock_path = _worker_socket_for(worker)
+        if worker["devices"] is not None:
+            on_line(f"[pool] worker {worker_id} — CUDA_VISIBLE_DEVICES={worker['devices']}")
+        pong = _ping_warm_worker(sock_path)
+        if pong is not None and not _warm_worker_matches(worker, pong):
+            on_line(f"[worker] {sock_path} roda com CUDA_VISIBLE_DEVICES={pong.get('devices')}, "
+                    f"não {worker['devices']} — cena vai pro subprocess")
+            pong = None
+        if pong is not None:
+            on_line(f"[worker] usando worker persistente em {sock_path}")
+            returncode, worker_result = _run_via_worker(sock_path, cmd, on_line, on_progress, env_extra)
+        else:
+            # Progresso estruturado (skyreels_v3.utils.progress) num pipe separado do log
+            progress_r, progress_w = os.pipe()
+            env["SKYREELS_PROGRESS_FD"] = str(progress_w)
+            try:
+                proc = subprocess.Popen(
+                    cmd,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    text=True,
+                    bufsize=1,
+                    cwd=str(PROJECT_ROOT),
+                    env=env,
+                    pass_fds=(progress_w,),
+                )
+            except BaseException:
+                os.close(progress_r)   # sem processo, ninguém vai ler o pipe
+                raise
+            finally:
+                os.close(progress_w)
+            progress_thread = threading.Thread(
+                target=_read_progress_pipe, args=(progress_r, on_progress), daemon=True
+            )
+            progress_thread.start()
+            for line in proc.stdout:
+                on_line(line)
+            proc.wait()
+            progress_thread.join(timeout=5)
+            returncode = proc.returncode
+
+        if returncode == 0:
+            state["status"] = "done"
             if job:
                 job["status"] = "done"
                 job["finished_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
-            # Find latest video
-            videos = sorted(RESULT_DIR.rglob("*.mp4"), key=lambda p: p.stat().st_mtime)
-            if videos:
-                last_video = videos[-1]
+            # O manifest (--manifest_path) diz qual arquivo foi gerado; o worker persistente
+            # também informa. Varredura só para geradores que não aceitam as flags.
+            manifest = _read_job_manifest(job)
+            if job:
+                _record_job_timing(job, worker, time.time() - state["started_ts"], manifest)
+                _record_job_memory(job, worker, manifest)
+            peak = (manifest or {}).get("peak_memory") or {}
+            for kind in ("allocated", "reserved"):
+                if peak.get(f"{kind}_gb") is not None:
+                    METRIC_GPU_PEAK.labels(str(worker_id), kind).set(peak[f"{kind}_gb"] * 1024**3)
+            if peak.get("host_rss_gb") is not None:
+                METRIC_HOST_PEAK.labels(str(worker_id)).set(peak["host_rss_gb"] * 1024**3)
+            if manifest and manifest.get("video"):
+                last_video = PROJECT_ROOT / manifest["video"]
+                job["output_manifest"] = job["_manifest_path"]
+            elif worker_result and worker_result.get("video"):
+                last_video = PROJECT_ROOT / worker_result["video"]
+            else:
+                last_video = _find_job_output(job)
+            if last_video:
                 # Namespacing por projeto: se o job pertence a uma fila com
                 # 'project' setado, move o mp4 de result/<task>/ para
                 # result/<project>/<task>/. Retrocompat: sem project, fica no lugar.
@@ -912,19 +1856,20 @@ def run_generation(cmd, env_extra=None, metadata=None, job=None):
                         )
                         if nq_ref:
                             nq_project = nq_ref.get("project", "") or ""
-                if nq_project:
-                    task_dir = last_video.parent.name  # ex.: reference_to_video
-                    new_dir = RESULT_DIR / nq_project / task_dir
+                task_dir = last_video.parent.name  # ex.: reference_to_video
+                new_dir = RESULT_DIR / nq_project / task_dir
+                if nq_project and last_video.parent.resolve() != new_dir.resolve():
                     new_dir.mkdir(parents=True, exist_ok=True)
                     new_path = new_dir / last_video.name
                     try:
                         last_video.rename(new_path)
+                        media_index.discard(last_video)
                         last_video = new_path
                     except Exception as e:
                         print(f"[namespace] warn: não consegui mover {last_video}: {e}")
-                generation_state["last_video"] = str(last_video.relative_to(PROJECT_ROOT))
+                state["last_video"] = str(last_video.relative_to(PROJECT_ROOT))
                 if job:
-                    job["output_video"] = generation_state["last_video"]
+                    job["output_video"] = state["last_video"]
                     # Auto-mix audio (reference_to_video/extension geram vídeo silencioso)
                     if job.get("task_type") != "talking_avatar":
                         sp_str = job.get("input_audio", "")
@@ -934,7 +1879,9 @@ def run_generation(cmd, env_extra=None, metadata=None, job=None):
                         sp = sp if (sp and sp.exists()) else None
                         bg = bg if (bg and bg.exists()) else None
                         if sp or bg:
+                            mix_t0 = time.time()
                             _mix_audio_scene(last_video, speech_path=sp, bg_path=bg)
+                            METRIC_PHASE_SECONDS.labels(state["task_type"], "mux").observe(time.time() - mix_t0)
                 # Save metadata JSON alongside the video
                 if metadata:
                     metadata["generated_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
@@ -949,28 +1896,44 @@ def run_generation(cmd, env_extra=None, metadata=None, job=None):
                         )
                     except Exception as e:
                         print(f"[input-sidecar] warn: {e}")
+                # Depois do mix/metadata: tamanho, mtime e has_meta já são os finais
+                media_index.add(last_video, job_id=job["id"] if job else None)
+                _schedule_derived(last_video)
         else:
-            generation_state["status"] = "error"
+            state["status"] = "error"
             if job:
                 job["status"] = "error"
                 job["finished_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
 
     except Exception as e:
-        generation_state["log"].append(f"ERROR: {e}")
-        generation_state["status"] = "error"
+        on_line(f"ERROR: {e}")
+        state["status"] = "error"
         if job:
             job["status"] = "error"
             job["finished_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
     finally:
-        generation_state["running"] = False
-        generation_state["current_job_id"] = None
-        log_queue.put("__DONE__")
+        state["running"] = False
+        state["current_job_id"] = None
+        state["finished_ts"] = time.time()
+        worker["mem_reserved_gb"] = 0.0
+        _close_phase(state, state["finished_ts"])
+        METRIC_JOBS.labels(state["task_type"], state["status"]).inc()
+        METRIC_JOB_SECONDS.labels(state["task_type"], state["status"]).observe(
+            state["finished_ts"] - state["started_ts"])
+        if state["status"] == "done":
+            with _scene_finish_lock:
+                _scene_finish_ts.append(state["finished_ts"])
+        if job_log is not None:
+            job_log.close()
+        event_bus.publish(type="done", worker=worker_id, job_id=job_id, nq_id=nq_id,
+                          status=state["status"], progress=state["progress"],
+                          video=state.get("last_video"))
         # Update named queue status
         if job:
             _nq_job_done_hook(job)
-        generation_state["current_nq_id"]    = None
-        generation_state["current_nq_name"]  = None
-        generation_state["current_nq_scene"] = None
+        state["current_nq_id"]    = None
+        state["current_nq_name"]  = None
+        state["current_nq_scene"] = None
         # Auto-start next pending job
         start_next_queued_job()
 
@@ -1014,17 +1977,7 @@ def parse_md_queue(md_text):
 
 @app.route("/")
 def index():
-    videos = []
-    if RESULT_DIR.exists():
-        for v in sorted(RESULT_DIR.rglob("*.mp4"), key=lambda p: p.stat().st_mtime, reverse=True):
-            size_mb = v.stat().st_size / 1024 / 1024
-            videos.append({
-                "path": str(v.relative_to(PROJECT_ROOT)),
-                "name": v.name,
-                "task": v.parent.name,
-                "size": f"{size_mb:.1f} MB",
-                "has_meta": v.with_suffix(".json").exists(),
-            })
+    videos, _ = media_index.query()
     return render_template("index.html", videos=videos)
 
 
@@ -1051,8 +2004,11 @@ def generate():
         "low_vram": low_vram,
         "status": "pending",
         "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "_queued_ts": time.time(),
         "label": f"{task_type} — seed {seed}",
     }
+    if data.get("memory_mode"):
+        job["memory_mode"] = data["memory_mode"]
 
     # Handle file uploads for reference_to_video
     if task_type == "reference_to_video":
@@ -1108,42 +2064,186 @@ def generate():
     with job_queue_lock:
         job_queue.append(job)
 
-    if not generation_state["running"]:
-        start_next_queued_job()
+    start_next_queued_job()
 
     return jsonify({"ok": True, "job_id": job["id"]})
 
 
+def _selected_workers():
+    """?worker=<id> filtra um worker do pool; sem parâmetro, todos."""
+    wid = request.args.get("worker", type=int)
+    if wid is None:
+        return gpu_workers
+    return [w for w in gpu_workers if w["id"] == wid]
+
+
+def _stream_cursor(workers, job_filter, last=None):
+    """Ponto de partida do /stream: Last-Event-ID (reconexão) ou o início do job em
+    andamento — um cliente novo vê o log do render atual, não o ring inteiro."""
+    if last is not None:
+        try:
+            cursor = int(last)
+        except ValueError:
+            cursor = None
+        # id maior que o atual = o servidor reiniciou; recomeça pelo job em andamento
+        if cursor is not None and cursor <= event_bus.last_id:
+            return cursor
+    if job_filter is not None:
+        eid = event_bus.find_last(lambda e: e["type"] == "start" and e["job_id"] == job_filter)
+        if eid is not None:
+            return eid - 1
+    # worker reservado mas sem "start" publicado ainda: tudo depois de agora é dele
+    starts = [w["state"].get("start_event_id") or event_bus.last_id + 1
+              for w in workers if w["state"]["running"]]
+    return min(starts) - 1 if starts else event_bus.last_id
+
+
+def _stream_open():
+    """Estado de um cliente do /stream a partir do request atual (None se o worker não
+    existe). O mesmo estado serve ao gerador do Flask e ao loop async do asgi.py."""
+    workers = _selected_workers()
+    if not workers:
+        return None
+    job_filter = request.args.get("job", type=int)
+    last = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    return {
+        "workers": workers,
+        "wanted": {w["id"] for w in workers},
+        "queue": request.args.get("queue", type=int),
+        "job": job_filter,
+        "multi": len(gpu_workers) > 1,
+        "pos": _stream_cursor(workers, job_filter, last),
+        "last_ping": time.time(),
+    }
+
+
+def _stream_matches(ss, ev):
+    if ev["worker"] not in ss["wanted"]:
+        return False
+    if ss["queue"] is not None and ev.get("nq_id") != ss["queue"]:
+        return False
+    if ss["job"] is not None and ev.get("job_id") != ss["job"]:
+        return False
+    return True
+
+
+def _stream_queue_running(ss):
+    # Sem nq_lock: o ping do SSE roda no event loop do asgi.py, e o nq_lock fica preso
+    # durante o commit do SQLite. Cópia da lista + leitura de um campo bastam aqui.
+    nq = next((q for q in list(named_queues) if q["id"] == ss["queue"]), None)
+    return bool(nq and nq.get("status") == "running")
+
+
+def _stream_chunks(ss, events, lost):
+    """Mensagens SSE para um lote lido do event_bus (avança ss["pos"]).
+    Retorna (mensagens, terminou)."""
+    out = []
+    if lost:
+        out.append(f"data: {json.dumps({'gap': lost})}\n\n")
+    finished = matched = False
+    for ev in events:
+        pos = ss["pos"] = ev["id"]
+        if not _stream_matches(ss, ev) or ev["type"] == "start":
+            continue
+        matched = True
+        st = gpu_workers[ev["worker"]]["state"]
+        if ev["type"] == "done":
+            payload = {k: ev[k] for k in ("status", "progress", "video", "worker", "job_id")}
+            out.append(f"id: {pos}\ndata: {json.dumps({'done': payload})}\n\n")
+            if ss["job"] is not None:
+                return out, True
+            if ss["queue"] is not None:
+                continue  # fila: segue até a fila inteira parar
+            if not ss["multi"]:
+                return out, True
+            # Com vários workers o stream segue enquanto houver job rodando (ou
+            # eventos de outro worker ainda por entregar neste lote, no replay)
+            finished = not any(gpu_workers[i]["state"]["running"] for i in ss["wanted"])
+            continue
+        finished = False
+        out.append(f"id: {pos}\ndata: {json.dumps({'log': ev['line'], 'progress': st['progress'], 'phase': st['phase'], 'eta_s': st['eta_s'], 'clip': st['clip'], 'clips': st['clips'], 'worker': ev['worker'], 'job_id': ev['job_id']})}\n\n")
+    if finished:
+        return out, True
+    if not matched and time.time() - ss["last_ping"] >= 1:
+        ss["last_ping"] = time.time()
+        running = any(gpu_workers[i]["state"]["running"] for i in ss["wanted"])
+        if not running and not (ss["queue"] is not None and _stream_queue_running(ss)):
+            return out, True
+        primary = _primary_state()
+        out.append(f"data: {json.dumps({'ping': True, 'progress': primary['progress'], 'nq_scene': primary.get('current_nq_scene'), 'workers': [_worker_summary(w) for w in ss['workers']]})}\n\n")
+    return out, False
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
 @app.route("/stream")
 def stream():
-    def event_gen():
-        for line in generation_state["log"]:
-            yield f"data: {json.dumps({'log': line})}\n\n"
+    """SSE do log/progresso. Filtros: ?worker=, ?queue=<nq_id>, ?job=<job_id>.
+    Cada evento leva "id:", então o EventSource reconecta com Last-Event-ID sem repetir.
+    Servido pelo asgi.py, o mesmo stream roda no event loop sem prender uma thread."""
+    ss = _stream_open()
+    if ss is None:
+        return jsonify({"error": "Worker não encontrado"}), 404
 
+    def event_gen():
         while True:
-            try:
-                line = log_queue.get(timeout=1)
-                if line == "__DONE__":
-                    payload = {
-                        "status": generation_state["status"],
-                        "progress": generation_state["progress"],
-                        "video": generation_state.get("last_video"),
-                    }
-                    yield f"data: {json.dumps({'done': payload})}\n\n"
-                    break
-                yield f"data: {json.dumps({'log': line, 'progress': generation_state['progress']})}\n\n"
-            except queue.Empty:
-                if not generation_state["running"]:
-                    break
-                yield f"data: {json.dumps({'ping': True, 'progress': generation_state['progress'], 'nq_scene': generation_state.get('current_nq_scene')})}\n\n"
+            events, lost = event_bus.read(ss["pos"], timeout=1)
+            chunks, finished = _stream_chunks(ss, events, lost)
+            yield from chunks
+            if finished:
+                break
 
-    return Response(event_gen(), mimetype="text/event-stream",
-                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    return Response(event_gen(), mimetype="text/event-stream", headers=SSE_HEADERS)
 
 
 @app.route("/status")
 def status():
-    return jsonify(generation_state)
+    workers = _selected_workers()
+    if not workers:
+        return jsonify({"error": "Worker não encontrado"}), 404
+    # Campos de topo = formato antigo (um worker); "workers" traz o pool inteiro.
+    # ?since=<log_cursor> devolve só as linhas novas — custo constante por poll. O cursor
+    # é da sequência global, então vale mesmo se o worker principal mudar entre polls.
+    legacy = workers[0]["state"] if len(workers) == 1 else _primary_state()
+    since = request.args.get("since", type=int)
+    log, cursor, truncated = _log_since(legacy, since)
+    return jsonify({
+        **{k: v for k, v in legacy.items() if k not in ("log", "log_bytes", "log_dropped")},
+        "log": log,
+        "log_cursor": cursor,
+        "log_truncated": truncated,
+        "running": any(w["state"]["running"] for w in workers),
+        "workers": [_worker_summary(w) for w in workers],
+    })
+
+
+@app.route("/jobs/<int:job_id>/log")
+def job_log_route(job_id):
+    """Log completo do job em disco. ?offset=<byte> continua de onde parou (resposta
+    traz next_offset); sem offset, os últimos 64 KB. Máx. 256 KB por chamada."""
+    path = JOB_LOGS_DIR / f"job_{job_id}.log"
+    if not path.exists():
+        return jsonify({"error": "Log não encontrado"}), 404
+    size = path.stat().st_size
+    offset = request.args.get("offset", type=int)
+    rotated = False
+    if offset is None:
+        offset = max(0, size - 64 * 1024)
+    elif offset > size:
+        offset, rotated = 0, True   # o arquivo rodou desde a última leitura
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(256 * 1024)
+    return jsonify({
+        "job_id": job_id,
+        "text": data.decode("utf-8", errors="replace"),
+        "offset": offset,
+        "next_offset": offset + len(data),
+        "size": size,
+        "rotated": rotated,
+        "eof": offset + len(data) >= size,
+    })
 
 
 @app.route("/health")
@@ -1152,23 +2252,41 @@ def health_route():
         depth = sum(
             1 for j in job_queue if j.get("status") in ("pending", "running")
         )
-    state = "busy" if generation_state.get("running") else "ready"
+    idle = sum(1 for w in gpu_workers if not w["state"]["running"])
+    state = "ready" if idle else "busy"
     return jsonify({
         "status": state,
         "queue_depth": depth,
         "gpu_free_gb": _gpu_free_gb(),
+        "warm_worker": _warm_worker_available(),
+        "workers_total": len(gpu_workers),
+        "workers_idle": idle,
+        "workers": [
+            {**_worker_summary(w), "warm_worker": _warm_worker_available(w)}
+            for w in gpu_workers
+        ],
+        "asset_cache": asset_cache.stats(),
+        "derived_cache": _derived_stats(),
+        "webhooks": webhook_outbox.counts(),
         "version": VERSION,
         "uptime_s": int(time.time() - APP_START_TS),
     })
 
 
+@app.route("/metrics")
+def metrics_route():
+    """Métricas no formato de exposição do Prometheus (scrape)."""
+    body, content_type = metrics.render()
+    return Response(body, content_type=content_type)
+
+
 @app.route("/uploads/list")
 def list_uploads():
     """Lista todos os arquivos na pasta uploads/ (nível raiz, sem subpastas).
     Retorna 'files' (imagens) e 'docs' (textos/outros) separados.
     """
     IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
-    SKIP       = {"queues.json", "global_config.json"}
+    SKIP       = {"queues.json", "queues.db", "queues.db-wal", "queues.db-shm", "global_config.json"}
     images, docs = [], []
     for f in sorted(UPLOAD_DIR.iterdir()):
         if not f.is_file() or f.name in SKIP:
@@ -1185,27 +2303,62 @@ def list_uploads():
     return jsonify({"files": images, "docs": docs})
 
 
+# ---- Serving de mídia ----
+# ETag forte = tamanho + mtime_ns; send_file(conditional=True) responde 304 a
+# If-None-Match / If-Modified-Since e 206 a Range (seek no player sem rebaixar tudo).
+# Com ?v=<versão atual> na URL (a galeria usa o "v" do /videos) o arquivo é imutável
+# para o navegador; sem ?v=, "no-cache" — revalida e recebe 304 se não mudou.
+MEDIA_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def _media_path(filepath):
+    """Resolve um caminho da URL dentro do PROJECT_ROOT (None se escapar ou não existir)."""
+    try:
+        full = (PROJECT_ROOT / filepath).resolve()
+    except Exception:
+        return None
+    if not str(full).startswith(str(PROJECT_ROOT.resolve())) or not full.is_file():
+        return None
+    return full
+
+
+def _send_media(full: Path, mimetype=None, as_attachment=False, download_name=None, version=None):
+    """send_file com ETag forte, Range e Cache-Control. version: token da origem
+    (derivados usam o do vídeo original); padrão é o do próprio arquivo."""
+    st = full.stat()
+    etag = version_token(st)
+    version = version or etag
+    resp = send_file(
+        str(full),
+        mimetype=mimetype,
+        as_attachment=as_attachment,
+        download_name=download_name,
+        conditional=True,
+        etag=etag,
+        last_modified=st.st_mtime,
+    )
+    if request.args.get("v") == version:
+        resp.headers["Cache-Control"] = f"public, max-age={MEDIA_IMMUTABLE_MAX_AGE}, immutable"
+    else:
+        resp.headers["Cache-Control"] = "no-cache"
+    return resp
+
+
 @app.route("/file/<path:filepath>")
 def serve_file(filepath):
     """Serve any project file inline (for image thumbnails, etc.)."""
-    full = PROJECT_ROOT / filepath
-    try:
-        full = full.resolve()
-        if not str(full).startswith(str(PROJECT_ROOT.resolve())):
-            return "Forbidden", 403
-    except Exception:
-        return "Not found", 404
-    if not full.exists() or not full.is_file():
+    full = _media_path(filepath)
+    if full is None:
         return "Not found", 404
-    return send_file(str(full))
+    return _send_media(full)
 
 
 @app.route("/video/<path:filepath>")
 def serve_video(filepath):
-    full = PROJECT_ROOT / filepath
-    if not full.exists():
+    full = _media_path(filepath)
+    if full is None:
         return "Not found", 404
-    return send_file(str(full), mimetype="video/mp4")
+    return _send_media(full, mimetype="video/mp4")
 
 
 @app.route("/video-meta/<path:filepath>")
@@ -1219,17 +2372,45 @@ def video_meta(filepath):
 
 @app.route("/download/<path:filepath>")
 def download_file(filepath):
-    full = PROJECT_ROOT / filepath
-    try:
-        full = full.resolve()
-        PROJECT_ROOT.resolve()
-    except Exception:
-        return "Not found", 404
-    if not str(full).startswith(str(PROJECT_ROOT.resolve())):
-        return "Forbidden", 403
-    if not full.exists() or not full.is_file():
+    full = _media_path(filepath)
+    if full is None:
         return "Not found", 404
-    return send_file(str(full), as_attachment=True, download_name=full.name)
+    return _send_media(full, as_attachment=True, download_name=full.name)
+
+
+# ---- Downloads em streaming ----
+# JSON e ZIP são gerados em pedaços enquanto o cliente baixa: a memória não cresce
+# com o tamanho do episódio e o download começa na hora.
+def _stream_download(chunks, filename, mimetype):
+    # Nomes de episódio podem ter acento: fallback ASCII + filename* (RFC 5987), como o send_file
+    ascii_name = filename.encode("ascii", "ignore").decode() or "download"
+    disposition = f'attachment; filename="{ascii_name}"'
+    if ascii_name != filename:
+        disposition += f"; filename*=UTF-8''{urllib.parse.quote(filename)}"
+    return Response(chunks, mimetype=mimetype, headers={"Content-Disposition": disposition})
+
+
+def _iter_json(obj):
+    encoder = json.JSONEncoder(indent=2, ensure_ascii=False, default=str)
+    for chunk in encoder.iterencode(obj):
+        yield chunk.encode("utf-8")
+
+
+def _public_queue(nq):
+    """Cópia sem os campos "_" (webhook, timers) da fila e das cenas — o mesmo que o
+    QueueStore grava; snapshot pra serializar fora do lock."""
+    public = {k: v for k, v in nq.items() if not k.startswith("_")}
+    if "jobs" in public:
+        public["jobs"] = [{k: v for k, v in j.items() if not k.startswith("_")} for j in public["jobs"]]
+    return copy.deepcopy(public)
+
+
+@app.route("/nqueues/export-json")
+def export_all_nq_json():
+    """Todas as filas no formato do antigo uploads/queues.json (backup / migração)."""
+    with nq_lock:
+        snapshot = [_public_queue(nq) for nq in named_queues]
+    return _stream_download(_iter_json(snapshot), "queues.json", "application/json")
 
 
 @app.route("/nqueues/<int:nq_id>/export-json")
@@ -1238,10 +2419,9 @@ def export_nq_json(nq_id):
         nq = next((q for q in named_queues if q["id"] == nq_id), None)
         if nq is None:
             return "Fila não encontrada", 404
-        data = json.dumps(nq, indent=2, ensure_ascii=False).encode("utf-8")
+        snapshot = _public_queue(nq)
         safe = "".join(c if c.isalnum() or c in "-_ " else "_" for c in nq["name"]).strip()
-    buf = io.BytesIO(data)
-    return send_file(buf, as_attachment=True, download_name=f"{safe}.json", mimetype="application/json")
+    return _stream_download(_iter_json(snapshot), f"{safe}.json", "application/json")
 
 
 @app.route("/nqueues/<int:nq_id>/download-zip")
@@ -1253,47 +2433,67 @@ def download_nq_zip(nq_id):
             return "Fila não encontrada", 404
         jobs_snap = [dict(j) for j in nq["jobs"]]
         safe = "".join(c if c.isalnum() or c in "-_ " else "_" for c in nq["name"]).strip()
-    buf = io.BytesIO()
+    entries = []
     added = set()
-    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as zf:
-        for job in jobs_snap:
-            if not job.get("output_video"):
-                continue
-            vp = PROJECT_ROOT / job["output_video"]
-            if vp.exists() and str(vp) not in added:
-                zf.write(str(vp), f"videos/{vp.name}")
-                added.add(str(vp))
-            if include_sources:
-                for ref in job.get("ref_imgs") or []:
-                    p = PROJECT_ROOT / ref
+    for job in jobs_snap:
+        if not job.get("output_video"):
+            continue
+        vp = PROJECT_ROOT / job["output_video"]
+        if vp.exists() and str(vp) not in added:
+            entries.append((f"videos/{vp.name}", vp))
+            added.add(str(vp))
+        if include_sources:
+            for ref in job.get("ref_imgs") or []:
+                p = PROJECT_ROOT / ref
+                if p.exists() and str(p) not in added:
+                    entries.append((f"sources/{p.name}", p))
+                    added.add(str(p))
+            for key in ("input_video", "input_image", "input_audio"):
+                val = job.get(key)
+                if val:
+                    p = PROJECT_ROOT / val
                     if p.exists() and str(p) not in added:
-                        zf.write(str(p), f"sources/{p.name}")
+                        entries.append((f"sources/{p.name}", p))
                         added.add(str(p))
-                for key in ("input_video", "input_image", "input_audio"):
-                    val = job.get(key)
-                    if val:
-                        p = PROJECT_ROOT / val
-                        if p.exists() and str(p) not in added:
-                            zf.write(str(p), f"sources/{p.name}")
-                            added.add(str(p))
-    buf.seek(0)
-    return send_file(buf, as_attachment=True, download_name=f"{safe}.zip", mimetype="application/zip")
+    return _stream_download(iter_zip(entries), f"{safe}.zip", "application/zip")
 
 
 @app.route("/videos")
 def list_videos():
-    videos = []
-    if RESULT_DIR.exists():
-        for v in sorted(RESULT_DIR.rglob("*.mp4"), key=lambda p: p.stat().st_mtime, reverse=True):
-            size_mb = v.stat().st_size / 1024 / 1024
-            videos.append({
-                "path": str(v.relative_to(PROJECT_ROOT)),
-                "name": v.name,
-                "task": v.parent.name,
-                "size": f"{size_mb:.1f} MB",
-                "has_meta": v.with_suffix(".json").exists(),
-            })
-    return jsonify(videos)
+    """Vídeos de result/, mais recentes primeiro, servidos do índice em memória.
+    Filtros opcionais: ?project= ("" = sem projeto), ?task=, ?offset=, ?limit=.
+    O total filtrado vai no header X-Total-Count."""
+    try:
+        offset = max(0, int(request.args.get("offset", 0)))
+        limit = request.args.get("limit")
+        limit = max(0, int(limit)) if limit not in (None, "") else None
+    except ValueError:
+        return jsonify({"error": "offset/limit inválidos"}), 400
+    videos, total = media_index.query(
+        project=request.args.get("project"),
+        task=request.args.get("task") or None,
+        offset=offset,
+        limit=limit,
+    )
+    resp = jsonify(videos)
+    resp.headers["X-Total-Count"] = str(total)
+    return resp
+
+
+@app.route("/videos/job/<int:job_id>")
+def video_for_job(job_id):
+    entry = media_index.for_job(job_id)
+    if entry is None:
+        return jsonify({"error": "Nenhum vídeo para esse job"}), 404
+    return jsonify(entry)
+
+
+@app.route("/videos/rescan", methods=["POST"])
+def rescan_videos():
+    """Revarre result/ inteiro (arquivos copiados/apagados por fora do app)."""
+    count = media_index.rescan()
+    _link_job_outputs()
+    return jsonify({"ok": True, "videos": count})
 
 
 # ---- Queue endpoints ----
@@ -1316,14 +2516,14 @@ def queue_add():
         "id": _next_job_id(),
         "status": "pending",
         "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "_queued_ts": time.time(),
         "label": data.get("label") or f"{data['task_type']} — seed {data.get('seed', 42)}",
         **data,
     }
     with job_queue_lock:
         job_queue.append(job)
 
-    if not generation_state["running"]:
-        start_next_queued_job()
+    start_next_queued_job()
 
     return jsonify({"ok": True, "id": job["id"]})
 
@@ -1371,13 +2571,14 @@ def queue_import():
                     "id": _next_job_id(),
                     "status": "pending",
                     "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                    "_queued_ts": time.time(),
                     "label": data.get("label") or f"{data['task_type']} — seed {data.get('seed', 42)}",
                     **data,
                 }
                 job_queue.append(job)
                 added += 1
 
-        if added > 0 and not generation_state["running"]:
+        if added > 0:
             start_next_queued_job()
 
         return jsonify({"ok": True, "added": added})
@@ -1410,43 +2611,143 @@ def help_page():
 
 # ---- Named Queue endpoints ----
 
-def _estimate_job_minutes(job):
-    """Estimated generation time in minutes for a single job."""
+# ---- Estimativa de tempo (histórico + prior) ----
+# Cada job concluído grava o tempo medido em uploads/eta_history.db; a estimativa de
+# uma cena é a regressão (tempo ~ duração) dos jobs com a mesma task, resolução, modo
+# de memória e GPU, puxada para as constantes abaixo enquanto há poucas amostras.
+eta_model = EtaModel(ETA_DB)
+_gpu_names: dict = {}   # índice da GPU -> nome (nvidia-smi, lido uma vez)
+_gpu_mem_gb: dict = {}  # índice da GPU -> memória total em GB
+
+
+def _gpu_name(worker=None):
+    """Modelo da (primeira) GPU do worker; "" sem nvidia-smi."""
+    if not _gpu_names:
+        try:
+            r = subprocess.run(["nvidia-smi", "--query-gpu=index,name,memory.total",
+                                "--format=csv,noheader,nounits"],
+                               capture_output=True, text=True, timeout=3)
+            for line in r.stdout.splitlines():
+                # Linha por linha: uma GPU estranha não deixa as outras de fora
+                idx, _, rest = line.partition(",")
+                name, _, mem_mib = rest.rpartition(",")
+                if not idx.strip() or not name.strip():
+                    continue
+                _gpu_names[idx.strip()] = name.strip()
+                try:
+                    _gpu_mem_gb[idx.strip()] = round(float(mem_mib) / 1024, 1)
+                except ValueError:
+                    pass   # "[N/A]" (instâncias MIG): memória desconhecida, sem admissão
+        except Exception:
+            pass
+        _gpu_names.setdefault(None, "")
+    devices = (worker or gpu_workers[0])["devices"]
+    return _gpu_names.get(devices.split(",")[0] if devices else "0", "")
+
+
+def _prior_job_minutes(job):
+    """Constantes de partida (minutos, minutos por segundo de cena) antes de haver histórico."""
     t   = job.get("task_type", "")
     res = job.get("resolution", "720P")
     dur = job.get("duration", 5) or 5
     if t == "reference_to_video":
         base = {"480P": 8, "540P": 12, "720P": 18}.get(res, 14)
-        return base + dur * 0.5
+        return base + dur * 0.5, 0.5
     if t == "talking_avatar":
-        return {"480P": 15, "720P": 22}.get(res, 15)
+        return {"480P": 15, "720P": 22}.get(res, 15), 0.0
     if t == "single_shot_extension":
-        return 8 + dur * 0.4
+        return 8 + dur * 0.4, 0.4
     if t == "shot_switching_extension":
-        return 5 + dur * 0.3
-    return 10
+        return 5 + dur * 0.3, 0.3
+    return 10, 0.0
+
+
+def _eta_key_and_x(job, gpu):
+    """Chave do histórico e a duração usada na regressão (a do áudio no talking_avatar)."""
+    task = job.get("task_type", "reference_to_video")
+    res = job.get("resolution", "540P")
+    if task == "talking_avatar" and res == "540P":
+        res = "480P"
+    mode = (job.get("memory") or {}).get("mode") or _flags_memory_mode(job)
+    x = float(job.get("duration", 5) or 5)
+    if task == "talking_avatar" and job.get("input_audio"):
+        x = _audio_duration(PROJECT_ROOT / job["input_audio"]) or x
+    return EtaModel.key(task, res, mode, gpu), x
+
+
+def _record_job_timing(job, worker, total_s, manifest=None):
+    """Grava a amostra sem o carregamento do pipeline: um run frio (load_s do manifest)
+    e um worker quente viram a mesma medida, senão o histórico mistura os dois."""
+    timings = (manifest or {}).get("timings") or {}
+    gpu = (manifest or {}).get("gpu") or _gpu_name(worker)
+    key, x = _eta_key_and_x(job, gpu)
+    try:
+        load_s = float(timings.get("load_s") or 0)
+        eta_model.record(key, x, max(total_s - load_s, 1.0), timings or None)
+    except Exception as e:
+        print(f"[eta] não consegui gravar o tempo do job {job.get('id')}: {e}")
+
+
+def _estimate_job_minutes(job, gpu=None):
+    """Estimated generation time in minutes for a single job."""
+    if gpu is None:
+        gpu = _gpu_name()
+    key, x = _eta_key_and_x(job, gpu)
+    prior, prior_slope = _prior_job_minutes(job)
+    return eta_model.predict(key, x, prior, prior_slope)
+
+
+def _nq_estimates(jobs, gpu):
+    """(estimated_minutes, remaining_minutes) de uma cópia das cenas da fila. Chamar sem
+    nq_lock: talking_avatar sonda a duração do áudio."""
+    est = [(j["status"], _estimate_job_minutes(j, gpu)) for j in jobs]
+    total = round(sum(m for _, m in est))
+    remaining = round(sum(m for status, m in est if status != "done"))
+    return total, remaining
+
+
+@app.route("/eta")
+def eta_stats_route():
+    """Histórico por chave (task, resolução, modo de memória, GPU): amostras e coeficientes."""
+    return jsonify({"gpu": _gpu_name(), "keys": eta_model.stats()})
+
 
 @app.route("/nqueues", methods=["GET"])
 def get_named_queues():
+    # As estimativas só são recalculadas quando a fila muda (_save_queue avança a
+    # geração) ou chega uma amostra nova ao histórico; o cálculo (nvidia-smi, sonda de
+    # áudio) roda fora do nq_lock sobre uma cópia das cenas.
+    version = eta_model.version
+    result, stale = [], []
     with nq_lock:
-        result = [{
-            "id": nq["id"],
-            "name": nq["name"],
-            "project": nq.get("project", ""),
-            "ep_code": nq.get("ep_code", ""),
-            "status": nq["status"],
-            "job_count": len(nq["jobs"]),
-            "done_count": sum(1 for j in nq["jobs"] if j["status"] == "done"),
-            "error_count": sum(1 for j in nq["jobs"] if j["status"] == "error"),
-            "created_at": nq["created_at"],
-            "estimated_minutes": round(sum(
-                _estimate_job_minutes(j) for j in nq["jobs"]
-            )),
-            "remaining_minutes": round(sum(
-                _estimate_job_minutes(j) for j in nq["jobs"]
-                if j["status"] not in ("done",)
-            )),
-        } for nq in named_queues]
+        for nq in named_queues:
+            gen = _nq_gen.get(nq["id"], 0)
+            cached = _nq_eta_cache.get(nq["id"])
+            if not (cached and cached[0] == version and cached[1] == gen):
+                cached = None
+                stale.append((nq["id"], gen, [dict(j) for j in nq["jobs"]]))
+            result.append({
+                "id": nq["id"],
+                "name": nq["name"],
+                "project": nq.get("project", ""),
+                "ep_code": nq.get("ep_code", ""),
+                "status": nq["status"],
+                "job_count": len(nq["jobs"]),
+                "done_count": sum(1 for j in nq["jobs"] if j["status"] == "done"),
+                "error_count": sum(1 for j in nq["jobs"] if j["status"] == "error"),
+                "created_at": nq["created_at"],
+                "estimated_minutes": cached[2] if cached else None,
+                "remaining_minutes": cached[3] if cached else None,
+            })
+    if stale:
+        gpu = _gpu_name()
+        fresh = {nq_id: _nq_estimates(jobs, gpu) for nq_id, gen, jobs in stale}
+        with nq_lock:
+            for nq_id, gen, _ in stale:
+                _nq_eta_cache[nq_id] = (version, gen, *fresh[nq_id])
+        for row in result:
+            if row["id"] in fresh:
+                row["estimated_minutes"], row["remaining_minutes"] = fresh[row["id"]]
     return jsonify(result)
 
 
@@ -1489,7 +2790,7 @@ def create_named_queue():
         nq["ep_code"] = _next_ep_code(proj)
     with nq_lock:
         named_queues.append(nq)
-    _save_queues()
+    _save_queue(nq_id)
     return jsonify({"ok": True, "id": nq_id, "ep_code": nq.get("ep_code", "")})
 
 
@@ -1535,7 +2836,7 @@ def import_nq_route():
         }
         with nq_lock:
             named_queues.append(nq)
-        _save_queues()
+        _save_queue(nq_id)
         return jsonify({"ok": True, "id": nq_id, "name": name, "job_count": len(jobs)})
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -1571,7 +2872,7 @@ def add_nq_job(nq_id):
             **{k: v for k, v in data.items() if k not in ("id", "nq_id", "status", "created_at", "output_video")},
         }
         nq["jobs"].append(job)
-    _save_queues()
+    _save_queue(nq_id)
     return jsonify({"ok": True, "id": job_id})
 
 
@@ -1587,7 +2888,7 @@ def delete_nq_job(nq_id, job_id):
         if job["status"] == "running":
             return jsonify({"error": "Cena em execução não pode ser removida"}), 400
         nq["jobs"] = [j for j in nq["jobs"] if j["id"] != job_id]
-    _save_queues()
+    _save_queue(nq_id)
     return jsonify({"ok": True})
 
 
@@ -1595,7 +2896,7 @@ def delete_nq_job(nq_id, job_id):
 def patch_nq_job(nq_id, job_id):
     data = request.get_json(force=True)
     PROTECTED = {"id", "nq_id", "nq_job_index", "status", "created_at",
-                 "output_video", "started_at", "finished_at", "task_type"}
+                 "output_video", "output_manifest", "started_at", "finished_at", "task_type"}
     with nq_lock:
         nq = next((q for q in named_queues if q["id"] == nq_id), None)
         if nq is None:
@@ -1616,9 +2917,10 @@ def patch_nq_job(nq_id, job_id):
         if was_done and not audio_only_edit:
             job["status"] = "idle"
             job["output_video"] = ""
+            job.pop("output_manifest", None)
             job["started_at"] = ""
             job["finished_at"] = ""
-    _save_queues()
+    _save_queue(nq_id)
     return jsonify({"ok": True, "reset": was_done})
 
 
@@ -1638,7 +2940,7 @@ def delete_named_queue_route(nq_id):
             nq["current_job"] = 0
         else:
             named_queues.remove(nq)
-    _save_queues()
+    _save_queue(nq_id)
     return jsonify({"ok": True})
 
 
@@ -1682,17 +2984,40 @@ def unlink_nq_from_project(nq_id):
         if nq["status"] == "running":
             return jsonify({"error": "Não é possível desvincular uma fila em execução"}), 400
         nq.pop("project", None)
-    _save_queues()
+    _save_queue(nq_id)
     return jsonify({"ok": True})
 
 
 @app.route("/nqueues/<int:nq_id>/run", methods=["POST"])
 def run_nq_route(nq_id):
     callback_url = request.args.get("callback_url") or None
-    ok = run_named_queue(nq_id, callback_url=callback_url)
+    policy = request.args.get("policy") or None
+    if policy and policy not in SCHEDULER_POLICIES:
+        return jsonify({"error": f"policy inválida (use: {', '.join(SCHEDULER_POLICIES)})"}), 400
+    ok = run_named_queue(nq_id, callback_url=callback_url, policy=policy)
     if not ok:
         return jsonify({"error": "Fila não encontrada, já em execução, ou sem cenas pendentes"}), 400
-    return jsonify({"ok": True, "callback_registered": bool(callback_url)})
+    with nq_lock:
+        nq = next((q for q in named_queues if q["id"] == nq_id), None)
+        sched = dict(nq.get("_sched") or {}) if nq else {}
+    return jsonify({
+        "ok": True,
+        "callback_registered": bool(callback_url),
+        "policy": sched.get("policy"),
+        "estimated_model_swaps": sched.get("estimated_swaps"),
+        "estimated_swaps_saved": (sched["fifo_swaps"] - sched["estimated_swaps"]) if sched else 0,
+    })
+
+
+@app.route("/nqueues/<int:nq_id>/dag")
+def nq_dag_route(nq_id):
+    """Grafo de dependências entre cenas: deps, nível e se já pode rodar."""
+    with nq_lock:
+        nq = next((q for q in named_queues if q["id"] == nq_id), None)
+        if nq is None:
+            return jsonify({"error": "Fila não encontrada"}), 404
+        dag = _nq_dag(nq)
+    return jsonify({"queue_id": nq_id, **dag})
 
 
 @app.route("/nqueues/<int:nq_id>/jobs/<int:job_id>/run", methods=["POST"])
@@ -1718,7 +3043,7 @@ def reset_nq_route(nq_id):
                 j["output_video"] = ""
                 j.pop("started_at", None)
                 j.pop("finished_at", None)
-    _save_queues()
+    _save_queue(nq_id)
     ok = run_named_queue(nq_id)
     if not ok:
         return jsonify({"error": "Sem cenas a executar"}), 400
@@ -1739,7 +3064,7 @@ def restart_nq_route(nq_id):
             j["output_video"] = ""
             j.pop("started_at", None)
             j.pop("finished_at", None)
-    _save_queues()
+    _save_queue(nq_id)
     ok = run_named_queue(nq_id)
     if not ok:
         return jsonify({"error": "Sem cenas a executar"}), 400
@@ -1800,30 +3125,55 @@ def _strip_audio_prefix(text: str) -> str:
     return text.strip()
 
 
+# ---- Probe de mídia ----
+# PyAV no próprio processo (ffprobe só sem o av), memoizado por (caminho, tamanho,
+# mtime) e persistido em .cache/media_probe.db — ver webui/media_probe.py.
+media_probe = MediaProbe(PROJECT_ROOT / ".cache" / "media_probe.db")
+
+
 def _audio_duration(path: Path) -> float:
-    """Returns audio duration in seconds using ffprobe."""
-    try:
-        r = subprocess.run(
-            ["ffprobe", "-v", "quiet", "-print_format", "json", "-show_format", str(path)],
-            capture_output=True, text=True, timeout=10
-        )
-        data = json.loads(r.stdout) if r.returncode == 0 else {}
-        return float(data.get("format", {}).get("duration", 0))
-    except Exception:
-        return 0.0
+    """Returns audio duration in seconds (0.0 if unreadable)."""
+    info = media_probe.probe(path)
+    return info["duration"] if info else 0.0
 
 
 def _video_info(path):
     """Returns (has_audio, duration_seconds) for a video file."""
-    r = subprocess.run(
-        ["ffprobe", "-v", "quiet", "-print_format", "json",
-         "-show_streams", "-show_format", str(path)],
-        capture_output=True, text=True, timeout=15
-    )
-    data = json.loads(r.stdout) if r.returncode == 0 else {}
-    has_aud = any(s.get("codec_type") == "audio" for s in data.get("streams", []))
-    duration = float(data.get("format", {}).get("duration", 0))
-    return has_aud, duration
+    info = media_probe.probe(path)
+    if info is None:
+        return False, 0.0
+    return info["has_audio"], info["duration"]
+
+
+@app.route("/nqueues/<int:nq_id>/probe")
+def nq_probe_route(nq_id):
+    """Metadados (duração, streams, resolução, áudio) de todos os arquivos da fila de uma
+    vez: vídeo gerado, áudio e imagens de referência de cada cena."""
+    with nq_lock:
+        nq = next((q for q in named_queues if q["id"] == nq_id), None)
+        if nq is None:
+            return jsonify({"error": "Fila não encontrada"}), 404
+        jobs = [(j["id"], j.get("output_video"), j.get("input_audio"), list(j.get("ref_imgs") or []))
+                for j in nq["jobs"]]
+
+    def local(rel):
+        return rel and not rel.startswith("http")
+
+    def info(rel):
+        return infos.get(str(PROJECT_ROOT / rel)) if local(rel) else None
+
+    wanted = {rel for _, video, audio, refs in jobs for rel in [video, audio, *refs] if local(rel)}
+    infos = media_probe.probe_many(PROJECT_ROOT / rel for rel in wanted)
+    return jsonify({
+        "queue_id": nq_id,
+        "backend": media_probe.backend,
+        "jobs": [{
+            "id": jid,
+            "output_video": video, "output_video_info": info(video),
+            "input_audio": audio, "input_audio_info": info(audio),
+            "ref_imgs": [{"path": r, "info": info(r)} for r in refs],
+        } for jid, video, audio, refs in jobs],
+    })
 
 
 def _mix_audio_scene(video_path: Path, speech_path: Path = None,
@@ -1868,6 +3218,8 @@ def _mix_audio_scene(video_path: Path, speech_path: Path = None,
         r = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
         if r.returncode == 0 and tmp.exists():
             tmp.replace(video_path)
+            media_index.add(video_path)
+            _schedule_derived(video_path)
             return True
         if tmp.exists():
             tmp.unlink()
@@ -1883,8 +3235,332 @@ def _mix_audio_into_video(video_path: Path, audio_path: Path) -> bool:
     return _mix_audio_scene(video_path, speech_path=audio_path)
 
 
+# ---- Finalize: segmentos normalizados em cache ----
+# Cada cena vira um segmento já no formato final (resolução, fps, áudio AAC estéreo),
+# salvo por hash do conteúdo + parâmetros. Re-finalizar depois de trocar uma cena só
+# re-encoda aquela cena; o resto é concat com stream copy dos segmentos em cache.
+FINALIZE_CACHE_DIR = PROJECT_ROOT / ".cache" / "finalize_segments"
+# Mudou o comando de normalização? Troque a versão pra invalidar os segmentos antigos.
+SEGMENT_PARAMS = "v1|libx264:ultrafast:crf23|aac:44100:2:128k|tb90000"
+# ffmpeg sem nenhuma linha de -progress por esse tempo é dado como travado e encerrado
+FFMPEG_STALL_S = float(os.environ.get("SKYREELS_FFMPEG_STALL_S", "300"))
+# Teto do cache de segmentos; os menos usados (mtime = último uso) saem ao fim de
+# cada finalização, como no asset_cache
+FINALIZE_CACHE_MAX_BYTES = int(os.environ.get("SKYREELS_FINALIZE_CACHE_MB", "10240")) * 1024 * 1024
+_segments_in_use: dict = {}   # str(segmento) -> nº de finalizações em andamento que o usam
+_segments_lock = threading.Lock()
+_digest_memo: dict = {}   # str(path) -> (size, mtime_ns, sha256)
+_digest_lock = threading.Lock()
+
+
+def _pin_segments(segments, delta):
+    with _segments_lock:
+        for seg in segments:
+            count = _segments_in_use.get(str(seg), 0) + delta
+            if count > 0:
+                _segments_in_use[str(seg)] = count
+            else:
+                _segments_in_use.pop(str(seg), None)
+
+
+def _evict_segments():
+    """Apaga os segmentos menos usados até o cache caber em FINALIZE_CACHE_MAX_BYTES;
+    segmentos de finalizações em andamento ficam."""
+    entries = []
+    for seg in FINALIZE_CACHE_DIR.glob("*.mp4"):
+        if ".tmp." in seg.name:
+            continue
+        try:
+            st = seg.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, seg))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    with _segments_lock:
+        pinned = set(_segments_in_use)
+    for _, size, seg in sorted(entries, key=lambda e: e[0]):
+        if total <= FINALIZE_CACHE_MAX_BYTES:
+            break
+        if str(seg) in pinned:
+            continue
+        try:
+            seg.unlink()
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    if removed:
+        print(f"[finalize] cache de segmentos: {removed} segmento(s) antigo(s) removido(s)")
+    return removed
+
+
+def _file_digest(path: Path) -> str:
+    """sha256 do conteúdo, memoizado por (tamanho, mtime) pra não reler arquivos grandes."""
+    st = path.stat()
+    key = str(path)
+    with _digest_lock:
+        memo = _digest_memo.get(key)
+    if memo and memo[0] == st.st_size and memo[1] == st.st_mtime_ns:
+        return memo[2]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _digest_lock:
+        _digest_memo[key] = (st.st_size, st.st_mtime_ns, digest)
+    return digest
+
+
+def _video_stream_params(path: Path):
+    """(width, height, fps) do primeiro stream de vídeo; fps como string racional."""
+    info = media_probe.probe(path)
+    if not info or not info["has_video"]:
+        return None
+    return info["width"], info["height"], info["fps"]
+
+
+def _run_ffmpeg(cmd, on_time=None, cancel=None):
+    """Roda ffmpeg com -progress no stdout. on_time(segundos) recebe o out_time a cada
+    atualização; cancel (threading.Event) termina o processo, e um watchdog também o
+    termina se ficar FFMPEG_STALL_S sem progresso. Retorna (returncode, stderr)."""
+    import tempfile
+
+    cmd = cmd[:1] + ["-progress", "pipe:1", "-nostats"] + cmd[1:]
+    with tempfile.TemporaryFile(mode="w+") as err:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=err, text=True)
+        last_line = [time.monotonic()]
+        stalled = threading.Event()
+        finished = threading.Event()
+
+        def watchdog():
+            # Roda à parte: a leitura do stdout bloqueia enquanto o ffmpeg não escreve
+            while not finished.wait(1):
+                cancelled = cancel is not None and cancel.is_set()
+                if not cancelled and time.monotonic() - last_line[0] < FFMPEG_STALL_S:
+                    continue
+                if not cancelled:
+                    stalled.set()
+                proc.terminate()
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+                return
+
+        threading.Thread(target=watchdog, name="ffmpeg-watchdog", daemon=True).start()
+        try:
+            for line in proc.stdout:
+                last_line[0] = time.monotonic()
+                if cancel is not None and cancel.is_set():
+                    proc.terminate()
+                    break
+                key, _, value = line.strip().partition("=")
+                if key == "out_time_us" and on_time:
+                    try:
+                        on_time(int(value) / 1_000_000)
+                    except ValueError:
+                        pass  # "N/A" antes do primeiro frame
+            proc.wait()
+        finally:
+            finished.set()
+        err.seek(0)
+        stderr = err.read()[-500:]
+        if stalled.is_set():
+            stderr = f"ffmpeg travado: {FFMPEG_STALL_S:.0f}s sem progresso, encerrado. {stderr}"
+        return proc.returncode, stderr
+
+
+def _normalize_segment(src: Path, dst: Path, tw, th, fps, has_aud, dur, on_time=None, cancel=None):
+    """Re-encoda uma cena no formato final do episódio. Grava em tmp e renomeia,
+    então um segmento no cache nunca fica pela metade."""
+    tmp = dst.with_name(dst.stem + f".{uuid.uuid4().hex[:8]}.tmp.mp4")
+    cmd = ["ffmpeg", "-y", "-i", str(src)]
+    vf = (f"[0:v]scale={tw}:{th}:force_original_aspect_ratio=decrease,"
+          f"pad={tw}:{th}:(ow-iw)/2:(oh-ih)/2:black,fps={fps},"
+          f"setpts=PTS-STARTPTS[v]")
+    if has_aud:
+        af = "[0:a]aresample=44100,aformat=channel_layouts=stereo,asetpts=PTS-STARTPTS[a]"
+    else:
+        cmd += ["-f", "lavfi", "-i", "anullsrc=r=44100:cl=stereo"]
+        af = f"[1:a]atrim=duration={dur:.3f},asetpts=PTS-STARTPTS[a]"
+    cmd += [
+        "-filter_complex", f"{vf};{af}",
+        "-map", "[v]", "-map", "[a]",
+        "-c:v", "libx264", "-preset", "ultrafast", "-crf", "23", "-pix_fmt", "yuv420p",
+        "-c:a", "aac", "-ar", "44100", "-ac", "2", "-b:a", "128k",
+        "-video_track_timescale", "90000",
+        str(tmp),
+    ]
+    try:
+        returncode, stderr = _run_ffmpeg(cmd, on_time, cancel)
+        if returncode != 0 or (cancel is not None and cancel.is_set()):
+            return False, stderr
+        tmp.replace(dst)
+        return True, ""
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def _concat_copy(files, out_path: Path, on_time=None, cancel=None):
+    """Concat demuxer com stream copy (todos os arquivos no mesmo formato).
+    Retorna (returncode, stderr)."""
+    import tempfile
+
+    with tempfile.NamedTemporaryFile(mode="w", suffix=".txt", delete=False) as f:
+        for v in files:
+            f.write(f"file '{v}'\n")
+        list_path = f.name
+    try:
+        return _run_ffmpeg(
+            ["ffmpeg", "-y", "-f", "concat", "-safe", "0",
+             "-i", list_path, "-c", "copy", str(out_path)],
+            on_time, cancel)
+    finally:
+        os.unlink(list_path)
+
+
+def _finalize_videos(videos, out_path: Path, on_progress=None, cancel=None):
+    """Concatena as cenas em out_path. Retorna (ok, erro, stats).
+    on_progress(pct, etapa) acompanha o ffmpeg; cancel (threading.Event) interrompe."""
+    def report(pct, stage):
+        if on_progress:
+            on_progress(max(0, min(100, int(pct))), stage)
+
+    # Check audio presence per video (um probe por cena, em lote e memoizado)
+    report(0, "analisando cenas")
+    media_probe.probe_many(videos)
+    infos = [_video_info(v) for v in videos]
+    any_audio = any(has_aud for has_aud, _ in infos)
+    total_s = sum(dur for _, dur in infos) or 1.0
+
+    if not any_audio:
+        # All silent — simple concat copy
+        returncode, stderr = _concat_copy(
+            videos, out_path, lambda t: report(100 * t / total_s, "concat"), cancel)
+        if returncode != 0:
+            return False, f"ffmpeg falhou: {stderr}", {}
+        return True, "", {"segments_encoded": 0, "segments_cached": 0}
+
+    # Mixed audio/silent — normaliza cada cena (com cache) e concatena os segmentos
+    # Determine target resolution / fps (most common among done videos)
+    from collections import Counter
+    params = [_video_stream_params(v) for v in videos]
+    known = [p for p in params if p]
+    if not known:
+        return False, "não foi possível ler as cenas (probe)", {}
+    tw, th = Counter((w, h) for w, h, _ in known).most_common(1)[0][0]
+    fps = Counter(f for _, _, f in known).most_common(1)[0][0]
+
+    FINALIZE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    plan = []
+    for v, (has_aud, dur) in zip(videos, infos):
+        key = hashlib.sha256(
+            f"{_file_digest(v)}|{tw}x{th}|{fps}|{SEGMENT_PARAMS}".encode()
+        ).hexdigest()[:32]
+        plan.append((v, has_aud, dur, FINALIZE_CACHE_DIR / f"{key}.mp4"))
+    pinned = [seg for _, _, _, seg in plan]
+    _pin_segments(pinned, 1)   # a limpeza do cache não apaga segmentos desta finalização
+    try:
+        # Progresso: 0-95% = segundos de cena a encodar, 95-100% = concat (stream copy)
+        to_encode_s = sum(dur for _, _, dur, seg in plan if not seg.exists()) or 1.0
+        done_s = 0.0
+        segments, encoded, cached = [], 0, 0
+        for v, has_aud, dur, seg in plan:
+            if seg.exists():
+                cached += 1
+                os.utime(seg)  # marca uso recente (ordem do LRU em _evict_segments)
+            else:
+                base = done_s
+                ok, err = _normalize_segment(
+                    v, seg, tw, th, fps, has_aud, dur,
+                    lambda t: report(95 * (base + min(t, dur)) / to_encode_s, f"cena {v.name}"),
+                    cancel,
+                )
+                if not ok:
+                    return False, f"ffmpeg falhou ({v.name}): {err}", {}
+                encoded += 1
+                done_s += dur
+                report(95 * done_s / to_encode_s, f"cena {v.name}")
+            segments.append(seg)
+
+        returncode, stderr = _concat_copy(
+            segments, out_path, lambda t: report(95 + 5 * t / total_s, "concat"), cancel)
+        if returncode != 0:
+            return False, f"ffmpeg falhou: {stderr}", {}
+        print(f"[finalize] {out_path.name}: {encoded} cena(s) normalizada(s), {cached} do cache")
+        return True, "", {"segments_encoded": encoded, "segments_cached": cached}
+    finally:
+        _pin_segments(pinned, -1)
+        _evict_segments()
+
+
+# ---- Finalize em background ----
+# O POST /finalize só valida e enfileira; o ffmpeg roda num pool limitado de threads
+# (cada uma supervisiona um processo ffmpeg), sem prender a requisição nem a GPU.
+FINALIZE_WORKERS = int(os.environ.get("SKYREELS_FINALIZE_WORKERS", "2"))
+_finalize_executor = ThreadPoolExecutor(max_workers=FINALIZE_WORKERS, thread_name_prefix="finalize")
+_finalize_jobs: dict = {}   # finalize_id -> estado (campos "_" são internos)
+_finalize_lock = threading.Lock()
+_FINALIZE_KEEP = 100        # jobs terminados mantidos em memória
+
+
+def _finalize_public(fjob):
+    return {k: v for k, v in fjob.items() if not k.startswith("_")}
+
+
+def _run_finalize_job(fid):
+    fjob = _finalize_jobs[fid]
+    cancel = fjob["_cancel"]
+    out_path = fjob["_out_path"]
+    if not cancel.is_set():
+        fjob["status"] = "running"
+        fjob["started_ts"] = time.time()
+
+        def on_progress(pct, stage):
+            fjob["progress"] = pct
+            fjob["stage"] = stage
+
+        try:
+            ok, err, stats = _finalize_videos(fjob["_videos"], out_path, on_progress, cancel)
+        except Exception as e:
+            ok, err, stats = False, str(e), {}
+    if cancel.is_set():
+        fjob["status"] = "cancelled"
+        ok = False
+    elif ok:
+        fjob["status"] = "done"
+        fjob["progress"] = 100
+        fjob["stats"] = stats
+        media_index.add(out_path)
+        _schedule_derived(out_path)
+    else:
+        fjob["status"] = "error"
+        fjob["error"] = err
+    if not ok and out_path.exists():
+        out_path.unlink()
+    fjob["finished_ts"] = time.time()
+    fjob["stage"] = None
+    print(f"[finalize] {fid} fila {fjob['queue_id']}: {fjob['status']}")
+    METRIC_FINALIZE_SECONDS.labels(fjob["status"]).observe(
+        fjob["finished_ts"] - (fjob["started_ts"] or fjob["created_ts"]))
+    url = fjob.pop("_callback_url", None)
+    if url:
+        _fire_webhook(url, {"event": "finalize", **_finalize_public(fjob)},
+                      event="finalize", queue_id=fjob["queue_id"])
+    with _finalize_lock:
+        finished = [k for k, j in _finalize_jobs.items() if j.get("finished_ts")]
+        for k in sorted(finished, key=lambda k: _finalize_jobs[k]["finished_ts"])[:-_FINALIZE_KEEP]:
+            del _finalize_jobs[k]
+
+
 @app.route("/nqueues/<int:nq_id>/finalize", methods=["POST"])
 def finalize_nq_route(nq_id):
+    """Enfileira a finalização (concat das cenas concluídas) e responde 202 com o id.
+    Acompanhar em GET /finalize/<id>; ?callback_url= recebe webhook ao terminar."""
+    callback_url = request.args.get("callback_url") or None
     with nq_lock:
         nq = next((q for q in named_queues if q["id"] == nq_id), None)
         if nq is None:
@@ -1915,79 +3591,284 @@ def finalize_nq_route(nq_id):
     safe_name = "".join(c if c.isalnum() or c in "-_" else "_" for c in nq_name)
     out_path = out_dir / f"{safe_name}_{ts}.mp4"
 
-    # Check audio presence per video
-    infos = [_video_info(v) for v in videos]
-    any_audio = any(has_aud for has_aud, _ in infos)
+    fid = uuid.uuid4().hex[:12]
+    fjob = {
+        "id": fid,
+        "queue_id": nq_id,
+        "status": "pending",   # pending | running | done | error | cancelled
+        "progress": 0,
+        "stage": None,
+        "scene_count": len(videos),
+        "output_video": str(out_path.relative_to(PROJECT_ROOT)),
+        "error": None,
+        "stats": None,
+        "created_ts": time.time(),
+        "started_ts": None,
+        "finished_ts": None,
+        "_videos": videos,
+        "_out_path": out_path,
+        "_cancel": threading.Event(),
+        "_callback_url": callback_url,
+    }
+    # Checagem e inserção no mesmo lock: dois POSTs simultâneos não passam ambos
+    with _finalize_lock:
+        active = next((j for j in _finalize_jobs.values()
+                       if j["queue_id"] == nq_id and j["status"] in ("pending", "running")), None)
+        if active is None:
+            _finalize_jobs[fid] = fjob
+    if active:
+        return jsonify({"error": "Finalização já em andamento", "finalize_id": active["id"]}), 409
+    _finalize_executor.submit(_run_finalize_job, fid)
+    return jsonify({"ok": True, "finalize_id": fid, **_finalize_public(fjob)}), 202
+
+
+@app.route("/finalize")
+def finalize_list_route():
+    """Finalizações em memória (mais recentes primeiro); ?queue_id= filtra."""
+    queue_id = request.args.get("queue_id", type=int)
+    with _finalize_lock:
+        jobs = [_finalize_public(j) for j in _finalize_jobs.values()
+                if queue_id is None or j["queue_id"] == queue_id]
+    jobs.sort(key=lambda j: j["created_ts"], reverse=True)
+    return jsonify({"jobs": jobs})
+
+
+@app.route("/finalize/<fid>")
+def finalize_status_route(fid):
+    fjob = _finalize_jobs.get(fid)
+    if fjob is None:
+        return jsonify({"error": "Finalização não encontrada"}), 404
+    return jsonify(_finalize_public(fjob))
+
+
+@app.route("/finalize/<fid>/cancel", methods=["POST"])
+def finalize_cancel_route(fid):
+    fjob = _finalize_jobs.get(fid)
+    if fjob is None:
+        return jsonify({"error": "Finalização não encontrada"}), 404
+    if fjob["status"] not in ("pending", "running"):
+        return jsonify({"error": f"Finalização já terminou ({fjob['status']})"}), 400
+    fjob["_cancel"].set()
+    return jsonify({"ok": True})
 
-    import tempfile
 
-    if not any_audio:
-        # All silent — simple concat copy
-        with tempfile.NamedTemporaryFile(mode="w", suffix=".txt", delete=False) as f:
-            for v in videos:
-                f.write(f"file '{v}'\n")
-            list_path = f.name
+# ---- Derivados: poster, sprite e preview ----
+# Cada vídeo ganha <dir>/.derived/<stem>/ com poster.jpg, sprite.jpg (miniaturas pra
+# scrubbing) e preview.mp4 (H.264 360p, bitrate baixo) — a galeria não baixa mais o mp4
+# original. manifest.json guarda tamanho/mtime da origem: se o vídeo mudar (mix de áudio,
+# regeração), os derivados são refeitos. Rodam num pool pequeno, com ffmpeg em prioridade
+# baixa (nice) e poucas threads, pra não disputar CPU com a geração. O total em disco tem
+# teto (SKYREELS_DERIVED_CACHE_MB) com descarte LRU, como o asset_cache: uma pasta
+# descartada é refeita na próxima vez que a galeria pedir.
+DERIVED_PARAMS = {
+    "v": 1,
+    "poster_w": 480,
+    "sprite_cols": 5, "sprite_rows": 2, "sprite_w": 160,
+    "preview_h": 360, "preview_crf": 30, "preview_maxrate": "600k",
+}
+DERIVED_KINDS = {"poster": "poster.jpg", "sprite": "sprite.jpg", "preview": "preview.mp4"}
+DERIVED_WORKERS = int(os.environ.get("SKYREELS_DERIVED_WORKERS", "1"))
+_derived_executor = ThreadPoolExecutor(max_workers=DERIVED_WORKERS, thread_name_prefix="derived")
+_derived_pending: set = set()
+_derived_lock = threading.Lock()
+DERIVED_MAX_BYTES = int(os.environ.get("SKYREELS_DERIVED_CACHE_MB", "2048")) * 1024 * 1024
+_derived_lru: OrderedDict = OrderedDict()   # pasta .derived/<stem> (absoluta) -> bytes, menos recente primeiro
+_derived_bytes = 0
+_NICE_AVAILABLE = shutil.which("nice") is not None
+
+
+def _derived_dir(video: Path) -> Path:
+    return video.parent / ".derived" / video.stem
+
+
+def _derived_manifest(video: Path):
+    """manifest.json se os derivados estão em dia com o vídeo; senão None."""
+    ddir = _derived_dir(video)
+    try:
+        st = video.stat()
+        manifest = json.loads((ddir / "manifest.json").read_text())
+    except (OSError, ValueError):
+        return None
+    if (manifest.get("size") != st.st_size or manifest.get("mtime_ns") != st.st_mtime_ns
+            or manifest.get("params") != DERIVED_PARAMS):
+        return None
+    if not all((ddir / name).exists() for name in DERIVED_KINDS.values()):
+        return None
+    return manifest
+
+
+def _dir_bytes(ddir: Path) -> int:
+    return sum(f.stat().st_size for f in ddir.iterdir() if f.is_file())
+
+
+def _derived_touch(ddir: Path, size=None):
+    """Marca a pasta de derivados como recém-usada (size: bytes, ao criar/refazer) e
+    aplica o teto de DERIVED_MAX_BYTES."""
+    global _derived_bytes
+    key = os.path.abspath(ddir)
+    with _derived_lock:
+        if size is None and key not in _derived_lru:
+            return
+        if size is not None:
+            _derived_bytes += size - _derived_lru.pop(key, 0)
+            _derived_lru[key] = size
+        _derived_lru.move_to_end(key)
+    try:
+        os.utime(ddir / "manifest.json")   # mtime = último uso: ordem do LRU após reiniciar
+    except OSError:
+        pass
+    _derived_evict()
+
+
+def _derived_evict():
+    """Apaga as pastas menos usadas até o total caber em DERIVED_MAX_BYTES."""
+    global _derived_bytes
+    victims = []
+    with _derived_lock:
+        while _derived_bytes > DERIVED_MAX_BYTES and len(_derived_lru) > 1:
+            key, size = _derived_lru.popitem(last=False)
+            _derived_bytes -= size
+            victims.append(key)
+    for key in victims:
+        shutil.rmtree(key, ignore_errors=True)
+
+
+def _load_derived_index():
+    """Registra as pastas de derivados já em result/ (ordem do LRU pelo mtime do manifest)."""
+    global _derived_bytes
+    found = []
+    for manifest in RESULT_DIR.glob("**/.derived/*/manifest.json"):
         try:
-            result = subprocess.run(
-                ["ffmpeg", "-y", "-f", "concat", "-safe", "0",
-                 "-i", list_path, "-c", "copy", str(out_path)],
-                capture_output=True, text=True, timeout=600)
-        finally:
-            os.unlink(list_path)
-    else:
-        # Mixed audio/silent — filter_complex to normalize all streams then concat
-        cmd = ["ffmpeg", "-y"]
-        for v in videos:
-            cmd.extend(["-i", str(v)])
-
-        # Determine target resolution (most common among done videos)
-        from collections import Counter
-        res_list = []
-        for v in videos:
-            r = subprocess.run(
-                ["ffprobe", "-v", "quiet", "-select_streams", "v:0",
-                 "-show_entries", "stream=width,height", "-of", "csv=p=0", str(v)],
-                capture_output=True, text=True, timeout=10)
-            res_list.append(r.stdout.strip())
-        target_res = Counter(res_list).most_common(1)[0][0]
-        tw, th = target_res.split(",")
-
-        filter_parts = []
-        concat_inputs = ""
-        for i, (has_aud, dur) in enumerate(infos):
-            filter_parts.append(
-                f"[{i}:v]scale={tw}:{th}:force_original_aspect_ratio=decrease,"
-                f"pad={tw}:{th}:(ow-iw)/2:(oh-ih)/2:black,"
-                f"setpts=PTS-STARTPTS[v{i}]"
-            )
-            if has_aud:
-                filter_parts.append(
-                    f"[{i}:a]aresample=44100,aformat=channel_layouts=stereo,"
-                    f"asetpts=PTS-STARTPTS[a{i}]"
-                )
-            else:
-                filter_parts.append(
-                    f"anullsrc=r=44100:cl=stereo,atrim=duration={dur:.3f},"
-                    f"asetpts=PTS-STARTPTS[a{i}]"
-                )
-            concat_inputs += f"[v{i}][a{i}]"
-
-        n = len(videos)
-        filter_parts.append(f"{concat_inputs}concat=n={n}:v=1:a=1[v][a]")
-        cmd += [
-            "-filter_complex", ";".join(filter_parts),
-            "-map", "[v]", "-map", "[a]",
-            "-c:v", "libx264", "-preset", "ultrafast", "-crf", "23",
-            "-c:a", "aac", "-ar", "44100", "-ac", "2", "-b:a", "128k",
-            str(out_path)
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=600)
+            found.append((manifest.stat().st_mtime, os.path.abspath(manifest.parent),
+                          _dir_bytes(manifest.parent)))
+        except OSError:
+            continue
+    with _derived_lock:
+        # Da mais recente para a mais antiga, cada uma vai para o início; pastas já
+        # tocadas desde o startup continuam no fim
+        for _, ddir, size in sorted(found, key=lambda f: f[0], reverse=True):
+            if ddir not in _derived_lru:
+                _derived_lru[ddir] = size
+                _derived_lru.move_to_end(ddir, last=False)
+                _derived_bytes += size
+    _derived_evict()
+    return len(found)
+
+
+def _derived_stats():
+    with _derived_lock:
+        return {"entries": len(_derived_lru), "bytes": _derived_bytes, "max_bytes": DERIVED_MAX_BYTES}
+
+
+def _derived_command(cmd):
+    """ffmpeg dos derivados em prioridade baixa: prefixo nice, não preexec_fn (que não é
+    seguro num processo com threads)."""
+    return ["nice", "-n", "10"] + cmd if _NICE_AVAILABLE else cmd
+
+
+def _build_derived(video: Path):
+    st = video.stat()
+    ddir = _derived_dir(video)
+    ddir.mkdir(parents=True, exist_ok=True)
+    _, dur = _video_info(video)
+    params = _video_stream_params(video)
+    w, h = (int(params[0]), int(params[1])) if params else (16, 9)
+    p = DERIVED_PARAMS
+    count = p["sprite_cols"] * p["sprite_rows"]
+    frame_h = max(2, round(p["sprite_w"] * h / w / 2) * 2)
+    base = ["ffmpeg", "-y", "-loglevel", "error", "-threads", "2"]
+    steps = [
+        ("poster.jpg", base + ["-ss", f"{min(1.0, dur / 2):.2f}", "-i", str(video), "-frames:v", "1",
+                               "-vf", f"scale={p['poster_w']}:-2", "-q:v", "4"]),
+        ("sprite.jpg", base + ["-i", str(video), "-frames:v", "1", "-q:v", "5", "-vf",
+                               f"fps={count / max(dur, 0.1):.4f},scale={p['sprite_w']}:{frame_h},"
+                               f"tile={p['sprite_cols']}x{p['sprite_rows']}"]),
+        ("preview.mp4", base + ["-i", str(video), "-vf", f"scale=-2:{p['preview_h']}",
+                                "-c:v", "libx264", "-preset", "veryfast", "-crf", str(p["preview_crf"]),
+                                "-maxrate", p["preview_maxrate"], "-bufsize", "1200k", "-pix_fmt", "yuv420p",
+                                "-c:a", "aac", "-b:a", "64k", "-movflags", "+faststart"]),
+    ]
+    for name, cmd in steps:
+        dst = ddir / name
+        tmp = dst.with_name(f".tmp_{name}")
+        r = subprocess.run(_derived_command(cmd + [str(tmp)]), capture_output=True, text=True, timeout=600)
+        if r.returncode != 0 or not tmp.exists():
+            if tmp.exists():
+                tmp.unlink()
+            raise RuntimeError(f"{name}: {r.stderr.strip()[-300:]}")
+        tmp.replace(dst)
+    manifest = {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "params": DERIVED_PARAMS,
+        "duration": dur,
+        "sprite_grid": {"cols": p["sprite_cols"], "rows": p["sprite_rows"], "count": count,
+                        "frame_w": p["sprite_w"], "frame_h": frame_h,
+                        "interval": round(max(dur, 0.1) / count, 3)},
+    }
+    (ddir / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    _derived_touch(ddir, _dir_bytes(ddir))
+    return manifest
+
+
+def _derived_task(video: Path):
+    try:
+        _build_derived(video)
+    except Exception as e:
+        print(f"[derived] {video}: {e}")
+    finally:
+        with _derived_lock:
+            _derived_pending.discard(str(video))
 
-    if result.returncode != 0:
-        return jsonify({"error": f"ffmpeg falhou: {result.stderr[-500:]}"}), 500
 
-    rel_path = str(out_path.relative_to(PROJECT_ROOT))
-    return jsonify({"ok": True, "output_video": rel_path, "scene_count": len(videos)})
+def _schedule_derived(video: Path):
+    """Agenda os derivados do vídeo (no-op se já estão em dia ou na fila)."""
+    if not video.exists() or _derived_manifest(video) is not None:
+        return False
+    with _derived_lock:
+        if str(video) in _derived_pending:
+            return True
+        _derived_pending.add(str(video))
+    _derived_executor.submit(_derived_task, video)
+    return True
+
+
+@app.route("/derived-status/<path:filepath>")
+def derived_status(filepath):
+    """Estado dos derivados de um vídeo; agenda a geração se faltarem (vídeos antigos)."""
+    video = _media_path(filepath)
+    if video is None:
+        return jsonify({"error": "Vídeo não encontrado"}), 404
+    manifest = _derived_manifest(video)
+    if manifest is None:
+        _schedule_derived(video)
+        return jsonify({"ready": False, "pending": True})
+    _derived_touch(_derived_dir(video))
+    return jsonify({
+        "ready": True,
+        "poster": f"/derived/poster/{filepath}",
+        "sprite": f"/derived/sprite/{filepath}",
+        "preview": f"/derived/preview/{filepath}",
+        "duration": manifest.get("duration"),
+        "sprite_grid": manifest.get("sprite_grid"),
+    })
+
+
+@app.route("/derived/<any(poster, sprite, preview):kind>/<path:filepath>")
+def serve_derived(kind, filepath):
+    """Serve o derivado. Se ainda não existe, agenda; o preview cai no vídeo original."""
+    video = _media_path(filepath)
+    if video is None:
+        return "Not found", 404
+    if _derived_manifest(video) is None:
+        _schedule_derived(video)
+        if kind == "preview":
+            return redirect(f"/video/{filepath}")
+        return "Not ready", 404
+    mimetype = "video/mp4" if kind == "preview" else "image/jpeg"
+    _derived_touch(_derived_dir(video))
+    return _send_media(_derived_dir(video) / DERIVED_KINDS[kind], mimetype=mimetype,
+                       version=version_token(video.stat()))
 
 
 @app.route("/nqueues/<int:nq_id>/mix-audio", methods=["POST"])
@@ -2054,7 +3935,7 @@ def nq_set_audio_bg(nq_id):
         for job in nq["jobs"]:
             job["audio_bg"] = audio_bg
             updated += 1
-    _save_queues()
+    _save_queue(nq_id)
     return jsonify({"ok": True, "updated": updated, "audio_bg": audio_bg})
 
 
@@ -2362,7 +4243,6 @@ def generate_episode_prompts(name):
             if fal_key:
                 try:
                     import fal_client
-                    import urllib.request as urllib_req
                     os.environ["FAL_KEY"] = fal_key
                     fal_ok = True
                 except ImportError:
@@ -2398,7 +4278,7 @@ def generate_episode_prompts(name):
                         })
                         url   = res["images"][0]["url"]
                         dest  = fig_dir / "figurantes_escola.png"
-                        urllib_req.urlretrieve(url, str(dest))
+                        download_url(url, dest)
                         figurantes = [str(dest.relative_to(PROJECT_ROOT))]
                         print(f"[ep-gen] figurantes auto-gerados: {figurantes[0]}")
                     except Exception as fig_err:
@@ -2464,7 +4344,7 @@ def generate_episode_prompts(name):
                             })
 
                         url = res["images"][0]["url"]
-                        urllib_req.urlretrieve(url, str(dest))
+                        download_url(url, dest)
                         rel = str(dest.relative_to(PROJECT_ROOT))
                         amb_map[env["name"].lower()] = rel
                         # Atualizar existing_ref do ambiente com a imagem gerada
@@ -2497,7 +4377,7 @@ def generate_episode_prompts(name):
                             url   = res["images"][0]["url"]
                             safe_n = re.sub(r'[^\w\-]', '_', elem.get("name", "element")[:40])
                             dest  = img_dir / f"{safe_n}.png"
-                            urllib_req.urlretrieve(url, str(dest))
+                            download_url(url, dest)
                             rel = str(dest.relative_to(PROJECT_ROOT))
                             new_refs.append({
                                 "name": elem.get("name"),
@@ -2667,96 +4547,336 @@ APENAS o JSON, nada mais."""
         }), 500
 
 
+# ---- Assets em background: imagens e áudios das cenas ----
+# As rotas de geração por episódio só montam a lista de cenas e respondem 202; cada
+# cena vira uma tarefa num pool limitado (SKYREELS_ASSET_WORKERS). O limite de cada
+# provedor (req/min e chamadas simultâneas) e as novas tentativas com backoff ficam
+# em asset_providers; o resultado de cada cena é gravado assim que chega, então o
+# progresso parcial aparece na UI e sobrevive a falhas das outras cenas.
+ASSET_WORKERS = int(os.environ.get("SKYREELS_ASSET_WORKERS", "6"))
+ASSET_RETRIES = int(os.environ.get("SKYREELS_ASSET_RETRIES", "3"))
+_asset_executor = ThreadPoolExecutor(max_workers=ASSET_WORKERS, thread_name_prefix="assets")
+_asset_jobs: dict = {}       # asset_job_id -> estado (campos "_" são internos)
+_asset_lock = threading.Lock()
+_ASSET_KEEP = 100            # jobs terminados mantidos em memória
+_asset_providers: dict = {}  # (provedor, chave) -> instância (o rate limit é por instância)
+# Falas/imagens idênticas (mesmo provedor, modelo, voz, texto...) saem do cache em vez
+# de irem de novo ao provedor; ?refresh=1 nas rotas força gerar e atualiza o cache.
+asset_cache = AssetCache(PROJECT_ROOT / ".cache" / "assets",
+                         int(os.environ.get("SKYREELS_ASSET_CACHE_MB", "2048")) * 1024 * 1024)
+
+
+def _asset_provider(kind, cfg):
+    """Provedor de "image" (fal) ou "tts" (ElevenLabs); SKYREELS_ASSET_PROVIDER_URL troca
+    os dois por um servidor local. Retorna (provedor, erro, status_http)."""
+    stand_in = os.environ.get("SKYREELS_ASSET_PROVIDER_URL", "")
+    if stand_in:
+        key, factory = ("http", stand_in), lambda: HTTPStandInProvider(stand_in)
+    elif kind == "image":
+        fal_key = cfg.get("fal_key", "") or os.environ.get("FAL_KEY", "")
+        if not fal_key:
+            return None, "FAL_KEY não configurada. Clique em ⚙ na aba Projetos.", 400
+        key, factory = ("fal", fal_key), lambda: FalProvider(fal_key)
+    else:
+        el_key = cfg.get("elevenlabs_key", "") or os.environ.get("ELEVENLABS_API_KEY", "")
+        if not el_key:
+            return None, "ElevenLabs não configurado. Clique em ⚙ na aba Projetos.", 400
+        key, factory = ("elevenlabs", el_key), lambda: ElevenLabsProvider(el_key)
+    with _asset_lock:
+        provider = _asset_providers.get(key)
+        if provider is None:
+            try:
+                provider = _asset_providers[key] = factory()
+            except ImportError:
+                if kind == "image":
+                    return None, "fal-client não instalado. Execute: pip install fal-client", 500
+                return None, "elevenlabs não instalado. Execute: pip install elevenlabs", 500
+    return provider, None, None
+
+
+def _image_cache_key(provider, prompt, ref_paths=(), model=None):
+    # Com model explícito: text-to-image 16:9; sem: nano-banana (/edit se houver refs)
+    refs = [_file_digest(p) for p in list(ref_paths)[:4] if Path(p).exists()]
+    if model:
+        return cache_key(provider.name, model, text=prompt, size="landscape_16_9")
+    model = "fal-ai/nano-banana/edit" if refs else "fal-ai/nano-banana"
+    return cache_key(provider.name, model, settings={"refs": refs, "format": "png"}, text=prompt, size="16:9")
+
+
+def _tts_cache_key(provider, text, voice_id):
+    return cache_key(provider.name, provider.tts_model, voice_id,
+                     settings={"format": provider.tts_format}, text=text)
+
+
+def _generate_cached(provider, fn, key, dest, cancel, refresh=False, *args, **kwargs):
+    """Coloca em dest o asset da chave: do cache se existir (e não for refresh), senão
+    gera no provedor e guarda. Retorna os bytes vindos do cache (0 = gerado agora)."""
+    if not refresh:
+        hit = asset_cache.fetch(key, dest)
+        if hit is not None:
+            return hit
+    data = call_with_retry(provider, fn, *args, retries=ASSET_RETRIES, cancel=cancel, **kwargs)
+    asset_cache.store(key, data, dest)
+    return 0
+
+
+def _fit_duration_to_audio(job, audio_path):
+    """Duração mínima da cena para caber o áudio (+1s de respiro), ou None se já cabe."""
+    import math
+    aud_dur = _audio_duration(audio_path)
+    if aud_dur <= 0:
+        return None
+    min_dur = math.ceil(aud_dur) + 1
+    if job.get("duration", 0) >= min_dur:
+        return None
+    print(f"[audio-gen] cena '{job.get('label','')}': áudio {aud_dur:.1f}s → duration={min_dur}s")
+    return min_dur
+
+
+def _asset_public(ajob):
+    return {k: v for k, v in ajob.items() if not k.startswith("_")}
+
+
+def _active_asset_job_locked(kind, queue_id):
+    return next((j for j in _asset_jobs.values()
+                 if j["kind"] == kind and j["queue_id"] == queue_id
+                 and j["status"] in ("pending", "running")), None)
+
+
+def _active_asset_job(kind, queue_id):
+    with _asset_lock:
+        return _active_asset_job_locked(kind, queue_id)
+
+
+def _finish_asset_job(ajob):
+    if ajob["_cancel"].is_set():
+        ajob["status"] = "cancelled"
+    elif ajob["failed"] and not ajob["done"]:
+        ajob["status"] = "error"
+    else:
+        ajob["status"] = "done"
+    ajob["finished_ts"] = time.time()
+    print(f"[assets] {ajob['id']} {ajob['kind']}: {ajob['status']} "
+          f"({ajob['done']} ok — {ajob['cache_hits']} do cache, {ajob['failed']} com erro, "
+          f"{ajob['skipped']} cancelada(s))")
+    with _asset_lock:
+        finished = [k for k, j in _asset_jobs.items() if j.get("finished_ts")]
+        for k in sorted(finished, key=lambda k: _asset_jobs[k]["finished_ts"])[:-_ASSET_KEEP]:
+            del _asset_jobs[k]
+
+
+def _run_asset_task(ajob, idx, fn):
+    cancel = ajob["_cancel"]
+    if ajob["status"] == "pending":
+        ajob["status"] = "running"
+        ajob["started_ts"] = time.time()
+    outcome, err, cached = "skipped", None, 0
+    if not cancel.is_set():
+        try:
+            result = fn(cancel)
+            ajob["_apply"](idx, result)
+            outcome, cached = "done", result.get("cached_bytes", 0)
+        except Exception as e:
+            if not cancel.is_set():
+                outcome, err = "failed", str(e)
+                if ajob["_on_error"]:
+                    ajob["_on_error"](idx, err)
+    with _asset_lock:
+        ajob[outcome] += 1
+        if cached:
+            ajob["cache_hits"] += 1
+            ajob["cache_hit_bytes"] += cached
+        if err:
+            ajob["errors"].append(f"Cena {idx+1}: {err}")
+        finished = ajob["done"] + ajob["failed"] + ajob["skipped"]
+        ajob["progress"] = round(100 * finished / ajob["total"])
+    if finished == ajob["total"]:
+        _finish_asset_job(ajob)
+
+
+def _start_asset_job(kind, tasks, apply, on_error=None, queue_id=None, project=None,
+                     jobs=None, errors=()):
+    """Enfileira uma tarefa por cena. tasks: [(índice da cena, fn(cancel) -> dict)];
+    apply(índice, resultado) grava o resultado da cena; on_error(índice, msg) é opcional.
+    `errors` são cenas já recusadas na validação (contam como falha). O dict de cada
+    cena pode trazer cached_bytes (> 0 quando o asset saiu do asset_cache).
+    Devolve (ajob, criado): com queue_id, se já há um job ativo do mesmo tipo para a
+    fila, devolve esse job e criado=False sem enfileirar nada."""
+    aid = uuid.uuid4().hex[:12]
+    ajob = {
+        "id": aid,
+        "kind": kind,              # images | audio
+        "queue_id": queue_id,
+        "project": project,
+        "status": "pending",       # pending | running | done | error | cancelled
+        "total": len(tasks) + len(errors),
+        "done": 0,
+        "failed": len(errors),
+        "skipped": 0,
+        "cache_hits": 0,           # cenas atendidas pelo asset_cache, sem chamar o provedor
+        "cache_hit_bytes": 0,
+        "progress": 0,
+        "errors": list(errors),
+        "created_ts": time.time(),
+        "started_ts": None,
+        "finished_ts": None,
+        "_apply": apply,
+        "_on_error": on_error,
+        "_cancel": threading.Event(),
+    }
+    if jobs is not None:
+        ajob["jobs"] = jobs        # rotas sem fila: as cenas atualizadas voltam no status
+    # Checagem e inserção no mesmo lock: dois POSTs simultâneos não passam ambos
+    with _asset_lock:
+        active = _active_asset_job_locked(kind, queue_id) if queue_id is not None else None
+        if active is None:
+            _asset_jobs[aid] = ajob
+    if active:
+        return active, False
+    if not tasks:
+        ajob["progress"] = 100
+        _finish_asset_job(ajob)
+    for idx, fn in tasks:
+        _asset_executor.submit(_run_asset_task, ajob, idx, fn)
+    return ajob, True
+
+
+def _asset_accepted(ajob):
+    return jsonify({"ok": True, "asset_job_id": ajob["id"], **_asset_public(ajob)}), 202
+
+
+def _nq_scene_updater(nq_id, update):
+    """apply() das rotas de fila: atualiza a cena pelo id sob nq_lock e persiste a fila."""
+    def apply(idx, result):
+        with nq_lock:
+            nq = next((q for q in named_queues if q["id"] == nq_id), None)
+            job = next((j for j in nq["jobs"] if j["id"] == result["job_id"]), None) if nq else None
+            if job is not None:
+                update(job, result)
+        if job is not None:
+            _save_queue(nq_id)
+    return apply
+
+
+def _nq_ep_dir(nq, proj_name, sub):
+    ep_slug = nq.get("ep_code") or re.sub(r'[^\w\-]', '_', nq.get("name", f"ep_{nq['id']}"))[:60]
+    path = PROJECTS_DIR / proj_name / "episodios" / ep_slug / sub
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+@app.route("/asset-jobs")
+def asset_jobs_list_route():
+    """Jobs de assets em memória (mais recentes primeiro); ?queue_id= filtra."""
+    queue_id = request.args.get("queue_id", type=int)
+    with _asset_lock:
+        jobs = [_asset_public(j) for j in _asset_jobs.values()
+                if queue_id is None or j["queue_id"] == queue_id]
+    jobs.sort(key=lambda j: j["created_ts"], reverse=True)
+    return jsonify({"jobs": jobs})
+
+
+@app.route("/asset-jobs/<aid>")
+def asset_job_status_route(aid):
+    ajob = _asset_jobs.get(aid)
+    if ajob is None:
+        return jsonify({"error": "Job de assets não encontrado"}), 404
+    return jsonify(_asset_public(ajob))
+
+
+@app.route("/asset-jobs/<aid>/cancel", methods=["POST"])
+def asset_job_cancel_route(aid):
+    """Cenas já enviadas ao provedor terminam; as que ainda não começaram são puladas."""
+    ajob = _asset_jobs.get(aid)
+    if ajob is None:
+        return jsonify({"error": "Job de assets não encontrado"}), 404
+    if ajob["status"] not in ("pending", "running"):
+        return jsonify({"error": f"Job de assets já terminou ({ajob['status']})"}), 400
+    ajob["_cancel"].set()
+    return jsonify({"ok": True})
+
+
 @app.route("/projects/<name>/generate-images", methods=["POST"])
 def generate_episode_images(name):
-    import urllib.request as urllib_req
-    try:
-        import fal_client
-    except ImportError:
-        return jsonify({"error": "fal-client não instalado. Execute: pip install fal-client"}), 500
-
+    """Gera a imagem de cada cena do corpo ({jobs}) em background; 202 com asset_job_id.
+    As cenas atualizadas (ref_imgs ou _img_error) voltam em GET /asset-jobs/<id>."""
     cfg = _load_global_config()
-    fal_key = cfg.get("fal_key", "") or os.environ.get("FAL_KEY", "")
-    if not fal_key:
-        return jsonify({"error": "FAL_KEY não configurada. Clique em ⚙ na aba Projetos."}), 400
+    provider, err, code = _asset_provider("image", cfg)
+    if err:
+        return jsonify({"error": err}), code
 
-    os.environ["FAL_KEY"] = fal_key
     data    = request.get_json(force=True)
-    jobs    = data.get("jobs", [])
+    jobs    = list(data.get("jobs", []))
     model   = cfg.get("image_model", "fal-ai/flux/dev")
+    refresh = request.args.get("refresh") == "1"
     img_dir = PROJECTS_DIR / name / "imagens"
     img_dir.mkdir(exist_ok=True)
 
-    updated = []
-    for job in jobs:
-        img_prompt = job.get("image_prompt") or job.get("prompt", "")[:400]
-        try:
-            res = fal_client.subscribe(model, arguments={
-                "prompt": img_prompt,
-                "num_images": 1,
-                "image_size": "landscape_16_9"
-            })
-            url = res["images"][0]["url"]
+    def make_task(job):
+        def task(cancel):
+            img_prompt = job.get("image_prompt") or job.get("prompt", "")[:400]
             fname = secure_filename(f"{job.get('label','scene')[:40]}.jpg").replace(" ", "_")
             dest  = img_dir / fname
-            urllib_req.urlretrieve(url, str(dest))
-            rel   = str(dest.relative_to(PROJECT_ROOT))
-            job   = {**job, "ref_imgs": [rel]}
-        except Exception as e:
-            job = {**job, "_img_error": str(e)}
-        updated.append(job)
+            key   = _image_cache_key(provider, img_prompt, model=model)
+            cached = _generate_cached(provider, "generate_image", key, dest, cancel, refresh,
+                                      img_prompt, model=model)
+            return {"rel": str(dest.relative_to(PROJECT_ROOT)), "cached_bytes": cached}
+        return task
+
+    def apply(idx, result):
+        jobs[idx] = {**jobs[idx], "ref_imgs": [result["rel"]]}
+        jobs[idx].pop("_img_error", None)
 
-    return jsonify({"ok": True, "jobs": updated})
+    def on_error(idx, msg):
+        jobs[idx] = {**jobs[idx], "_img_error": msg}
+
+    tasks = [(i, make_task(job)) for i, job in enumerate(jobs)]
+    return _asset_accepted(_start_asset_job("images", tasks, apply, on_error, project=name, jobs=jobs)[0])
 
 
 @app.route("/projects/<name>/generate-audio", methods=["POST"])
 def generate_episode_audio(name):
-    try:
-        from elevenlabs.client import ElevenLabs as EL
-    except ImportError:
-        return jsonify({"error": "elevenlabs não instalado. Execute: pip install elevenlabs"}), 500
-
-    cfg    = _load_global_config()
-    el_key = cfg.get("elevenlabs_key", "") or os.environ.get("ELEVENLABS_API_KEY", "")
-    voice  = cfg.get("elevenlabs_voice_id", "")
-    if not el_key or not voice:
+    """Gera a narração de cada cena com audio_text em background; 202 com asset_job_id."""
+    cfg   = _load_global_config()
+    voice = cfg.get("elevenlabs_voice_id", "")
+    provider, err, code = _asset_provider("tts", cfg)
+    if err:
+        return jsonify({"error": err}), code
+    if not voice:
         return jsonify({"error": "ElevenLabs não configurado. Clique em ⚙ na aba Projetos."}), 400
 
     data    = request.get_json(force=True)
-    jobs    = data.get("jobs", [])
+    jobs    = list(data.get("jobs", []))
+    refresh = request.args.get("refresh") == "1"
     aud_dir = PROJECTS_DIR / name / "audios"
     aud_dir.mkdir(exist_ok=True)
-    client  = EL(api_key=el_key)
 
-    updated = []
-    for job in jobs:
-        text = _strip_audio_prefix(job.get("audio_text") or "")
-        if not text:
-            updated.append(job)
-            continue
-        try:
-            audio_bytes = b"".join(client.text_to_speech.convert(
-                text=text, voice_id=voice,
-                model_id="eleven_multilingual_v2",
-                output_format="mp3_44100_128"
-            ))
+    def make_task(job, text):
+        def task(cancel):
             fname = secure_filename(f"{job.get('label','scene')[:40]}.mp3").replace(" ", "_")
             dest  = aud_dir / fname
-            dest.write_bytes(audio_bytes)
-            rel   = str(dest.relative_to(PROJECT_ROOT))
-            import math
-            aud_dur = _audio_duration(dest)
-            new_job = {**job, "input_audio": rel}
-            if aud_dur > 0:
-                min_dur = math.ceil(aud_dur) + 1
-                if new_job.get("duration", 0) < min_dur:
-                    new_job["duration"] = min_dur
-            job = new_job
-        except Exception as e:
-            job = {**job, "_audio_error": str(e)}
-        updated.append(job)
-
-    return jsonify({"ok": True, "jobs": updated})
+            cached = _generate_cached(provider, "synthesize", _tts_cache_key(provider, text, voice),
+                                      dest, cancel, refresh, text, voice)
+            return {"rel": str(dest.relative_to(PROJECT_ROOT)), "cached_bytes": cached,
+                    "duration": _fit_duration_to_audio(job, dest)}
+        return task
+
+    def apply(idx, result):
+        new_job = {**jobs[idx], "input_audio": result["rel"]}
+        new_job.pop("_audio_error", None)
+        if result["duration"]:
+            new_job["duration"] = result["duration"]
+        jobs[idx] = new_job
+
+    def on_error(idx, msg):
+        jobs[idx] = {**jobs[idx], "_audio_error": msg}
+
+    tasks = []
+    for i, job in enumerate(jobs):
+        text = _strip_audio_prefix(job.get("audio_text") or "")
+        if text:
+            tasks.append((i, make_task(job, text)))
+    return _asset_accepted(_start_asset_job("audio", tasks, apply, on_error, project=name, jobs=jobs)[0])
 
 
 def _nq_get_project(nq_id):
@@ -2770,120 +4890,98 @@ def _nq_get_project(nq_id):
 
 @app.route("/nqueues/<int:nq_id>/generate-images", methods=["POST"])
 def nq_generate_images(nq_id):
-    import urllib.request as urllib_req
+    """Gera em background a imagem de cada cena não concluída (nano-banana, /edit quando
+    a cena tem refs). Cada imagem entra na fila assim que fica pronta; 202 com asset_job_id."""
     nq, proj_name = _nq_get_project(nq_id)
     if nq is None:
         return jsonify({"error": "Fila não encontrada"}), 404
     if not proj_name:
         return jsonify({"error": "Episódio não vinculado a um projeto"}), 400
-    try:
-        import fal_client
-    except ImportError:
-        return jsonify({"error": "fal-client não instalado"}), 500
-
-    cfg = _load_global_config()
-    fal_key = cfg.get("fal_key", "") or os.environ.get("FAL_KEY", "")
-    if not fal_key:
-        return jsonify({"error": "FAL_KEY não configurada. Clique em ⚙ na aba Projetos."}), 400
-
-    os.environ["FAL_KEY"] = fal_key
-    model = cfg.get("image_model", "fal-ai/flux/dev")
-    # Imagens do episódio ficam em projetos/<proj>/temp/<ep-name>/imagens/
-    ep_slug = nq.get("ep_code") or re.sub(r'[^\w\-]', '_', nq.get("name", f"ep_{nq_id}"))[:60]
-    img_dir = PROJECTS_DIR / proj_name / "episodios" / ep_slug / "imagens"
-    img_dir.mkdir(parents=True, exist_ok=True)
-
+    # Checagem rápida (evita montar o provedor); _start_asset_job confirma sob o lock
+    active = _active_asset_job("images", nq_id)
+    if active:
+        return jsonify({"error": "Geração de imagens já em andamento", "asset_job_id": active["id"]}), 409
+    provider, err, code = _asset_provider("image", _load_global_config())
+    if err:
+        return jsonify({"error": err}), code
+
+    # Imagens do episódio ficam em projetos/<proj>/episodios/<ep-slug>/imagens/
+    img_dir = _nq_ep_dir(nq, proj_name, "imagens")
+    refresh = request.args.get("refresh") == "1"
     with nq_lock:
-        jobs = list(nq.get("jobs", []))
+        jobs = [dict(j) for j in nq.get("jobs", [])]
 
-    errors = []
-    for i, job in enumerate(jobs):
-        if job.get("status") == "done":
-            continue
-        img_prompt = job.get("image_prompt") or job.get("prompt", "")[:400]
-        ref_paths  = [r for r in (job.get("ref_imgs") or []) if r and not r.startswith("http")]
-        try:
-            if ref_paths:
-                # Tem imagens de referência → usar nano-banana/edit (Gemini 2.5 Flash)
-                image_urls = []
-                for rp in ref_paths[:4]:   # máx 4 refs
-                    full = PROJECT_ROOT / rp
-                    if full.exists():
-                        image_urls.append(fal_client.upload_file(str(full)))
-                if image_urls:
-                    # Com refs → nano-banana/edit (Gemini 2.5 Flash + referências)
-                    res = fal_client.subscribe("fal-ai/nano-banana/edit", arguments={
-                        "prompt": img_prompt,
-                        "image_urls": image_urls,
-                        "num_images": 1,
-                        "aspect_ratio": "16:9",
-                        "output_format": "png",
-                    })
-                else:
-                    # Refs não encontradas em disco → text-to-image
-                    res = fal_client.subscribe("fal-ai/nano-banana", arguments={
-                        "prompt": img_prompt,
-                        "num_images": 1,
-                        "aspect_ratio": "16:9",
-                        "output_format": "png",
-                    })
-            else:
-                # Sem ref_imgs na cena → nano-banana text-to-image
-                res = fal_client.subscribe("fal-ai/nano-banana", arguments={
-                    "prompt": img_prompt,
-                    "num_images": 1,
-                    "aspect_ratio": "16:9",
-                    "output_format": "png",
-                })
-            url   = res["images"][0]["url"]
+    def make_task(job):
+        def task(cancel):
+            img_prompt = job.get("image_prompt") or job.get("prompt", "")[:400]
             fname = secure_filename(f"{job.get('label','scene')[:40]}.png").replace(" ", "_")
             dest  = img_dir / fname
-            urllib_req.urlretrieve(url, str(dest))
-            rel   = str(dest.relative_to(PROJECT_ROOT))
-            # Preserva as ref_imgs originais e adiciona a imagem gerada como primeira (máx 4)
-            orig_refs = [r for r in (job.get("ref_imgs") or []) if r != rel]
-            jobs[i] = {**job, "ref_imgs": ([rel] + orig_refs)[:4]}
-        except Exception as e:
-            errors.append(f"Cena {i+1}: {e}")
-
-    with nq_lock:
-        nq2 = next((q for q in named_queues if q["id"] == nq_id), None)
-        if nq2:
-            nq2["jobs"] = jobs
-    _save_queues()
-    return jsonify({"ok": True, "updated": len(jobs), "errors": errors})
+            # A imagem gerada numa rodada anterior (primeira ref da cena) não serve de
+            # referência para ela mesma — senão cada rodada mudaria a chave do cache
+            ref_paths  = [PROJECT_ROOT / r for r in (job.get("ref_imgs") or [])
+                          if r and not r.startswith("http") and PROJECT_ROOT / r != dest]
+            key   = _image_cache_key(provider, img_prompt, ref_paths)
+            cached = _generate_cached(provider, "generate_image", key, dest, cancel, refresh,
+                                      img_prompt, ref_paths)
+            return {"job_id": job["id"], "rel": str(dest.relative_to(PROJECT_ROOT)), "cached_bytes": cached}
+        return task
+
+    def update(job, result):
+        # Preserva as ref_imgs originais e adiciona a imagem gerada como primeira (máx 4)
+        orig_refs = [r for r in (job.get("ref_imgs") or []) if r != result["rel"]]
+        job["ref_imgs"] = ([result["rel"]] + orig_refs)[:4]
+
+    tasks = [(i, make_task(job)) for i, job in enumerate(jobs) if job.get("status") != "done"]
+    ajob, created = _start_asset_job("images", tasks, _nq_scene_updater(nq_id, update),
+                                     queue_id=nq_id, project=proj_name)
+    if not created:
+        return jsonify({"error": "Geração de imagens já em andamento", "asset_job_id": ajob["id"]}), 409
+    return _asset_accepted(ajob)
 
 
 @app.route("/nqueues/<int:nq_id>/generate-audio", methods=["POST"])
 def nq_generate_audio(nq_id):
+    """Gera em background a narração de cada cena com audio_text; 202 com asset_job_id."""
     nq, proj_name = _nq_get_project(nq_id)
     if nq is None:
         return jsonify({"error": "Fila não encontrada"}), 404
     if not proj_name:
         return jsonify({"error": "Episódio não vinculado a um projeto"}), 400
-    try:
-        from elevenlabs.client import ElevenLabs as EL
-    except ImportError:
-        return jsonify({"error": "elevenlabs não instalado"}), 500
-
-    cfg         = _load_global_config()
-    el_key      = cfg.get("elevenlabs_key", "") or os.environ.get("ELEVENLABS_API_KEY", "")
+    # Checagem rápida (evita montar o provedor); _start_asset_job confirma sob o lock
+    active = _active_asset_job("audio", nq_id)
+    if active:
+        return jsonify({"error": "Geração de áudios já em andamento", "asset_job_id": active["id"]}), 409
+    cfg = _load_global_config()
+    provider, err, code = _asset_provider("tts", cfg)
+    if err:
+        return jsonify({"error": err}), code
     global_voice = cfg.get("elevenlabs_voice_id", "")
-    if not el_key:
-        return jsonify({"error": "ElevenLabs não configurado. Clique em ⚙ na aba Projetos."}), 400
 
     # Mapa de vozes por personagem extraído dos docs do projeto
     proj_voices = _parse_project_voices(proj_name)
-
-    ep_slug = nq.get("ep_code") or re.sub(r'[^\w\-]', '_', nq.get("name", f"ep_{nq_id}"))[:60]
-    aud_dir = PROJECTS_DIR / proj_name / "episodios" / ep_slug / "audios"
-    aud_dir.mkdir(parents=True, exist_ok=True)
-    client  = EL(api_key=el_key)
-
+    aud_dir = _nq_ep_dir(nq, proj_name, "audios")
+    refresh = request.args.get("refresh") == "1"
     with nq_lock:
-        jobs = list(nq.get("jobs", []))
+        jobs = [dict(j) for j in nq.get("jobs", [])]
 
-    errors = []
+    def make_task(job, text, voice):
+        def task(cancel):
+            fname = secure_filename(f"{job.get('label','scene')[:40]}.mp3").replace(" ", "_")
+            dest  = aud_dir / fname
+            cached = _generate_cached(provider, "synthesize", _tts_cache_key(provider, text, voice),
+                                      dest, cancel, refresh, text, voice)
+            return {"job_id": job["id"], "rel": str(dest.relative_to(PROJECT_ROOT)), "voice_id": voice,
+                    "cached_bytes": cached, "duration": _fit_duration_to_audio(job, dest)}
+        return task
+
+    def update(job, result):
+        job["input_audio"] = result["rel"]
+        job["voice_id"]    = result["voice_id"]
+        # Sincroniza duração do job com a duração real do áudio (+1s de respiro)
+        if result["duration"] and job.get("duration", 0) < result["duration"]:
+            job["duration"] = result["duration"]
+
+    tasks, errors = [], []
     for i, job in enumerate(jobs):
         text = _strip_audio_prefix(job.get("audio_text") or "")
         if not text:
@@ -2897,35 +4995,12 @@ def nq_generate_audio(nq_id):
         if not voice:
             errors.append(f"Cena {i+1}: nenhuma voz configurada")
             continue
-        try:
-            audio_bytes = b"".join(client.text_to_speech.convert(
-                text=text, voice_id=voice,
-                model_id="eleven_multilingual_v2",
-                output_format="mp3_44100_128"
-            ))
-            fname = secure_filename(f"{job.get('label','scene')[:40]}.mp3").replace(" ", "_")
-            dest  = aud_dir / fname
-            dest.write_bytes(audio_bytes)
-            rel   = str(dest.relative_to(PROJECT_ROOT))
-            # Sincroniza duração do job com a duração real do áudio (+1s de respiro)
-            import math
-            aud_dur = _audio_duration(dest)
-            new_job = {**job, "input_audio": rel, "voice_id": voice}
-            if aud_dur > 0:
-                min_dur = math.ceil(aud_dur) + 1
-                if new_job.get("duration", 0) < min_dur:
-                    new_job["duration"] = min_dur
-                    print(f"[audio-gen] cena '{job.get('label','')}': áudio {aud_dur:.1f}s → duration={min_dur}s")
-            jobs[i] = new_job
-        except Exception as e:
-            errors.append(f"Cena {i+1}: {e}")
-
-    with nq_lock:
-        nq2 = next((q for q in named_queues if q["id"] == nq_id), None)
-        if nq2:
-            nq2["jobs"] = jobs
-    _save_queues()
-    return jsonify({"ok": True, "updated": len(jobs), "errors": errors})
+        tasks.append((i, make_task(job, text, voice)))
+    ajob, created = _start_asset_job("audio", tasks, _nq_scene_updater(nq_id, update),
+                                     queue_id=nq_id, project=proj_name, errors=errors)
+    if not created:
+        return jsonify({"error": "Geração de áudios já em andamento", "asset_job_id": ajob["id"]}), 409
+    return _asset_accepted(ajob)
 
 
 @app.route("/nqueues/<int:nq_id>/jobs/<int:job_id>/generate-audio", methods=["POST"])
@@ -2980,7 +5055,7 @@ def nq_job_generate_audio(nq_id, job_id):
         ))
         fname = secure_filename(f"{job.get('label','scene')[:40]}.mp3").replace(" ", "_")
         dest  = aud_dir / fname
-        dest.write_bytes(audio_bytes)
+        write_file(dest, audio_bytes)
         rel   = str(dest.relative_to(PROJECT_ROOT))
         aud_dur = _audio_duration(dest)
         with nq_lock:
@@ -2995,7 +5070,7 @@ def nq_job_generate_audio(nq_id, job_id):
                             if j.get("duration", 0) < min_dur:
                                 j["duration"] = min_dur
                         break
-        _save_queues()
+        _save_queue(nq_id)
         result = {"ok": True, "input_audio": rel, "voice_id": voice}
         if aud_dur > 0:
             result["audio_duration"] = round(aud_dur, 1)
@@ -3007,7 +5082,6 @@ def nq_job_generate_audio(nq_id, job_id):
 @app.route("/nqueues/<int:nq_id>/jobs/<int:job_id>/generate-image", methods=["POST"])
 def nq_job_generate_image(nq_id, job_id):
     """Regenera a imagem de referência de uma cena específica."""
-    import urllib.request as urllib_req
     nq, proj_name = _nq_get_project(nq_id)
     if nq is None:
         return jsonify({"error": "Fila não encontrada"}), 404
@@ -3066,7 +5140,7 @@ def nq_job_generate_image(nq_id, job_id):
         url   = res["images"][0]["url"]
         fname = secure_filename(f"{job.get('label','scene')[:40]}.png").replace(" ", "_")
         dest  = img_dir / fname
-        urllib_req.urlretrieve(url, str(dest))
+        download_url(url, dest)
         rel   = str(dest.relative_to(PROJECT_ROOT))
 
         with nq_lock:
@@ -3077,7 +5151,7 @@ def nq_job_generate_image(nq_id, job_id):
                         orig = [r for r in (j.get("ref_imgs") or []) if r != rel]
                         j["ref_imgs"] = ([rel] + orig)[:4]
                         break
-        _save_queues()
+        _save_queue(nq_id)
         return jsonify({"ok": True, "image_path": rel})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -3087,6 +5161,7 @@ def nq_job_generate_image(nq_id, job_id):
 
 _load_queues()
 _save_queues()   # persiste ep_codes atribuídos retroactivamente
+_index_media()
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=7861, debug=False, threaded=True)
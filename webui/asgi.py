@@ -0,0 +1,290 @@
+"""
+Modo ASGI da Web UI: o mesmo app Flask, servido por um servidor async (uvicorn).
+
+    pip install uvicorn
+    python webui/asgi.py                                  # porta 7861, como o app.py
+    uvicorn --app-dir webui asgi:app --host 0.0.0.0 --port 7861
+
+Com app.run(threaded=True) cada cliente do /stream prende uma thread do servidor
+enquanto estiver conectado, e cada download de vídeo também. Aqui:
+
+- /stream roda no event loop: os clientes esperam num asyncio.Event acordado pelo
+  event_bus (um listener por loop), sem thread por cliente — centenas de abas
+  abertas custam só memória. As mensagens vêm de _stream_open/_stream_chunks do
+  app.py, as mesmas do gerador do Flask, que não tomam job_queue_lock nem nq_lock.
+- As rotas de status baratas (ROUTE_MODES "loop") rodam a própria view do Flask no
+  loop; as que tocam disco ou chamam nvidia-smi ("executor") rodam no pool e só o
+  envio fica no loop.
+- Todas as outras rotas (mídia, finalização, assets, POSTs) rodam no pool, e o corpo
+  também é lido do pool, um pedaço por vez: um vídeo grande indo para um cliente
+  lento ocupa uma thread só durante cada leitura de FILE_CHUNK, não o download todo.
+
+As rotas, os status e os JSONs são os do app.py — as views do Flask continuam sendo
+a única implementação; este módulo só decide onde cada uma roda.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.exceptions import HTTPException
+from werkzeug.wsgi import FileWrapper
+
+import app as web
+
+flask_app = web.app
+
+# endpoint do Flask -> onde a view roda. Ausente = view e corpo no pool.
+# "loop" só para views que leem estado em memória e cujos locks nunca ficam presos
+# durante disco/rede/subprocess. job_queue_lock (o dispatcher lê config e admite
+# jobs com ele) e nq_lock (retido no commit do SQLite) não entram no loop.
+ROUTE_MODES = {
+    # só leem estado em memória
+    "status": "loop",
+    "finalize_list_route": "loop",
+    "finalize_status_route": "loop",
+    "asset_jobs_list_route": "loop",
+    "asset_job_status_route": "loop",
+    "generate_episode_status": "loop",
+    "list_videos": "loop",
+    "video_for_job": "loop",
+    # tocam disco, SQLite ou nvidia-smi, ou tomam job_queue_lock/nq_lock
+    "get_queue": "executor",
+    "health_route": "executor",
+    "metrics_route": "executor",
+    "job_log_route": "executor",
+    "get_named_queues": "executor",
+    "video_meta": "executor",
+    "derived_status": "executor",
+    "list_webhooks_route": "executor",
+    "get_webhook_route": "executor",
+}
+FILE_CHUNK = 256 * 1024
+BODY_SPOOL_BYTES = 1024 * 1024   # uploads maiores vão para arquivo temporário
+ASGI_THREADS = int(os.environ.get("SKYREELS_ASGI_THREADS", "16"))
+
+_pool = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix="asgi")
+_DONE = object()
+
+
+class _FileWrapper(FileWrapper):
+    """wsgi.file_wrapper do send_file: lê FILE_CHUNK por vez em vez de 8 KB."""
+
+    def __init__(self, file, buffer_size=8192):
+        super().__init__(file, max(buffer_size, FILE_CHUNK))
+
+
+class _BusWaiter:
+    """Espera por eventos novos do event_bus dentro de um event loop."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self._event = asyncio.Event()
+        web.event_bus.add_listener(self._notify)
+
+    def _notify(self):
+        # Chamado na thread que publicou
+        try:
+            self.loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:   # loop fechado
+            web.event_bus.remove_listener(self._notify)
+
+    def _wake(self):
+        self._event.set()
+        self._event = asyncio.Event()
+
+    async def read(self, cursor, timeout, disconnected):
+        """Como EventBus.read(cursor, timeout), sem bloquear o loop."""
+        event = self._event
+        if cursor >= web.event_bus.last_id:
+            waits = [asyncio.ensure_future(event.wait()),
+                     asyncio.ensure_future(disconnected.wait())]
+            await asyncio.wait(waits, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for w in waits:
+                w.cancel()
+        return web.event_bus.read(cursor)
+
+
+_waiters = {}   # loop -> _BusWaiter
+
+
+def _bus_waiter():
+    loop = asyncio.get_running_loop()
+    waiter = _waiters.get(loop)
+    if waiter is None:
+        waiter = _waiters[loop] = _BusWaiter(loop)
+    return waiter
+
+
+def _environ(scope, body):
+    """Environ WSGI equivalente ao request ASGI (PEP 3333)."""
+    root = scope.get("root_path", "")
+    path = scope["path"]
+    if root and path.startswith(root):
+        path = path[len(root):]
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": root.encode("utf-8").decode("latin-1"),
+        "PATH_INFO": path.encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+        "wsgi.file_wrapper": _FileWrapper,
+    }
+    for raw_name, raw_value in scope.get("headers", []):
+        name = raw_name.decode("latin-1").upper().replace("-", "_")
+        value = raw_value.decode("latin-1")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+async def _read_body(receive):
+    body = tempfile.SpooledTemporaryFile(max_size=BODY_SPOOL_BYTES)
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body.write(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    body.seek(0)
+    return body
+
+
+async def _watch_disconnect(receive, disconnected):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+    disconnected.set()
+
+
+def _call_wsgi(environ):
+    """Roda o app Flask: (status, headers, corpo iterável)."""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"], started["headers"] = status, headers
+        return started.setdefault("written", []).append
+
+    body = flask_app.wsgi_app(environ, start_response)
+    return started["status"], started["headers"], started.get("written", []), body
+
+
+def _endpoint(environ):
+    try:
+        endpoint, _ = flask_app.url_map.bind_to_environ(environ).match()
+    except HTTPException:
+        return None
+    return endpoint
+
+
+async def _send_wsgi(send, result, body_in_loop, disconnected):
+    status, headers, written, body = result
+    loop = asyncio.get_running_loop()
+    await send({
+        "type": "http.response.start",
+        "status": int(status.split(" ", 1)[0]),
+        "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+    })
+    it = iter(body)
+    try:
+        for chunk in written:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        while not disconnected.is_set():
+            if body_in_loop:
+                chunk = next(it, _DONE)
+            else:
+                chunk = await loop.run_in_executor(_pool, next, it, _DONE)
+            if chunk is _DONE:
+                break
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    finally:
+        if hasattr(body, "close"):
+            if body_in_loop:
+                body.close()
+            else:
+                await loop.run_in_executor(_pool, body.close)
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def _send_stream(send, ss, disconnected):
+    headers = [(b"content-type", b"text/event-stream; charset=utf-8")]
+    headers += [(k.lower().encode(), v.encode()) for k, v in web.SSE_HEADERS.items()]
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    waiter = _bus_waiter()
+    while not disconnected.is_set():
+        events, lost = await waiter.read(ss["pos"], 1, disconnected)
+        chunks, finished = web._stream_chunks(ss, events, lost)
+        for chunk in chunks:
+            await send({"type": "http.response.body", "body": chunk.encode("utf-8"),
+                        "more_body": True})
+        if finished:
+            break
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Preenche o cache do nvidia-smi antes das rotas do loop precisarem dele
+            await asyncio.get_running_loop().run_in_executor(_pool, web._gpu_name)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    body = await _read_body(receive)
+    if body is None:
+        return
+    environ = _environ(scope, body)
+    endpoint = _endpoint(environ)
+    loop = asyncio.get_running_loop()
+    disconnected = asyncio.Event()
+    watcher = asyncio.ensure_future(_watch_disconnect(receive, disconnected))
+    try:
+        if endpoint == "stream":
+            with flask_app.request_context(environ):
+                ss = web._stream_open()
+            if ss is not None:
+                return await _send_stream(send, ss, disconnected)
+            mode = "loop"   # worker inexistente: o 404 da própria view
+        else:
+            mode = ROUTE_MODES.get(endpoint)
+        if mode == "loop":
+            result = _call_wsgi(environ)
+        else:
+            result = await loop.run_in_executor(_pool, _call_wsgi, environ)
+        await _send_wsgi(send, result, mode is not None, disconnected)
+    finally:
+        watcher.cancel()
+        body.close()
+
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("O modo ASGI precisa do uvicorn: pip install uvicorn")
+    uvicorn.run(app, host="0.0.0.0", port=7861, log_level="warning")
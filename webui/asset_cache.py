@@ -0,0 +1,159 @@
+"""
+Cache endereçado por conteúdo das falas (TTS) e imagens geradas.
+
+A chave é o sha256 de (provedor, modelo, voz, configurações, texto/prompt
+normalizado, tamanho): regenerar um episódio ou rodar de novo
+scripts/generate_audio_elevenlabs.py reaproveita cada fala/imagem idêntica em vez
+de pagar e esperar de novo. Cada blob é gravado uma vez em .cache/assets/ e
+entra nas pastas audios/ e imagens/ do projeto por hard link (cópia quando o
+destino está em outro disco). O tamanho total tem teto com descarte LRU; como os
+projetos recebem hard links, descartar um blob não apaga o arquivo do projeto.
+
+Por causa dos hard links, arquivo de projeto nunca é reescrito no lugar (open com
+truncate alteraria o blob e todo projeto ligado a ele): quem grava em audios/ ou
+imagens/ usa write_file()/download_url(), que trocam o arquivo por os.replace.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import unicodedata
+import urllib.request
+from collections import OrderedDict
+from pathlib import Path
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def normalize_text(text):
+    """NFC + espaços colapsados: diferenças invisíveis não viram outra chave."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text or "")).strip()
+
+
+def cache_key(provider, model="", voice_id="", settings=None, text="", size=""):
+    payload = json.dumps({
+        "provider": provider,
+        "model": model or "",
+        "voice_id": voice_id or "",
+        "settings": settings or {},
+        "text": normalize_text(text),
+        "size": size or "",
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _tmp_for(dest):
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    return dest.with_name(f".{dest.name}.{threading.get_ident()}.tmp")
+
+
+def _place(blob, dest):
+    """Hard link do blob em dest (substitui o que houver); cópia entre discos."""
+    tmp = _tmp_for(dest)
+    try:
+        os.link(blob, tmp)
+    except OSError:
+        shutil.copyfile(blob, tmp)
+    os.replace(tmp, dest)
+
+
+def write_file(dest, data):
+    """Grava dest num arquivo novo (tmp + os.replace): um hard link para um blob
+    do cache é substituído, nunca sobrescrito."""
+    tmp = _tmp_for(dest)
+    tmp.write_bytes(data)
+    os.replace(tmp, dest)
+
+
+def download_url(url, dest):
+    """urlretrieve para dest com a mesma troca atômica de write_file()."""
+    tmp = _tmp_for(dest)
+    try:
+        urllib.request.urlretrieve(url, str(tmp))
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    os.replace(tmp, dest)
+
+
+class AssetCache:
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()   # chave -> (caminho do blob, tamanho), menos recente primeiro
+        self._bytes = 0
+        self._load()
+
+    def _load(self):
+        if not self.root.exists():
+            return
+        blobs = []
+        for p in self.root.glob("*/*"):
+            if p.name.startswith("."):
+                continue
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            blobs.append((st.st_mtime, p.stem, p, st.st_size))
+        for _, key, p, size in sorted(blobs):
+            self._lru[key] = (p, size)
+            self._bytes += size
+
+    def _blob_path(self, key, ext):
+        return self.root / key[:2] / f"{key}{ext}"
+
+    def fetch(self, key, dest):
+        """Coloca o blob da chave em dest. Retorna o tamanho em bytes (hit) ou None (miss)."""
+        with self._lock:
+            hit = self._lru.get(key)
+            if hit is None:
+                return None
+            self._lru.move_to_end(key)
+        blob, size = hit
+        try:
+            os.utime(blob)   # mtime = último uso: ordem do LRU após reiniciar
+            _place(blob, dest)
+        except OSError:
+            with self._lock:
+                if self._lru.pop(key, None) is not None:
+                    self._bytes -= size
+            return None
+        return size
+
+    def store(self, key, data, dest):
+        """Grava os bytes como blob da chave e coloca o blob em dest."""
+        blob = self._blob_path(key, Path(dest).suffix)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        tmp = blob.with_name(f".{blob.name}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, blob)
+        with self._lock:
+            old = self._lru.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._lru[key] = (blob, len(data))
+            self._bytes += len(data)
+        _place(blob, dest)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            victims = []
+            while self._bytes > self.max_bytes and len(self._lru) > 1:
+                key, (blob, size) = self._lru.popitem(last=False)
+                self._bytes -= size
+                victims.append(blob)
+        for blob in victims:
+            try:
+                blob.unlink()
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._lru), "bytes": self._bytes, "max_bytes": self.max_bytes}
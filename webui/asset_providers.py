@@ -0,0 +1,198 @@
+"""
+Provedores de imagem (fal.ai) e voz (ElevenLabs) atrás de uma interface comum.
+
+As rotas de geração de assets da Web UI só conhecem AssetProvider: gerar uma imagem
+ou sintetizar uma fala e devolver os bytes. Cada provedor tem o próprio limite de
+requisições por minuto e de chamadas simultâneas; call_with_retry() aplica o limite
+e repete com backoff exponencial as falhas transitórias (429, 5xx, rede).
+
+HTTPStandInProvider fala com um servidor local qualquer (POST /image e POST /tts
+devolvendo os bytes) — serve pra testar as filas de assets sem chave de API:
+    SKYREELS_ASSET_PROVIDER_URL=http://127.0.0.1:8765 python webui/app.py
+"""
+import json
+import os
+from abc import ABC, abstractmethod
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+
+class ProviderError(Exception):
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class RateLimiter:
+    """Intervalo mínimo entre chamadas (rate_per_min) + teto de chamadas simultâneas."""
+
+    def __init__(self, rate_per_min, max_concurrency):
+        self.interval = 60.0 / rate_per_min if rate_per_min else 0.0
+        self.slots = threading.BoundedSemaphore(max(1, max_concurrency))
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def __enter__(self):
+        self.slots.acquire()
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+        return self
+
+    def __exit__(self, *exc):
+        self.slots.release()
+
+
+class AssetProvider(ABC):
+    name = "base"
+    rate_per_min = 60
+    max_concurrency = 4
+    tts_model = ""        # modelo e formato de TTS (entram na chave do asset_cache)
+    tts_format = ""
+
+    def __init__(self):
+        self.limiter = RateLimiter(self.rate_per_min, self.max_concurrency)
+
+    @abstractmethod
+    def generate_image(self, prompt, ref_paths=(), model=None):
+        """Bytes da imagem. Sem model: nano-banana (edit quando há referências)."""
+
+    @abstractmethod
+    def synthesize(self, text, voice_id):
+        """Bytes do mp3 com a fala."""
+
+
+def call_with_retry(provider, fn, *args, retries=3, backoff=1.0, cancel=None, **kwargs):
+    """Chama provider.<fn> respeitando o rate limit; repete falhas transitórias com
+    backoff exponencial (backoff, 2×backoff, ...). Erros não transitórios sobem direto."""
+    attempt = 0
+    while True:
+        try:
+            with provider.limiter:
+                return getattr(provider, fn)(*args, **kwargs)
+        except ProviderError as e:
+            if not e.retryable or attempt >= retries:
+                raise
+            err = e
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+            if attempt >= retries:
+                raise
+            err = e
+        delay = backoff * (2 ** attempt)
+        print(f"[assets] {provider.name}: {err} — nova tentativa em {delay:.1f}s")
+        if cancel is not None and cancel.wait(delay):
+            raise ProviderError("cancelado")
+        elif cancel is None:
+            time.sleep(delay)
+        attempt += 1
+
+
+def _download(url, timeout=120):
+    with urllib.request.urlopen(url, timeout=timeout) as resp:
+        return resp.read()
+
+
+def _http_retryable(code):
+    return code == 429 or code >= 500
+
+
+class FalProvider(AssetProvider):
+    name = "fal"
+    rate_per_min = 60
+    max_concurrency = 4
+
+    def __init__(self, key):
+        super().__init__()
+        import fal_client  # ImportError tratado por quem cria o provedor
+
+        os.environ["FAL_KEY"] = key
+        self.fal = fal_client
+
+    def generate_image(self, prompt, ref_paths=(), model=None):
+        try:
+            if model:
+                res = self.fal.subscribe(model, arguments={
+                    "prompt": prompt,
+                    "num_images": 1,
+                    "image_size": "landscape_16_9",
+                })
+            else:
+                image_urls = [self.fal.upload_file(str(p)) for p in list(ref_paths)[:4] if Path(p).exists()]
+                arguments = {"prompt": prompt, "num_images": 1, "aspect_ratio": "16:9", "output_format": "png"}
+                if image_urls:
+                    # Com refs → nano-banana/edit (Gemini 2.5 Flash + referências)
+                    res = self.fal.subscribe("fal-ai/nano-banana/edit",
+                                             arguments={**arguments, "image_urls": image_urls})
+                else:
+                    res = self.fal.subscribe("fal-ai/nano-banana", arguments=arguments)
+        except Exception as e:
+            status = getattr(getattr(e, "response", None), "status_code", None)
+            raise ProviderError(f"fal: {e}", retryable=status is None or _http_retryable(status))
+        return _download(res["images"][0]["url"])
+
+    def synthesize(self, text, voice_id):
+        raise ProviderError("fal: provedor só de imagens")
+
+
+class ElevenLabsProvider(AssetProvider):
+    name = "elevenlabs"
+    rate_per_min = 120
+    max_concurrency = 3   # limite de requisições simultâneas dos planos pagos mais baixos
+    tts_model = "eleven_multilingual_v2"
+    tts_format = "mp3_44100_128"
+
+    def __init__(self, key):
+        super().__init__()
+        from elevenlabs.client import ElevenLabs  # ImportError tratado por quem cria o provedor
+
+        self.client = ElevenLabs(api_key=key)
+
+    def synthesize(self, text, voice_id):
+        try:
+            return b"".join(self.client.text_to_speech.convert(
+                text=text, voice_id=voice_id,
+                model_id=self.tts_model,
+                output_format=self.tts_format,
+            ))
+        except Exception as e:
+            status = getattr(e, "status_code", None)
+            raise ProviderError(f"elevenlabs: {e}", retryable=status is None or _http_retryable(status))
+
+    def generate_image(self, prompt, ref_paths=(), model=None):
+        raise ProviderError("elevenlabs: provedor só de voz")
+
+
+class HTTPStandInProvider(AssetProvider):
+    """Servidor local no lugar do fal/ElevenLabs: POST <url>/image e <url>/tts com JSON."""
+
+    name = "http"
+    rate_per_min = 0
+    max_concurrency = 8
+
+    def __init__(self, base_url):
+        super().__init__()
+        self.base_url = base_url.rstrip("/")
+
+    def _post(self, path, payload):
+        req = urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=60) as resp:
+                return resp.read()
+        except urllib.error.HTTPError as e:
+            raise ProviderError(f"{self.base_url}{path}: HTTP {e.code}", retryable=_http_retryable(e.code))
+
+    def generate_image(self, prompt, ref_paths=(), model=None):
+        return self._post("/image", {"prompt": prompt, "ref_paths": [str(p) for p in ref_paths], "model": model})
+
+    def synthesize(self, text, voice_id):
+        return self._post("/tts", {"text": text, "voice_id": voice_id})
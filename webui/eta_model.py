@@ -0,0 +1,101 @@
+"""
+Estimativa de tempo das cenas a partir do histórico de jobs concluídos.
+
+Cada job terminado grava o tempo medido (e as fases do manifest, quando houver)
+em SQLite, sob uma chave (task_type, resolução, modo de memória, GPU). Por chave,
+uma regressão linear do tempo sobre a duração da cena (últimas WINDOW amostras)
+dá a estimativa. As constantes antigas de _estimate_job_minutes continuam como
+prior: com poucas amostras a estimativa fica perto delas e converge para o
+histórico à medida que ele cresce.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS timings (
+    id       INTEGER PRIMARY KEY,
+    key      TEXT    NOT NULL,
+    duration REAL    NOT NULL,
+    total_s  REAL    NOT NULL,
+    phases   TEXT,
+    ts       REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS timings_by_key ON timings (key, id);
+"""
+
+WINDOW = 50          # amostras por chave usadas na regressão
+PRIOR_WEIGHT = 2.0   # o prior vale por quantas amostras
+
+
+def _fit(samples, prior_slope):
+    """(intercepto, inclinação) em minutos. Inclinação do prior quando as durações
+    não variam o bastante para estimá-la."""
+    n = len(samples)
+    mx = sum(x for x, _ in samples) / n
+    my = sum(y for _, y in samples) / n
+    sxx = sum((x - mx) ** 2 for x, _ in samples)
+    if n >= 3 and sxx > 1e-9:
+        slope = max(0.0, sum((x - mx) * (y - my) for x, y in samples) / sxx)
+    else:
+        slope = prior_slope
+    return my - slope * mx, slope
+
+
+class EtaModel:
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._samples = {}   # chave -> deque[(duração, minutos)]
+        self._fits = {}      # chave -> (intercepto, inclinação, prior_slope) memoizado
+        self.version = 0     # muda a cada amostra nova (invalida caches de estimativa)
+        for key, duration, total_s in self._conn.execute(
+                "SELECT key, duration, total_s FROM timings ORDER BY id"):
+            self._samples.setdefault(key, deque(maxlen=WINDOW)).append((duration, total_s / 60))
+
+    @staticmethod
+    def key(task_type, resolution, memory_mode, gpu):
+        return json.dumps([task_type, resolution, memory_mode, gpu or ""])
+
+    def record(self, key, duration, total_s, phases=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO timings (key, duration, total_s, phases, ts) VALUES (?, ?, ?, ?, ?)",
+                (key, float(duration), float(total_s), json.dumps(phases) if phases else None, time.time()))
+            self._conn.commit()
+            self._samples.setdefault(key, deque(maxlen=WINDOW)).append((float(duration), total_s / 60))
+            self._fits.pop(key, None)
+            self.version += 1
+
+    def predict(self, key, duration, prior_minutes, prior_slope=0.0):
+        """Minutos estimados: média ponderada entre a regressão da chave e o prior."""
+        with self._lock:
+            samples = self._samples.get(key)
+            if not samples:
+                return prior_minutes
+            fit = self._fits.get(key)
+            if fit is None or fit[2] != prior_slope:
+                fit = self._fits[key] = (*_fit(samples, prior_slope), prior_slope)
+            n = len(samples)
+        fitted = fit[0] + fit[1] * duration
+        w = n / (n + PRIOR_WEIGHT)
+        return max(0.1, w * fitted + (1 - w) * prior_minutes)
+
+    def stats(self):
+        """Amostras e coeficientes por chave (para inspeção em /eta)."""
+        with self._lock:
+            out = []
+            for key, samples in self._samples.items():
+                intercept, slope = _fit(samples, 0.0)
+                out.append({
+                    "key": json.loads(key),
+                    "samples": len(samples),
+                    "intercept_min": round(intercept, 2),
+                    "minutes_per_s": round(slope, 3),
+                    "last_minutes": round(samples[-1][1], 2),
+                })
+        return out
@@ -0,0 +1,82 @@
+"""
+Barramento de eventos da Web UI (log, início e fim de job) para o /stream (SSE).
+
+Substitui a log_queue única, em que cada linha ia para um só consumidor: aqui os
+eventos ficam num ring buffer com ids crescentes e cada assinante só guarda o
+próprio cursor (o último id que recebeu). Vários navegadores/orquestradores veem
+o mesmo render sem cópia por cliente, e um cliente que reconecta com
+Last-Event-ID continua do ponto onde parou, sem repetir linhas.
+
+read() bloqueia a thread do chamador (servidor WSGI). Para o servidor ASGI, cada
+event loop registra um listener (add_listener) que só é avisado de que há eventos
+novos; os clientes esperam no loop e leem com read(cursor) sem timeout.
+"""
+import threading
+from collections import deque
+from itertools import islice
+
+DEFAULT_CAPACITY = 5000
+
+
+class EventBus:
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self._events = deque(maxlen=capacity)   # (id, evento)
+        self._last_id = 0
+        self._cond = threading.Condition()
+        self._listeners = []
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, **event):
+        """Adiciona o evento e acorda os assinantes. Retorna o id atribuído."""
+        with self._cond:
+            self._last_id += 1
+            event["id"] = self._last_id
+            self._events.append((self._last_id, event))
+            self._cond.notify_all()
+            eid = self._last_id
+            listeners = list(self._listeners)
+        for fn in listeners:
+            fn()
+        return eid
+
+    def add_listener(self, fn):
+        """fn() é chamada (na thread de quem publicou) depois de cada publish."""
+        with self._cond:
+            self._listeners.append(fn)
+
+    def remove_listener(self, fn):
+        with self._cond:
+            if fn in self._listeners:
+                self._listeners.remove(fn)
+
+    def _after(self, cursor):
+        """Eventos com id > cursor e quantos se perderam (saíram do ring antes de lidos)."""
+        if not self._events or cursor >= self._last_id:
+            return [], 0
+        oldest = self._events[0][0]
+        lost = max(0, oldest - cursor - 1)
+        # Ids são contíguos: os novos são os últimos last_id - cursor do ring. Lidos a
+        # partir do fim, o custo é o número de eventos novos, não o tamanho do ring.
+        count = min(len(self._events), self._last_id - cursor)
+        events = [e for _, e in islice(reversed(self._events), count)]
+        events.reverse()
+        return events, lost
+
+    def read(self, cursor, timeout=None):
+        """Bloqueia até haver eventos depois de `cursor` (ou timeout).
+        Retorna (eventos, perdidos); o novo cursor é o id do último evento."""
+        with self._cond:
+            if cursor >= self._last_id and timeout:
+                self._cond.wait_for(lambda: self._last_id > cursor, timeout=timeout)
+            return self._after(cursor)
+
+    def find_last(self, predicate):
+        """Id do evento mais recente que satisfaz `predicate` (None se já saiu do ring)."""
+        with self._cond:
+            for eid, event in reversed(self._events):
+                if predicate(event):
+                    return eid
+        return None
@@ -0,0 +1,265 @@
+"""
+Índice em memória dos vídeos de result/ (galeria, /videos, saída dos jobs).
+
+Substitui o rglob + stat por requisição: o diretório é varrido uma vez na
+inicialização e depois o próprio app avisa o índice a cada escrita (add/discard).
+Gravações feitas por fora (o gerador em subprocess, cópias manuais) entram via
+sync_dir() de um único diretório, rescan() completo ou, com o pacote watchdog
+instalado, pelo observador de start_watching().
+
+Diretórios que começam com "." (ex.: result/.cache, .derived) não são indexados.
+"""
+import bisect
+import os
+import threading
+from pathlib import Path
+
+VIDEO_EXTS = {".mp4"}
+
+
+def _hidden(rel_parts):
+    return any(p.startswith(".") for p in rel_parts)
+
+
+def version_token(st):
+    """Versão de um arquivo a partir do stat (tamanho + mtime_ns): ETag e ?v= das URLs."""
+    return f"{st.st_size:x}-{st.st_mtime_ns:x}"
+
+
+def _abs(path):
+    # PROJECT_ROOT pode ser relativo (python webui/app.py); o watchdog entrega absolutos
+    return Path(os.path.abspath(path))
+
+
+class MediaIndex:
+    def __init__(self, root, project_root):
+        self.root = _abs(root)                  # result/
+        self.project_root = _abs(project_root)  # caminhos públicos são relativos a ele
+        self._lock = threading.RLock()
+        self._entries = {}     # path relativo -> entry
+        self._order = []       # (mtime, path) em ordem crescente
+        self._by_seed = {}     # (task, seed) -> path mais recente gerado em result/<task>/
+        self._by_job = {}      # job_id -> path
+        self._observer = None
+
+    # ---- escrita ----
+    def _entry_for(self, path, st):
+        rel_root = path.relative_to(self.root)
+        parts = rel_root.parts
+        # result/<task>/x.mp4 ou result/<project>/<task>/x.mp4
+        project = parts[0] if len(parts) >= 3 else ""
+        rel = str(path.relative_to(self.project_root))
+        return {
+            "path": rel,
+            "name": path.name,
+            "task": path.parent.name,
+            "project": project,
+            "size_bytes": st.st_size,
+            "size": f"{st.st_size / 1024 / 1024:.1f} MB",
+            "mtime": st.st_mtime,
+            "v": version_token(st),
+            "has_meta": path.with_suffix(".json").exists(),
+            "job_id": self._entries.get(rel, {}).get("job_id"),
+        }
+
+    def _insert(self, entry):
+        rel = entry["path"]
+        old = self._entries.get(rel)
+        if old is not None:
+            self._remove_order(old)
+        self._entries[rel] = entry
+        bisect.insort(self._order, (entry["mtime"], rel))
+        seed = entry["name"].split("_", 1)[0]
+        if not entry["project"] and seed.isdigit():
+            key = (entry["task"], seed)
+            cur = self._by_seed.get(key)
+            if cur is None or cur not in self._entries or self._entries[cur]["mtime"] <= entry["mtime"]:
+                self._by_seed[key] = rel
+
+    def _remove_order(self, entry):
+        key = (entry["mtime"], entry["path"])
+        i = bisect.bisect_left(self._order, key)
+        if i < len(self._order) and self._order[i] == key:
+            del self._order[i]
+
+    def add(self, path, job_id=None):
+        """Registra (ou atualiza) um vídeo escrito pelo app. Retorna a entry ou None."""
+        path = _abs(path)
+        if path.suffix.lower() not in VIDEO_EXTS:
+            return None
+        try:
+            rel_parts = path.relative_to(self.root).parts
+            st = path.stat()
+        except (ValueError, OSError):
+            return None
+        if _hidden(rel_parts[:-1]):
+            return None
+        with self._lock:
+            entry = self._entry_for(path, st)
+            if job_id is not None:
+                entry["job_id"] = job_id
+            self._insert(entry)
+            if entry["job_id"] is not None:
+                self._by_job[entry["job_id"]] = entry["path"]
+            return dict(entry)
+
+    def discard(self, path):
+        path = _abs(path)
+        try:
+            rel = str(path.relative_to(self.project_root))
+        except ValueError:
+            return
+        with self._lock:
+            entry = self._entries.pop(rel, None)
+            if entry is None:
+                return
+            self._remove_order(entry)
+            if entry.get("job_id") is not None and self._by_job.get(entry["job_id"]) == rel:
+                del self._by_job[entry["job_id"]]
+            for key, val in list(self._by_seed.items()):
+                if val == rel:
+                    del self._by_seed[key]
+
+    def move(self, src, dst):
+        with self._lock:
+            old = self._entries.get(str(_abs(src).relative_to(self.project_root)), {})
+            self.discard(src)
+            return self.add(dst, job_id=old.get("job_id"))
+
+    def link_job(self, job_id, rel_path):
+        """Associa um job a um vídeo já indexado (ex.: output_video restaurado do DB)."""
+        with self._lock:
+            entry = self._entries.get(rel_path)
+            if entry is None:
+                return False
+            entry["job_id"] = job_id
+            self._by_job[job_id] = rel_path
+            return True
+
+    # ---- varredura ----
+    def sync_dir(self, directory):
+        """Sincroniza um único diretório (sem recursão): novos, alterados e removidos."""
+        directory = _abs(directory)
+        seen = set()
+        try:
+            it = os.scandir(directory)
+        except OSError:
+            it = None
+        if it is not None:
+            with it:
+                for de in it:
+                    if not de.is_file() or Path(de.name).suffix.lower() not in VIDEO_EXTS:
+                        continue
+                    p = directory / de.name
+                    rel = str(p.relative_to(self.project_root))
+                    seen.add(rel)
+                    cur = self._entries.get(rel)
+                    st = de.stat()
+                    if cur is None or cur["mtime"] != st.st_mtime or cur["size_bytes"] != st.st_size:
+                        self.add(p)
+        prefix = str(directory.relative_to(self.project_root)) + os.sep
+        with self._lock:
+            gone = [r for r in self._entries
+                    if r.startswith(prefix) and os.sep not in r[len(prefix):] and r not in seen]
+        for r in gone:
+            self.discard(self.project_root / r)
+
+    def rescan(self):
+        """Varredura completa de result/ (inicialização ou POST /videos/rescan)."""
+        entries = []
+        if self.root.exists():
+            for dirpath, dirnames, filenames in os.walk(self.root):
+                dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+                for fn in filenames:
+                    if Path(fn).suffix.lower() not in VIDEO_EXTS:
+                        continue
+                    p = Path(dirpath) / fn
+                    try:
+                        entries.append(self._entry_for(p, p.stat()))
+                    except OSError:
+                        continue
+        with self._lock:
+            links = dict(self._by_job)
+            self._entries.clear()
+            self._order.clear()
+            self._by_seed.clear()
+            self._by_job.clear()
+            for e in entries:
+                self._insert(e)
+            for job_id, rel in links.items():
+                self.link_job(job_id, rel)
+        return len(entries)
+
+    # ---- leitura ----
+    def get(self, rel_path):
+        with self._lock:
+            e = self._entries.get(rel_path)
+            return dict(e) if e else None
+
+    def for_job(self, job_id):
+        with self._lock:
+            rel = self._by_job.get(job_id)
+            return dict(self._entries[rel]) if rel in self._entries else None
+
+    def latest_for_seed(self, task, seed):
+        """Último result/<task>/<seed>_*.mp4 (saída do generate_video.py antes do namespacing)."""
+        with self._lock:
+            rel = self._by_seed.get((task, str(seed)))
+            return dict(self._entries[rel]) if rel in self._entries else None
+
+    def latest(self):
+        with self._lock:
+            if not self._order:
+                return None
+            return dict(self._entries[self._order[-1][1]])
+
+    def query(self, project=None, task=None, offset=0, limit=None):
+        """Mais recentes primeiro. Retorna (entries, total de entries que passam no filtro)."""
+        out, total = [], 0
+        with self._lock:
+            for _, rel in reversed(self._order):
+                e = self._entries[rel]
+                if project is not None and e["project"] != project:
+                    continue
+                if task is not None and e["task"] != task:
+                    continue
+                if total >= offset and (limit is None or len(out) < limit):
+                    out.append(dict(e))
+                total += 1
+        return out, total
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ---- watcher opcional ----
+    def start_watching(self):
+        """Observa result/ com watchdog (opcional). Retorna False se não estiver instalado."""
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            return False
+        index = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                if not event.is_directory:
+                    index.add(event.src_path)
+
+            on_modified = on_created
+
+            def on_deleted(self, event):
+                if not event.is_directory:
+                    index.discard(event.src_path)
+
+            def on_moved(self, event):
+                if not event.is_directory:
+                    index.discard(event.src_path)
+                    index.add(event.dest_path)
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._observer = Observer()
+        self._observer.daemon = True
+        self._observer.schedule(_Handler(), str(self.root), recursive=True)
+        self._observer.start()
+        return True
@@ -0,0 +1,149 @@
+"""
+Probe de mídia no próprio processo (PyAV) com memo persistente em SQLite.
+
+Substitui os subprocessos de ffprobe de _video_info, _audio_duration e
+_video_stream_params: a finalização de um episódio de 40 cenas abria 80+
+processos só para saber duração, resolução e se há áudio. Aqui cada arquivo é
+lido uma vez com PyAV (ou com ffprobe, se o av não estiver instalado), e o
+resultado fica memoizado por (caminho, tamanho, mtime_ns) em memória e em
+.cache/media_probe.db, valendo também depois de reiniciar a Web UI.
+"""
+import json
+import os
+import sqlite3
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    import av
+except ImportError:
+    av = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS probes (
+    path     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    info     TEXT    NOT NULL
+);
+"""
+
+
+def _rate(fraction):
+    return f"{fraction.numerator}/{fraction.denominator}" if fraction else None
+
+
+def _summary(streams, duration):
+    """Campos de conveniência a partir da lista de streams."""
+    video = next((s for s in streams if s["type"] == "video"), None)
+    return {
+        "duration": duration,
+        "has_video": video is not None,
+        "has_audio": any(s["type"] == "audio" for s in streams),
+        "width": video["width"] if video else None,
+        "height": video["height"] if video else None,
+        "fps": video["fps"] if video else None,   # racional, ex. "24/1" (vai direto no fps= do ffmpeg)
+        "streams": streams,
+    }
+
+
+def _probe_av(path):
+    with av.open(str(path)) as container:
+        streams = []
+        for s in container.streams:
+            entry = {"type": s.type, "codec": s.codec_context.name if s.codec_context else None}
+            if s.duration is not None and s.time_base is not None:
+                entry["duration"] = float(s.duration * s.time_base)
+            if s.type == "video":
+                entry.update(width=s.codec_context.width, height=s.codec_context.height,
+                             fps=_rate(s.base_rate or s.average_rate))
+            elif s.type == "audio":
+                entry.update(sample_rate=s.codec_context.sample_rate,
+                             channels=s.codec_context.channels)
+            streams.append(entry)
+        if container.duration:
+            duration = container.duration / av.time_base
+        else:
+            duration = max((s.get("duration", 0) for s in streams), default=0.0)
+    return _summary(streams, float(duration))
+
+
+def _probe_ffprobe(path):
+    r = subprocess.run(
+        ["ffprobe", "-v", "quiet", "-print_format", "json",
+         "-show_streams", "-show_format", str(path)],
+        capture_output=True, text=True, timeout=15)
+    if r.returncode != 0:
+        raise OSError(f"ffprobe falhou: {path}")
+    data = json.loads(r.stdout)
+    streams = []
+    for s in data.get("streams", []):
+        entry = {"type": s.get("codec_type"), "codec": s.get("codec_name")}
+        if s.get("duration"):
+            entry["duration"] = float(s["duration"])
+        if entry["type"] == "video":
+            entry.update(width=s.get("width"), height=s.get("height"), fps=s.get("r_frame_rate"))
+        elif entry["type"] == "audio":
+            entry.update(sample_rate=int(s.get("sample_rate") or 0), channels=s.get("channels"))
+        streams.append(entry)
+    return _summary(streams, float(data.get("format", {}).get("duration", 0) or 0))
+
+
+class MediaProbe:
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._memo = {}   # caminho absoluto -> (size, mtime_ns, info)
+        for path, size, mtime_ns, info in self._conn.execute(
+                "SELECT path, size, mtime_ns, info FROM probes"):
+            self._memo[path] = (size, mtime_ns, json.loads(info))
+        self.backend = "pyav" if av is not None else "ffprobe"
+
+    def probe(self, path):
+        """Metadados do arquivo (duration, has_audio, width, height, fps, streams) ou None
+        se não existir / não for mídia legível."""
+        key = os.path.abspath(path)
+        try:
+            st = os.stat(key)
+        except OSError:
+            return None
+        with self._lock:
+            memo = self._memo.get(key)
+        if memo and memo[0] == st.st_size and memo[1] == st.st_mtime_ns:
+            return memo[2]
+        try:
+            info = _probe_av(key) if av is not None else _probe_ffprobe(key)
+        except Exception:
+            return None
+        with self._lock:
+            self._memo[key] = (st.st_size, st.st_mtime_ns, info)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO probes (path, size, mtime_ns, info) VALUES (?, ?, ?, ?)",
+                (key, st.st_size, st.st_mtime_ns, json.dumps(info)))
+            self._conn.commit()
+        return info
+
+    def probe_many(self, paths, workers=4):
+        """Probe em lote ({caminho: info}); os arquivos fora do memo são lidos em paralelo."""
+        paths = list(dict.fromkeys(str(p) for p in paths))
+        if len(paths) <= 1:
+            return {p: self.probe(p) for p in paths}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return dict(zip(paths, pool.map(self.probe, paths)))
+
+    def prune(self):
+        """Remove do memo os arquivos que não existem mais. Retorna quantos saíram."""
+        with self._lock:
+            gone = [p for p in self._memo if not os.path.exists(p)]
+            for p in gone:
+                del self._memo[p]
+            self._conn.executemany("DELETE FROM probes WHERE path = ?", [(p,) for p in gone])
+            self._conn.commit()
+        return len(gone)
@@ -0,0 +1,155 @@
+"""
+Estimativa do pico de memória da GPU de cada job, para o dispatcher decidir o que
+cabe em cada placa ao lado do que já está rodando e escolher o modo de memória.
+
+O pico tem duas partes: os pesos residentes (dependem do checkpoint e do modo:
+completo, --offload ou --low_vram, ver "Modos de Memória" no README) e as ativações
+do DiT, que crescem com o número de tokens latentes. Os tokens saem da resolução
+(maior área de ASPECT_RATIO_CONFIG na faixa, já que a proporção final depende da
+imagem de entrada), dos quadros gerados por vez (a cena inteira no R2V, um roll na
+extensão, uma janela no talking_avatar), do stride do VAE (4 no tempo, 8 no espaço)
+e do patch 2x2 do DiT.
+
+A fórmula é só o ponto de partida: cada job concluído grava o pico real do manifest
+(reserved_gb) e, por chave (task, resolução, modo, GPU), a razão pico/estimativa
+calibra as próximas estimativas, como o histórico de tempos em eta_model.py.
+"""
+import importlib.util
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS peaks (
+    id      INTEGER PRIMARY KEY,
+    key     TEXT    NOT NULL,
+    raw_gb  REAL    NOT NULL,
+    peak_gb REAL    NOT NULL,
+    ts      REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS peaks_by_key ON peaks (key, id);
+"""
+
+MODES = ("gpu", "offload", "low_vram")   # do mais rápido ao mais econômico
+WINDOW = 20          # amostras por chave usadas na calibração
+PRIOR_WEIGHT = 2.0   # a fórmula vale por quantas amostras
+
+# Pesos residentes no pico (GB) por família de modelo e modo. Calibrados para bater
+# com a tabela do README numa cena de 5 s em 540P (14B) / janela de 480P (19B).
+RESIDENT_GB = {
+    "Reference2Video": {"gpu": 40.0, "offload": 12.0, "low_vram": 5.0},
+    "Video-Extension": {"gpu": 40.0, "offload": 12.0, "low_vram": 5.0},
+    "A2V-19B": {"gpu": 34.0, "offload": 16.0, "low_vram": 15.0},
+}
+ACT_GB_PER_10K_TOKENS = {"Reference2Video": 1.2, "Video-Extension": 1.2, "A2V-19B": 1.3}
+FAMILY = {
+    "reference_to_video": "Reference2Video",
+    "single_shot_extension": "Video-Extension",
+    "shot_switching_extension": "Video-Extension",
+    "talking_avatar": "A2V-19B",
+}
+
+
+def _load_aspect_ratio_config():
+    # Lido direto do arquivo: importar o pacote skyreels_v3 puxaria o torch
+    path = Path(__file__).resolve().parent.parent / "skyreels_v3" / "config.py"
+    try:
+        spec = importlib.util.spec_from_file_location("_skyreels_v3_config", path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module.ASPECT_RATIO_CONFIG, module.SHOT_NUM_CONDITION_FRAMES_MAP
+    except (OSError, AttributeError):
+        return {}, {}
+
+
+ASPECT_RATIO_CONFIG, SHOT_NUM_CONDITION_FRAMES_MAP = _load_aspect_ratio_config()
+_FALLBACK_SIZE = {"480P": (480, 854), "540P": (544, 960), "720P": (720, 1280)}
+
+
+def frame_size(resolution):
+    """(altura, largura) de maior área da faixa, alinhada a 16 como no pipeline."""
+    sizes = ASPECT_RATIO_CONFIG.get(resolution)
+    h, w = max(sizes.values(), key=lambda hw: hw[0] * hw[1]) if sizes else \
+        _FALLBACK_SIZE.get(resolution, _FALLBACK_SIZE["720P"])
+    return h // 16 * 16, w // 16 * 16
+
+
+def latent_frames(task_type, duration):
+    """Quadros latentes que o DiT processa de uma vez."""
+    duration = int(duration or 5)
+    if task_type == "talking_avatar":
+        return (81 - 1) // 4 + 1                        # janela de 81 quadros
+    if task_type == "single_shot_extension":
+        return 6 * min(duration, 5) + 8                 # roll de até 5 s + prefixo
+    if task_type == "shot_switching_extension":
+        cond = SHOT_NUM_CONDITION_FRAMES_MAP.get(duration, 33)
+        return (duration * 24) // 4 + 1 + (cond - 1) // 4 + 1
+    return (duration * 24) // 4 + 1                     # R2V: cena inteira
+
+
+def latent_tokens(task_type, resolution, duration):
+    h, w = frame_size(resolution)
+    return latent_frames(task_type, duration) * (h // 16) * (w // 16)
+
+
+def raw_estimate_gb(task_type, resolution, duration, mode):
+    """Pico estimado pela fórmula, sem calibração."""
+    family = FAMILY.get(task_type, "Reference2Video")
+    resident = RESIDENT_GB[family].get(mode, RESIDENT_GB[family]["offload"])
+    act = ACT_GB_PER_10K_TOKENS[family] * latent_tokens(task_type, resolution, duration) / 1e4
+    return resident + act
+
+
+class MemoryModel:
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._ratios = {}   # chave -> deque[pico / estimativa]
+        for key, raw_gb, peak_gb in self._conn.execute(
+                "SELECT key, raw_gb, peak_gb FROM peaks ORDER BY id"):
+            self._ratios.setdefault(key, deque(maxlen=WINDOW)).append(peak_gb / raw_gb)
+
+    @staticmethod
+    def key(task_type, resolution, mode, gpu):
+        return json.dumps([task_type, resolution, mode, gpu or ""])
+
+    def record(self, key, raw_gb, peak_gb):
+        if raw_gb <= 0 or peak_gb <= 0:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO peaks (key, raw_gb, peak_gb, ts) VALUES (?, ?, ?, ?)",
+                (key, float(raw_gb), float(peak_gb), time.time()))
+            self._conn.commit()
+            self._ratios.setdefault(key, deque(maxlen=WINDOW)).append(peak_gb / raw_gb)
+
+    def factor(self, key):
+        """Correção da fórmula para a chave: média das razões observadas, puxada para 1
+        enquanto há poucas amostras."""
+        with self._lock:
+            ratios = self._ratios.get(key)
+            if not ratios:
+                return 1.0
+            n, mean = len(ratios), sum(ratios) / len(ratios)
+        w = n / (n + PRIOR_WEIGHT)
+        return w * mean + (1 - w)
+
+    def estimate(self, task_type, resolution, duration, mode, gpu=""):
+        """Pico estimado em GB (fórmula x calibração da chave)."""
+        raw = raw_estimate_gb(task_type, resolution, duration, mode)
+        return raw * self.factor(self.key(task_type, resolution, mode, gpu))
+
+    def stats(self):
+        with self._lock:
+            items = [(k, list(r)) for k, r in self._ratios.items()]
+        return [{
+            "key": json.loads(k),
+            "samples": len(r),
+            "factor": round(self.factor(k), 3),
+            "last_ratio": round(r[-1], 3),
+        } for k, r in items]
@@ -0,0 +1,204 @@
+"""
+Métricas da Web UI no formato de exposição do Prometheus (GET /metrics).
+
+Com o pacote prometheus_client instalado, counter()/histogram()/gauge() devolvem as
+métricas dele, num registry próprio. Sem o pacote, usam a implementação mínima
+abaixo (mesma API: labels(), inc(), observe(), set(), set_function()) e render()
+gera o texto no formato 0.0.4. Counters são declarados sem o sufixo _total, que
+entra na exposição, como faz o prometheus_client.
+"""
+import threading
+from abc import ABC, abstractmethod
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def _labels_str(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(ABC):
+    kind = ""
+    suffix = ""   # counters: "_total" no nome exposto
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children = {}
+        self._function = None
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+
+    def labels(self, *values, **kw):
+        if kw:
+            values = tuple(kw[n] for n in self.labelnames)
+        key = tuple(str(v) for v in values)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+            return child
+
+    # sem labels: a própria métrica recebe inc/observe/set
+    def __getattr__(self, attr):
+        if attr in ("inc", "observe", "set", "dec"):
+            return getattr(self._children[()], attr)
+        raise AttributeError(attr)
+
+    def set_function(self, fn):
+        self._function = fn
+
+    @abstractmethod
+    def _new_child(self):
+        """Valor de uma combinação de labels (_Value, _HistogramValue...)."""
+
+    @abstractmethod
+    def samples(self):
+        """[(nome, labels renderizados, valor)] para render()."""
+
+    def render(self):
+        lines = [f"# HELP {self.name}{self.suffix} {_escape(self.documentation)}",
+                 f"# TYPE {self.name}{self.suffix} {self.kind}"]
+        lines += [f"{name}{labels} {_fmt(value)}" for name, labels, value in self.samples()]
+        return "\n".join(lines)
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self._lock:
+            self.value = float(value)
+
+
+class Counter(_Metric):
+    kind = "counter"
+    suffix = "_total"
+
+    def _new_child(self):
+        return _Value()
+
+    def samples(self):
+        with self._lock:
+            items = list(self._children.items())
+        return [(self.name + "_total", _labels_str(self.labelnames, k), c.value) for k, c in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def samples(self):
+        if self._function is not None:
+            return [(self.name, "", self._function())]
+        with self._lock:
+            items = list(self._children.items())
+        return [(self.name, _labels_str(self.labelnames, k), c.value) for k, c in items]
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=(0.5, 1, 5, 10, 30, 60, 300)):
+        self.buckets = tuple(sorted(float(b) for b in buckets)) + (float("inf"),)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._children.items())
+        out = []
+        for key, h in items:
+            with h._lock:
+                counts, total = list(h.counts), h.sum
+            acc = 0
+            for bound, n in zip(self.buckets, counts):
+                acc += n
+                out.append((self.name + "_bucket",
+                            _labels_str(self.labelnames, key, [("le", _fmt(bound))]), acc))
+            out.append((self.name + "_sum", _labels_str(self.labelnames, key), total))
+            out.append((self.name + "_count", _labels_str(self.labelnames, key), acc))
+        return out
+
+
+_registry = []
+_prom_registry = prometheus_client.CollectorRegistry() if prometheus_client else None
+
+
+def counter(name, documentation, labelnames=()):
+    if prometheus_client:
+        return prometheus_client.Counter(name, documentation, labelnames, registry=_prom_registry)
+    metric = Counter(name, documentation, labelnames)
+    _registry.append(metric)
+    return metric
+
+
+def gauge(name, documentation, labelnames=()):
+    if prometheus_client:
+        return prometheus_client.Gauge(name, documentation, labelnames, registry=_prom_registry)
+    metric = Gauge(name, documentation, labelnames)
+    _registry.append(metric)
+    return metric
+
+
+def histogram(name, documentation, labelnames=(), buckets=(0.5, 1, 5, 10, 30, 60, 300)):
+    if prometheus_client:
+        return prometheus_client.Histogram(name, documentation, labelnames, buckets=buckets,
+                                           registry=_prom_registry)
+    metric = Histogram(name, documentation, labelnames, buckets)
+    _registry.append(metric)
+    return metric
+
+
+def render():
+    """(corpo, content-type) da exposição de todas as métricas registradas."""
+    if prometheus_client:
+        return prometheus_client.generate_latest(_prom_registry), prometheus_client.CONTENT_TYPE_LATEST
+    return ("\n".join(m.render() for m in _registry) + "\n").encode("utf-8"), CONTENT_TYPE
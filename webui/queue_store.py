@@ -0,0 +1,186 @@
+"""
+Persistência das filas nomeadas em SQLite (WAL), uma linha por fila e por cena.
+
+Substitui a regravação do uploads/queues.json inteiro a cada mutação: save_queue()
+serializa só a fila alterada e grava apenas as linhas que mudaram desde a última
+escrita. O formato das linhas é o mesmo dict do JSON antigo, então import/export
+continuam compatíveis.
+
+Quem guarda as filas em memória sob um lock serializa com snapshot() dentro do lock
+e grava com write() fora dele; a geração passada a write() descarta um snapshot mais
+velho que chegue depois de um mais novo. A coluna position é a ordem de criação,
+atribuída na primeira gravação de cada fila: apagar uma fila não desloca as outras.
+
+CLI:
+    python webui/queue_store.py export uploads/queues.json   # DB → JSON
+    python webui/queue_store.py import uploads/queues.json   # JSON → DB (substitui)
+
+Rode o import com a Web UI parada: ela mantém as filas em memória.
+"""
+import json
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queues (
+    id       INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    data     TEXT    NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    id       INTEGER PRIMARY KEY,
+    nq_id    INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    data     TEXT    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_queue ON jobs (nq_id, position);
+"""
+
+
+def _public(d):
+    """Campos com "_" são efêmeros (webhook, timers, agendamento) — não vão pro disco."""
+    return {k: v for k, v in d.items() if not k.startswith("_")}
+
+
+class QueueStore:
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        # Última versão gravada de cada linha: evita reescrever o que não mudou
+        self._queue_rows = {}   # nq_id -> (position, data)
+        self._job_rows = {}     # nq_id -> {job_id: (position, data)}
+        self._generations = {}  # nq_id -> geração do último snapshot gravado
+        self._next_position = self._conn.execute(
+            "SELECT COALESCE(MAX(position), -1) + 1 FROM queues").fetchone()[0]
+
+    def is_empty(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM queues LIMIT 1").fetchone() is None
+
+    def iter_queues(self):
+        """Lê as filas em ordem, uma por vez, com as cenas já anexadas em "jobs"."""
+        with self._lock:
+            queue_rows = self._conn.execute(
+                "SELECT id, position, data FROM queues ORDER BY position, id"
+            ).fetchall()
+        for nq_id, position, data in queue_rows:
+            with self._lock:
+                job_rows = self._conn.execute(
+                    "SELECT id, position, data FROM jobs WHERE nq_id = ? ORDER BY position, id",
+                    (nq_id,),
+                ).fetchall()
+            nq = json.loads(data)
+            nq["jobs"] = [json.loads(jd) for _, _, jd in job_rows]
+            self._queue_rows[nq_id] = (position, data)
+            self._job_rows[nq_id] = {jid: (pos, jd) for jid, pos, jd in job_rows}
+            yield nq
+
+    @staticmethod
+    def snapshot(nq):
+        """Linhas serializadas da fila e das cenas, para write(). Não toca no banco."""
+        return {
+            "id": nq["id"],
+            "data": json.dumps({k: v for k, v in _public(nq).items() if k != "jobs"}, ensure_ascii=False),
+            "jobs": {
+                j["id"]: (pos, json.dumps(_public(j), ensure_ascii=False))
+                for pos, j in enumerate(nq.get("jobs", []))
+            },
+        }
+
+    def save_queue(self, nq, position=None):
+        """Grava a fila e suas cenas; só as linhas alteradas vão pro disco.
+        Retorna quantas linhas foram escritas/removidas."""
+        return self.write(self.snapshot(nq), position=position)
+
+    def write(self, snap, generation=None, position=None):
+        """Grava um snapshot(). Com generation, um snapshot mais velho que o último
+        gravado é ignorado (retorna 0). position só é usado por replace_all(); sem ele a
+        fila mantém a posição que tem, ou ganha a próxima."""
+        nq_id = snap["id"]
+        job_rows = snap["jobs"]
+        written = 0
+        with self._lock, self._conn:
+            if generation is not None:
+                if generation <= self._generations.get(nq_id, -1):
+                    return 0
+                self._generations[nq_id] = generation
+            old_queue = self._queue_rows.get(nq_id)
+            if position is None:
+                if old_queue is not None:
+                    position = old_queue[0]
+                else:
+                    position = self._next_position
+            self._next_position = max(self._next_position, position + 1)
+            queue_row = (position, snap["data"])
+            if old_queue != queue_row:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO queues (id, position, data) VALUES (?, ?, ?)",
+                    (nq_id, *queue_row),
+                )
+                written += 1
+            old_jobs = self._job_rows.get(nq_id, {})
+            changed = [(jid, nq_id, *row) for jid, row in job_rows.items() if old_jobs.get(jid) != row]
+            if changed:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO jobs (id, nq_id, position, data) VALUES (?, ?, ?, ?)",
+                    changed,
+                )
+            removed = [(jid,) for jid in old_jobs if jid not in job_rows]
+            if removed:
+                self._conn.executemany("DELETE FROM jobs WHERE id = ?", removed)
+            written += len(changed) + len(removed)
+            self._queue_rows[nq_id] = queue_row
+            self._job_rows[nq_id] = job_rows
+        return written
+
+    def delete_queue(self, nq_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM jobs WHERE nq_id = ?", (nq_id,))
+            self._conn.execute("DELETE FROM queues WHERE id = ?", (nq_id,))
+            self._queue_rows.pop(nq_id, None)
+            self._job_rows.pop(nq_id, None)
+            self._generations[nq_id] = float("inf")   # snapshot atrasado não recria a fila
+
+    def replace_all(self, queues):
+        """Substitui todo o conteúdo (import do JSON antigo)."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM jobs")
+            self._conn.execute("DELETE FROM queues")
+            self._queue_rows.clear()
+            self._job_rows.clear()
+            self._generations.clear()
+            self._next_position = 0
+        for position, nq in enumerate(queues):
+            self.save_queue(nq, position)
+
+    def export(self):
+        """Lista de filas no formato do uploads/queues.json."""
+        return list(self.iter_queues())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ("import", "export"):
+        print(__doc__)
+        sys.exit(2)
+    db_path = Path(__file__).resolve().parent.parent / "uploads" / "queues.db"
+    store = QueueStore(db_path)
+    json_path = Path(sys.argv[2])
+    if sys.argv[1] == "export":
+        data = store.export()
+        json_path.write_text(json.dumps(data, indent=2, ensure_ascii=False))
+        print(f"{len(data)} fila(s) exportada(s) para {json_path}")
+    else:
+        data = json.loads(json_path.read_text())
+        store.replace_all(data)
+        print(f"{len(data)} fila(s) importada(s) de {json_path} para {db_path}")
+    store.close()
@@ -0,0 +1,281 @@
+"""
+Outbox persistente dos webhooks (callback_url das filas e das finalizações).
+
+Cada entrega vira uma linha na tabela webhooks do mesmo SQLite das filas
+(uploads/queues.db) antes de qualquer tentativa, então reiniciar a Web UI não perde
+callbacks: o que estava pendente (ou no meio do envio) volta para a fila e é
+entregue depois — pelo menos uma vez; o header X-SkyReels-Delivery leva o id da
+entrega para o receptor descartar repetições.
+
+Uma única thread de entrega lê as linhas vencidas e as envia num pool pequeno, com
+no máximo per_endpoint envios simultâneos por destino (esquema + host + porta) e
+conexões HTTP keep-alive reaproveitadas entre entregas ao mesmo destino. A leitura
+pega as per_endpoint mais antigas de cada destino (coluna endpoint), então um destino
+lento com milhares de entregas vencidas não esconde as dos outros. 2xx =
+delivered; 4xx (exceto 408/429) = rejected, sem nova tentativa; timeout, erro de
+conexão, 5xx, 408 e 429 = nova tentativa com backoff exponencial (base_delay,
+dobrando até max_delay) até max_attempts, depois failed.
+"""
+import http.client
+import json
+import sqlite3
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhooks (
+    id           INTEGER PRIMARY KEY,
+    url          TEXT    NOT NULL,
+    endpoint     TEXT,
+    event        TEXT,
+    queue_id     INTEGER,
+    payload      TEXT    NOT NULL,
+    status       TEXT    NOT NULL,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    next_ts      REAL    NOT NULL,
+    created_ts   REAL    NOT NULL,
+    updated_ts   REAL    NOT NULL,
+    last_code    INTEGER,
+    last_error   TEXT
+);
+CREATE INDEX IF NOT EXISTS webhooks_due ON webhooks (status, next_ts);
+CREATE INDEX IF NOT EXISTS webhooks_by_queue ON webhooks (queue_id, id);
+"""
+
+COLUMNS = ("id", "url", "event", "queue_id", "payload", "status", "attempts",
+           "next_ts", "created_ts", "updated_ts", "last_code", "last_error")
+RETRYABLE_4XX = (408, 429)
+
+
+def _endpoint(url):
+    u = urllib.parse.urlsplit(url)
+    return u.scheme, u.hostname, u.port or (443 if u.scheme == "https" else 80)
+
+
+def _endpoint_key(url):
+    """Destino como texto, para a coluna endpoint."""
+    return "%s://%s:%s" % _endpoint(url)
+
+
+class WebhookOutbox:
+    def __init__(self, db_path, max_attempts=10, base_delay=1.0, max_delay=600.0,
+                 per_endpoint=2, timeout=10.0, on_outcome=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.per_endpoint = per_endpoint
+        self.timeout = timeout
+        # on_outcome(outcome): "delivered" | "rejected" | "failed" | "retry" (métricas)
+        self.on_outcome = on_outcome or (lambda outcome: None)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        with self._conn:
+            # Envio interrompido por um restart: entrega de novo
+            self._conn.execute("UPDATE webhooks SET status = 'pending' WHERE status = 'sending'")
+            # Bancos de antes da coluna endpoint
+            if "endpoint" not in [r[1] for r in self._conn.execute("PRAGMA table_info(webhooks)")]:
+                self._conn.execute("ALTER TABLE webhooks ADD COLUMN endpoint TEXT")
+            missing = self._conn.execute("SELECT id, url FROM webhooks WHERE endpoint IS NULL").fetchall()
+            self._conn.executemany("UPDATE webhooks SET endpoint = ? WHERE id = ?",
+                                   [(_endpoint_key(url), i) for i, url in missing])
+        self._wake = threading.Event()
+        self._inflight = {}      # destino -> envios em andamento
+        self._idle_conns = {}    # destino -> [HTTPConnection] livres para reuso
+        self._conns_lock = threading.Lock()
+        self._pool = None
+        self._thread = None
+
+    # ---- API ----
+
+    def enqueue(self, url, payload, event=None, queue_id=None):
+        """Grava a entrega (pending) e acorda o worker. Retorna o id."""
+        now = time.time()
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "INSERT INTO webhooks (url, endpoint, event, queue_id, payload, status, attempts,"
+                " next_ts, created_ts, updated_ts) VALUES (?, ?, ?, ?, ?, 'pending', 0, ?, ?, ?)",
+                (url, _endpoint_key(url), event, queue_id, json.dumps(payload, ensure_ascii=False),
+                 now, now, now))
+            delivery_id = cur.lastrowid
+        self._wake.set()
+        return delivery_id
+
+    def get(self, delivery_id):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM webhooks WHERE id = ?", (delivery_id,)).fetchone()
+        return self._public(row, with_payload=True) if row else None
+
+    def list(self, status=None, queue_id=None, limit=100):
+        where, args = [], []
+        if status:
+            where.append("status = ?")
+            args.append(status)
+        if queue_id is not None:
+            where.append("queue_id = ?")
+            args.append(queue_id)
+        sql = f"SELECT {', '.join(COLUMNS)} FROM webhooks"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(sql, (*args, int(limit))).fetchall()
+        return [self._public(r) for r in rows]
+
+    def counts(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM webhooks GROUP BY status"))
+
+    def retry(self, delivery_id):
+        """Recoloca uma entrega failed/rejected na fila (tentativas zeradas). False se não existe
+        ou ainda não terminou."""
+        now = time.time()
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "UPDATE webhooks SET status = 'pending', attempts = 0, next_ts = ?, updated_ts = ?"
+                " WHERE id = ? AND status IN ('failed', 'rejected')", (now, now, delivery_id))
+        self._wake.set()
+        return cur.rowcount > 0
+
+    def prune(self, max_age_s):
+        """Apaga entregas terminadas há mais de max_age_s. Retorna quantas."""
+        cutoff = time.time() - max_age_s
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                "DELETE FROM webhooks WHERE status IN ('delivered', 'rejected', 'failed')"
+                " AND updated_ts < ?", (cutoff,))
+        return cur.rowcount
+
+    @staticmethod
+    def _public(row, with_payload=False):
+        d = dict(zip(COLUMNS, row))
+        payload = d.pop("payload")
+        if with_payload:
+            d["payload"] = json.loads(payload)
+        return d
+
+    # ---- worker ----
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._pool = ThreadPoolExecutor(max_workers=max(1, self.per_endpoint * 4),
+                                        thread_name_prefix="webhook-send")
+        self._thread = threading.Thread(target=self._run, name="webhook-outbox", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                wait = self._dispatch_due()
+            except Exception as e:
+                print(f"[webhook] erro no worker de entrega: {e}")
+                wait = 5.0
+            self._wake.wait(wait)
+
+    def _dispatch_due(self):
+        """Manda as entregas vencidas que cabem no limite por destino; retorna quanto
+        esperar até a próxima vencer. Lê no máximo per_endpoint por destino: mais que
+        isso não sairia agora de qualquer jeito."""
+        now = time.time()
+        with self._lock:
+            due = self._conn.execute(
+                "SELECT id, url FROM ("
+                " SELECT id, url, next_ts, ROW_NUMBER() OVER"
+                " (PARTITION BY endpoint ORDER BY next_ts, id) AS n"
+                " FROM webhooks WHERE status = 'pending' AND next_ts <= ?)"
+                " WHERE n <= ? ORDER BY next_ts, id", (now, self.per_endpoint)).fetchall()
+            nxt = self._conn.execute(
+                "SELECT MIN(next_ts) FROM webhooks WHERE status = 'pending' AND next_ts > ?",
+                (now,)).fetchone()[0]
+        for delivery_id, url in due:
+            endpoint = _endpoint(url)
+            with self._conns_lock:
+                if self._inflight.get(endpoint, 0) >= self.per_endpoint:
+                    continue   # sai quando um envio desse destino terminar (_wake)
+                self._inflight[endpoint] = self._inflight.get(endpoint, 0) + 1
+            with self._lock, self._conn:
+                self._conn.execute("UPDATE webhooks SET status = 'sending', updated_ts = ? WHERE id = ?",
+                                   (now, delivery_id))
+            self._pool.submit(self._deliver, delivery_id, endpoint)
+        return min(5.0, max(0.05, nxt - now)) if nxt else 5.0
+
+    def _connection(self, endpoint, fresh=False):
+        """(conexão, reaproveitada?) para o destino."""
+        if not fresh:
+            with self._conns_lock:
+                idle = self._idle_conns.get(endpoint)
+                if idle:
+                    return idle.pop(), True
+        scheme, host, port = endpoint
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(host, port, timeout=self.timeout), False
+
+    def _post(self, endpoint, url, body, delivery_id):
+        """(status HTTP, erro). Reaproveita a conexão do destino quando possível."""
+        u = urllib.parse.urlsplit(url)
+        path = (u.path or "/") + (f"?{u.query}" if u.query else "")
+        headers = {"Content-Type": "application/json", "X-SkyReels-Delivery": str(delivery_id)}
+        fresh = False
+        while True:
+            conn, reused = self._connection(endpoint, fresh)
+            try:
+                conn.request("POST", path, body=body, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+                conn.close()
+                if reused:
+                    fresh = True   # keep-alive fechada pelo servidor: de novo numa conexão nova
+                    continue
+                return None, str(e)
+            except Exception as e:
+                conn.close()
+                return None, str(e)
+            if resp.will_close:
+                conn.close()
+            else:
+                with self._conns_lock:
+                    self._idle_conns.setdefault(endpoint, []).append(conn)
+            return resp.status, None
+
+    def _deliver(self, delivery_id, endpoint):
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT url, payload, attempts FROM webhooks WHERE id = ?", (delivery_id,)).fetchone()
+            if row is None:
+                return
+            url, body, attempts = row
+            attempts += 1
+            code, error = self._post(endpoint, url, body.encode("utf-8"), delivery_id)
+            if code is not None and 200 <= code < 300:
+                status, outcome = "delivered", "delivered"
+                print(f"[webhook] ok → {url} (entrega {delivery_id}, tentativa {attempts}, {code})")
+            elif code is not None and 400 <= code < 500 and code not in RETRYABLE_4XX:
+                status, outcome = "rejected", "rejected"
+                print(f"[webhook] {code} (sem retry) → {url} (entrega {delivery_id})")
+            elif attempts >= self.max_attempts:
+                status, outcome = "failed", "failed"
+                print(f"[webhook] DESISTIU após {attempts} tentativas → {url} (entrega {delivery_id})")
+            else:
+                status, outcome = "pending", "retry"
+                print(f"[webhook] {code or error} (retry {attempts}) → {url} (entrega {delivery_id})")
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+            now = time.time()
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "UPDATE webhooks SET status = ?, attempts = ?, next_ts = ?, updated_ts = ?,"
+                    " last_code = ?, last_error = ? WHERE id = ?",
+                    (status, attempts, now + delay, now, code, error, delivery_id))
+            self.on_outcome(outcome)
+        finally:
+            with self._conns_lock:
+                self._inflight[endpoint] -= 1
+            self._wake.set()
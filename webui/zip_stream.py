@@ -0,0 +1,63 @@
+"""
+ZIP em streaming: gera o arquivo em pedaços enquanto lê os arquivos de origem.
+
+O zipfile escreve num destino sem seek (_ChunkSink), então usa data descriptors
+(tamanho/CRC depois dos dados) e não precisa voltar no arquivo; cada entrada é
+aberta com force_zip64 para vídeos/episódios acima de 4 GB. A memória usada é a
+de um bloco (CHUNK_SIZE), independente do tamanho do episódio.
+"""
+import zipfile
+from pathlib import Path
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class _ChunkSink:
+    """Destino write-only do ZipFile: acumula bytes até o gerador recolhê-los."""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        # O zipfile usa tell() para os offsets do diretório central
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(entries, compression=zipfile.ZIP_STORED):
+    """Gera os bytes de um ZIP com os arquivos de `entries` [(arcname, caminho), ...]."""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=compression) as zf:
+        for arcname, path in entries:
+            path = Path(path)
+            info = zipfile.ZipInfo.from_file(str(path), arcname)
+            info.compress_type = compression
+            with open(path, "rb") as src, zf.open(info, "w", force_zip64=True) as dst:
+                while True:
+                    block = src.read(CHUNK_SIZE)
+                    if not block:
+                        break
+                    dst.write(block)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            data = sink.drain()
+            if data:
+                yield data
+    # diretório central (escrito no close do ZipFile)
+    data = sink.drain()
+    if data:
+        yield data